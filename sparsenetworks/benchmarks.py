@@ -0,0 +1,288 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package benchmarks
+
+Benchmarks of simulation and analysis, with fixed seeds, for tracking performance across versions on one machine.
+
+- construction: time and peak memory of creating a system.System, against N and K.
+- events: event and spike throughput of System.run, against N, N_ext and the external rates.
+- output: write throughput of system.WithOutput.run.
+- analysis: time of output_analyzer.Analyzer.compute_CV and compute_rates, against the number of spikes.
+
+Each case runs in a fresh process (so its peak memory is its own) and is timed as the best of several repetitions.
+The results are written as json: a list of records {'benchmark','case','metrics'} together with information on the machine and versions; compare matches the records of two result files by benchmark and case and reports the cases that became slower than a tolerance allows.
+
+Command line usage (see main):
+    python -m sparsenetworks.benchmarks results.json --baseline baseline.json --quick
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from timeit import default_timer as clock
+import numpy as np
+
+try:
+    import resource
+except ImportError: # (not available on windows)
+    resource=None
+
+from .system import System,WithOutput
+from .output_analyzer import Analyzer
+from . import spike_events
+
+
+## Version of the format of the result files.
+RESULTS_VERSION=1
+
+## Parameters of the benchmarked network (two inhibitory populations with external input, as in sn_example_simulation.py), scaled by the cases.
+NETWORK={'J_int':[[-0.6,-0.3],[-0.3,-0.6]],'I':[4,4],'gamma':[1,1],'J_ext':[[0.2],[0.2]],'tau':0.05}
+
+## Cases of each benchmark: full size and quick (for a fast check).
+CASES={'construction':{'full':[{'N':N,'K':K} for N in (1000,4000,16000) for K in (25,100,400)],
+                       'quick':[{'N':N,'K':K} for N in (1000,4000) for K in (25,100)]},
+       'events':{'full':[{'N':N,'N_ext':N_ext,'rate':rate,'t_end':2.} for N in (1000,4000,16000) for N_ext,rate in ((N,0.1),(N,1.),(4*N,0.1))]+
+                         [{'N':N,'N_ext':N,'rate':1.,'t_end':2.,'dtype':'float32'} for N in (4000,16000)],
+                 'quick':[{'N':N,'N_ext':N_ext,'rate':rate,'t_end':1.} for N in (1000,4000) for N_ext,rate in ((N,0.1),(N,1.))]+
+                         [{'N':4000,'N_ext':4000,'rate':1.,'t_end':1.,'dtype':'float32'}]},
+       'output':{'full':[{'N':N,'t_end':2.} for N in (1000,4000)],
+                 'quick':[{'N':1000,'t_end':1.}]},
+       'analysis':{'full':[{'N':N,'spikes':spikes} for N in (1000,10000) for spikes in (10**5,10**6,10**7)],
+                   'quick':[{'N':1000,'spikes':spikes} for spikes in (10**5,10**6)]}}
+
+
+def network(N,K=25,N_ext=None,rate=0.1,seed=0,dtype='float64'):
+    """
+    @return Keyword arguments of system.System for the benchmarked network with N neurons (two equal populations), K connections per population and N_ext external neurons (default N) of the given rate, simulated in dtype.
+    """
+    if N_ext is None:
+        N_ext=N
+    return {'N':[N//2,N-N//2],'J_int':np.array(NETWORK['J_int']),'I':NETWORK['I'],'gamma':NETWORK['gamma'],'K':K,'tau':NETWORK['tau'],
+            'N_ext':[N_ext],'J_ext':np.array(NETWORK['J_ext']),'rates':[rate],'seed':seed,'dtype':dtype}
+
+
+def best_time(function,repeat):
+    """
+    @return Tuple (smallest wall time of repeat calls of function,result of the last call).
+    """
+    times=[]
+    result=None
+    for i in range(repeat):
+        result=None # (the result of the previous call is freed first, so it does not add to the peak memory)
+        start=clock()
+        result=function()
+        times.append(clock()-start)
+    return min(times),result
+
+
+def peak_memory():
+    """
+    @return Peak resident memory of this process in bytes (None where the resource module is missing).
+    """
+    if resource is None:
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform=='darwin' else peak*1024 # (kilobytes on linux)
+
+
+def bench_construction(case,repeat):
+    kwargs=network(case['N'],case['K'])
+    seconds,system=best_time(lambda: System(**kwargs),repeat)
+    return {'construction_s':seconds,'synapses':int(system.weight_matrix.nnz),'peak_memory_bytes':peak_memory()}
+
+
+def bench_events(case,repeat):
+    kwargs=network(case['N'],N_ext=case['N_ext'],rate=case['rate'],dtype=case.get('dtype','float64'))
+    def run():
+        system=System(**kwargs)
+        n_events=0
+        n_spikes=0
+        start=clock()
+        while system.t<case['t_end']:
+            system.jump_to_next_event()
+            n_events+=1
+            if system.spike_event is not None:
+                n_spikes+=len(system.spike_event[1])
+        return clock()-start,n_events,n_spikes
+    results=[run() for i in range(repeat)]
+    seconds,n_events,n_spikes=min(results)
+    return {'run_s':seconds,'events':n_events,'spikes':n_spikes,'events_per_s':n_events/seconds,'spikes_per_s':n_spikes/seconds,'peak_memory_bytes':peak_memory()}
+
+
+def bench_output(case,repeat):
+    kwargs=network(case['N'])
+    results=[]
+    for i in range(repeat):
+        folder=tempfile.mkdtemp(prefix='sn_benchmark_')
+        try:
+            system=WithOutput(**kwargs)
+            start=clock()
+            system.run(case['t_end'],folder)
+            seconds=clock()-start
+            n_bytes=sum(os.path.getsize(os.path.join(folder,name)) for name in os.listdir(folder))
+            results.append((seconds,n_bytes))
+        finally:
+            shutil.rmtree(folder,True)
+    seconds,n_bytes=min(results)
+    return {'run_s':seconds,'bytes':n_bytes,'bytes_per_s':n_bytes/seconds,'peak_memory_bytes':peak_memory()}
+
+
+def bench_analysis(case,repeat):
+    import pickle
+
+    folder=tempfile.mkdtemp(prefix='sn_benchmark_')
+    try:
+        # poissonian spikes of equal rate for all neurons, in chunks of 10**6
+        rng=np.random.RandomState(0)
+        N=case['N']
+        t_end=case['spikes']/(N*10.)
+        with open(os.path.join(folder,'parameters.pickle'),'wb') as f:
+            pickle.dump({'N':np.array([N//2,N-N//2])},f)
+        n_chunks=int(np.ceil(case['spikes']/1e6))
+        for n in range(n_chunks):
+            n_spikes=min(10**6,case['spikes']-n*10**6)
+            times=np.sort(rng.uniform(n*t_end/n_chunks,(n+1)*t_end/n_chunks,n_spikes))
+            spike_events.save_chunk(folder,n,times,rng.randint(0,N,n_spikes).astype(spike_events.id_dtype(N)))
+
+        analyzer=Analyzer(folder)
+        read_s,result=best_time(analyzer.read_spikes,repeat)
+        cv_s,result=best_time(analyzer.compute_CV,repeat)
+        rates_s,result=best_time(lambda: analyzer.compute_rates(t_end/1000.),repeat)
+        return {'read_spikes_s':read_s,'compute_CV_s':cv_s,'compute_rates_s':rates_s,'peak_memory_bytes':peak_memory()}
+    finally:
+        shutil.rmtree(folder,True)
+
+
+## Functions of the benchmarks, called with a case and the number of repetitions; they return a dictionary of metrics.
+BENCHMARKS={'construction':bench_construction,'events':bench_events,'output':bench_output,'analysis':bench_analysis}
+
+
+def _run_case(task):
+    name,case,repeat=task
+    stdout=sys.stdout
+    sys.stdout=open(os.devnull,'w') # (progress bars and warnings)
+    try:
+        return BENCHMARKS[name](case,repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout=stdout
+
+
+def run_benchmarks(names=None,quick=False,repeat=3,log=None):
+    """
+    Runs benchmarks, each case in a fresh process.
+    @param names List of names of benchmarks (keys of BENCHMARKS); None runs all.
+    @param quick If True, the quick (smaller) cases are run.
+    @param repeat Number of repetitions of each case (the best is reported).
+    @param log If not None, file to which one line per finished case is written.
+    @return Dictionary with the entries 'version', 'machine' (see machine) and 'results' (list of records {'benchmark','case','metrics'}).
+    """
+    if names is None:
+        names=sorted(BENCHMARKS)
+    results=[]
+    for name in names:
+        for case in CASES[name]['quick' if quick else 'full']:
+            pool=multiprocessing.Pool(1)
+            try:
+                metrics=pool.apply(_run_case,((name,case,repeat),))
+            finally:
+                pool.terminate()
+            results.append({'benchmark':name,'case':case,'metrics':metrics})
+            if log is not None:
+                log.write('%s %s %s\n' % (name,json.dumps(case,sort_keys=True),json.dumps(metrics,sort_keys=True)))
+                log.flush()
+    return {'version':RESULTS_VERSION,'machine':machine(),'quick':quick,'repeat':repeat,'results':results}
+
+
+def machine():
+    """
+    @return Dictionary describing the machine and the versions of python and numpy/scipy (results are only comparable on the same machine).
+    """
+    import scipy
+    return {'platform':platform.platform(),'processor':platform.processor(),'python':platform.python_version(),
+            'numpy':np.__version__,'scipy':scipy.__version__,'date':time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def write_results(results,filename):
+    """
+    Writes results of run_benchmarks to a json file.
+    """
+    with open(filename,'w') as f:
+        json.dump(results,f,indent=1,sort_keys=True)
+
+
+def read_results(filename):
+    """
+    @return Results written by write_results.
+    """
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(results,baseline,tolerance=0.2):
+    """
+    Compares the metrics of results with those of the same benchmark and case in baseline.
+
+    Metrics ending in '_s' are times (lower is better), metrics ending in '_per_s' are throughputs (higher is better), 'peak_memory_bytes' is lower-is-better; other metrics (counts) are not compared.
+    @param tolerance Relative change tolerated before a metric counts as a regression.
+    @return List of records {'benchmark','case','metric','baseline','value','ratio','regression'}; ratio is value/baseline for lower-is-better metrics and baseline/value for throughputs, so ratios above 1 are slowdowns.
+    """
+    def key(record):
+        return (record['benchmark'],json.dumps(record['case'],sort_keys=True))
+    reference=dict((key(record),record['metrics']) for record in baseline['results'])
+    comparison=[]
+    for record in results['results']:
+        if key(record) not in reference:
+            continue
+        old=reference[key(record)]
+        for metric,value in sorted(record['metrics'].items()):
+            base=old.get(metric)
+            if value is None or base is None or not (metric.endswith('_s') or metric=='peak_memory_bytes'):
+                continue
+            if metric.endswith('_per_s'):
+                ratio=base/float(value) if value>0 else np.inf
+            else:
+                ratio=value/float(base) if base>0 else np.inf
+            comparison.append({'benchmark':record['benchmark'],'case':record['case'],'metric':metric,
+                               'baseline':base,'value':value,'ratio':ratio,'regression':ratio>1+tolerance})
+    return comparison
+
+
+def main(argv=None):
+    """
+    Command line entry point, see the description of this module.
+    @return 1 if a regression against the baseline was found, 0 otherwise.
+    """
+    import argparse
+
+    parser=argparse.ArgumentParser(description='Run the sparsenetworks benchmarks and compare them with a baseline.')
+    parser.add_argument('output',help='json file for the results')
+    parser.add_argument('--baseline',default=None,help='json file with results of an earlier version to compare with')
+    parser.add_argument('--benchmarks',nargs='+',default=None,choices=sorted(BENCHMARKS),help='benchmarks to run (default: all)')
+    parser.add_argument('--quick',action='store_true',help='run the smaller cases only')
+    parser.add_argument('--repeat',type=int,default=3,help='repetitions of each case (the best is reported)')
+    parser.add_argument('--tolerance',type=float,default=0.2,help='relative slowdown tolerated before a case counts as a regression')
+    args=parser.parse_args(argv)
+
+    results=run_benchmarks(args.benchmarks,args.quick,args.repeat,log=sys.stdout)
+    write_results(results,args.output)
+
+    if args.baseline is None:
+        return 0
+    comparison=compare(results,read_results(args.baseline),args.tolerance)
+    for entry in comparison:
+        print('%-12s %-45s %-18s %12.4g %12.4g %6.2f%s' % (entry['benchmark'],json.dumps(entry['case'],sort_keys=True),entry['metric'],
+                                                        entry['baseline'],entry['value'],entry['ratio'],'  REGRESSION' if entry['regression'] else ''))
+    regressions=[entry for entry in comparison if entry['regression']]
+    print('%d of %d metrics regressed by more than %d%%' % (len(regressions),len(comparison),int(args.tolerance*100)))
+    return 1 if regressions else 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
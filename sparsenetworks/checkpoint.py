@@ -0,0 +1,148 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package checkpoint
+
+Checkpoints of the runs of system.WithOutput (see the parameter checkpoint_interval of WithOutput.run and WithOutput.resume).
+
+A checkpoint holds the complete dynamic state of a System: time, phases, scheduled events (including the internal spikes in flight and the next external spikes), the state of the random number generator and its buffered random numbers, the accumulated spike statistics and PSTH, and the position in the output (number of chunks, last recorded spike).
+It is written to checkpoint.pickle in the output folder via a temporary file, so an interrupted run always leaves a complete checkpoint.
+The connectivity does not change during a simulation, so it is written once to connectivity.npz; checkpoints refer to it by file name and md5 digest.
+
+Checkpoints are taken right after a chunk was written, so a run resumed from a checkpoint writes the same chunks as the uninterrupted run.
+"""
+
+import hashlib
+import os
+import pickle
+import numpy as np
+from scipy.sparse import csc_matrix,hstack
+
+from .engines import ENGINES
+from .random_streams import rng_state,set_rng_state
+
+
+## Version of the checkpoint format.
+CHECKPOINT_VERSION=1
+
+## Name of the checkpoint file in an output folder.
+CHECKPOINT_FILE='checkpoint.pickle'
+
+## Name of the connectivity file in an output folder.
+CONNECTIVITY_FILE='connectivity.npz'
+
+
+def system_state(system):
+    """
+    @param system System (with a scheduler providing get_state, like scheduler.HeapScheduler).
+    @return Dictionary of the dynamic state of system (without connectivity), see restore_system_state.
+    """
+    engines=[name for name,engine in ENGINES.items() if type(system.engine) is engine]
+    return {'t':system.t,'engine':engines[0],'phases':system.engine.get_state(),
+            'scheduler':type(system.scheduler),'events':system.scheduler.get_state(),
+            'backend':system.backend,'rng':rng_state(system.rng),'isi_buffer':system.isi_buffer.get_state(),
+            'spike_statistics':system.spike_statistics,'psth':system.psth}
+
+
+def restore_system_state(system,state):
+    """
+    Sets the dynamic state of system (created with the same parameters, engine and scheduler) to a state returned by system_state.
+    """
+    system.t=state['t']
+    system.engine.set_state(state['phases'])
+    system.scheduler.set_state(state['events'])
+    set_rng_state(system.rng,state['rng'])
+    system.isi_buffer.set_state(state['isi_buffer'])
+    for name in ('spike_statistics','psth'):
+        if getattr(system,name) is not None:
+            system.remove_hook(getattr(system,name))
+        setattr(system,name,state[name])
+        if state[name] is not None:
+            system.add_hook(state[name])
+
+
+def connectivity_digest(system):
+    """
+    @return md5 digest (hex string) of the delays and the connections of system (see System.weight_columns).
+    """
+    md5=hashlib.md5()
+    W=system.weight_columns
+    for array in (np.array(W.shape),W.indptr,W.indices,W.data,np.asarray(system.delays,dtype=float)):
+        md5.update(np.ascontiguousarray(array).tobytes())
+    return md5.hexdigest()
+
+
+def save_connectivity(folder,system,digest):
+    """
+    Writes the connectivity of system to folder/CONNECTIVITY_FILE, unless the file already holds the connectivity with this digest.
+    @param digest connectivity_digest(system).
+    @return Reference {'file':CONNECTIVITY_FILE,'md5':digest} stored in the checkpoints.
+    """
+    filename=os.path.join(folder,CONNECTIVITY_FILE)
+    if _stored_digest(filename)!=digest:
+        W=system.weight_columns
+        # (np.savez appends .npz to other names)
+        tmp_filename=os.path.join(folder,'connectivity.tmp.npz')
+        np.savez(tmp_filename,md5=digest,shape=np.array(W.shape),indptr=W.indptr,indices=W.indices,data=W.data,delays=np.asarray(system.delays,dtype=float))
+        _replace(tmp_filename,filename)
+    return {'file':CONNECTIVITY_FILE,'md5':digest}
+
+
+def load_connectivity(folder,system,reference):
+    """
+    Replaces the connectivity of system (weight_columns, weight_matrix and delays) by the one referenced by a checkpoint.
+    @param reference {'file':...,'md5':...} as returned by save_connectivity.
+    """
+    filename=os.path.join(folder,reference['file'])
+    if _stored_digest(filename)!=reference['md5']:
+        raise ValueError('%s does not hold the connectivity of the checkpoint' % filename)
+    with np.load(filename) as content:
+        system.weight_columns=csc_matrix((content['data'],content['indices'],content['indptr']),shape=tuple(content['shape']))
+        system.delays=content['delays']
+    if connectivity_digest(system)!=reference['md5']:
+        raise ValueError('%s is corrupted' % filename)
+    # the internal columns of all delay buckets add up to the internal part of weight_matrix
+    n=system.layout.offsets[-1]
+    W=system.weight_columns
+    W_int=W[:,:n]
+    for b in range(1,len(system.delays)):
+        W_int=W_int+W[:,b*n:(b+1)*n]
+    system.weight_matrix=hstack([W_int,W[:,len(system.delays)*n:]],format='csr')
+
+
+def write_checkpoint(folder,checkpoint):
+    """
+    Writes the dictionary checkpoint to folder/CHECKPOINT_FILE (via a temporary file, so the previous checkpoint stays intact until the new one is complete).
+    """
+    filename=os.path.join(folder,CHECKPOINT_FILE)
+    checkpoint=dict(checkpoint,version=CHECKPOINT_VERSION)
+    with open(filename+'.tmp','wb') as f:
+        pickle.dump(checkpoint,f,protocol=2)
+    _replace(filename+'.tmp',filename)
+
+
+def read_checkpoint(folder):
+    """
+    @return Dictionary written by write_checkpoint to folder, or None if folder has no checkpoint.
+    """
+    filename=os.path.join(folder,CHECKPOINT_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename,'rb') as f:
+        checkpoint=pickle.load(f)
+    if checkpoint['version']>CHECKPOINT_VERSION:
+        raise ValueError('%s has version %d, only versions up to %d are supported' % (filename,checkpoint['version'],CHECKPOINT_VERSION))
+    return checkpoint
+
+
+def _stored_digest(filename):
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as content:
+        return str(content['md5'])
+
+
+def _replace(source,destination):
+    if os.path.exists(destination) and os.name=='nt': # (os.rename does not replace files on windows)
+        os.remove(destination)
+    os.rename(source,destination)
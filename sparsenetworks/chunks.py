@@ -0,0 +1,181 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package chunks
+
+Lazy access to output written in chunks (phases<n>.npy, spike_times<n>.npy, ...), see output_analyzer.Analyzer.
+
+The chunk files are opened memory-mapped, so nothing is read from disk until rows are selected, and only the selected rows (and columns) are copied into memory.
+This allows to analyze runs whose output is larger than the memory.
+With the numbers of rows and last times of the chunks from the manifest of the output (see manifest), files are opened only when rows of them are accessed, so a time window opens only the chunks overlapping it.
+Chunks stored otherwise (e.g. compressed in a container, see container) are read by a reader function, which only needs to read the selected columns.
+"""
+
+import numpy as np
+
+
+class ChunkedArray(object):
+    """
+    Read-only view of the concatenation (along the first axis) of the arrays in a list of .npy files.
+
+    Rows are selected with view[start:stop] or view[start:stop,columns] (slices without step, integers or lists of columns); the result is a numpy array.
+    If the first column (or the only column, for one-dimensional chunks) holds times in ascending order, row ranges can be found by time with find_time.
+    """
+
+    def __init__(self,filenames,mmap=True,lengths=None,last_times=None,row_shape=None,dtype=None,reader=None):
+        """
+        @param filenames List of .npy files in chunk order.
+        @param mmap If True, the files are opened memory-mapped; otherwise they are read completely.
+        @param lengths If not None, list of the numbers of rows of the chunks (e.g. from a manifest.Manifest); the files are then opened only when their rows are accessed.
+        @param last_times If not None, list of the last time of each chunk (ascending), used by find_chunk instead of opening the files.
+        @param row_shape,dtype Shape of a row and dtype of the chunks, if lengths is given (otherwise read from the first chunk).
+        @param reader If not None, function reader(k,columns) returning all rows of chunk k with the selected columns (None: all, or an integer, slice or list), used instead of the files; lengths, row_shape and dtype are needed then and filenames only name the chunks.
+        """
+        self.filenames=list(filenames)
+        self.mmap=mmap
+        self.reader=reader
+        ## the arrays of the chunks (numpy.memmap, if mmap is True), None for chunks not opened yet
+        self.chunks=[None]*len(self.filenames)
+        if lengths is None:
+            for k in range(len(self.chunks)):
+                self.chunk(k)
+            lengths=[len(chunk) for chunk in self.chunks]
+        ## offsets[k] is the index of the first row of chunk k, offsets[-1] the total number of rows
+        self.offsets=np.concatenate([[0],np.cumsum(lengths)]).astype(int)
+        self.last_times=last_times
+
+        if self.chunks and (row_shape is None or dtype is None):
+            row_shape,dtype=self.chunk(0).shape[1:],self.chunk(0).dtype
+        if self.chunks:
+            self.shape=(int(self.offsets[-1]),)+tuple(row_shape)
+            self.dtype=np.dtype(dtype)
+        else:
+            self.shape=(0,)
+            self.dtype=np.dtype(float)
+
+
+    def chunk(self,k):
+        """
+        @return Array of chunk k, opened on first access.
+        """
+        if self.chunks[k] is None:
+            self.chunks[k]=np.load(self.filenames[k],mmap_mode='r' if self.mmap else None)
+        return self.chunks[k]
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def __getitem__(self,key):
+        if isinstance(key,tuple):
+            rows,columns=key
+        else:
+            rows,columns=key,None
+        if isinstance(rows,(int,np.integer)):
+            if rows<0:
+                rows+=len(self)
+            return self.rows(rows,rows+1,columns)[0]
+        if not isinstance(rows,slice) or rows.step not in (None,1):
+            raise IndexError('ChunkedArray supports row slices without step and single rows only')
+        start,stop,step=rows.indices(len(self))
+        return self.rows(start,max(stop,start),columns)
+
+
+    def rows(self,start=0,stop=None,columns=None):
+        """
+        Copies a range of rows into memory.
+        @param start Index of the first row.
+        @param stop Index after the last row (None: all rows until the end).
+        @param columns If not None, integer, slice or list of the columns to select.
+        @return Array of the selected rows (and columns).
+        """
+        if stop is None:
+            stop=len(self)
+        stop=max(stop,start)
+
+        first=max(np.searchsorted(self.offsets,start,side='right')-1,0)
+        parts=[]
+        k=first
+        while k<len(self.chunks) and self.offsets[k]<stop:
+            parts.append(self.part(k,max(start-self.offsets[k],0),stop-self.offsets[k],columns))
+            k+=1
+
+        if not parts:
+            empty=np.zeros((0,)+self.shape[1:],dtype=self.dtype)
+            return empty if columns is None else empty[:,columns]
+        # one allocation for the result, instead of repeated concatenation
+        result=np.empty((sum(len(part) for part in parts),)+parts[0].shape[1:],dtype=self.dtype)
+        position=0
+        for part in parts:
+            result[position:position+len(part)]=part
+            position+=len(part)
+        return result
+
+
+    def part(self,k,start,stop,columns=None):
+        """
+        @return Array of the rows start:stop of chunk k (with the selected columns, if columns is not None).
+        """
+        if self.reader is not None:
+            return self.reader(k,columns)[start:stop]
+        part=self.chunk(k)[start:stop]
+        return part if columns is None else part[:,columns]
+
+
+    def nbytes(self,start=0,stop=None,n_columns=None):
+        """
+        @return Number of bytes of the rows start:stop (with n_columns columns, if not None) in memory.
+        """
+        if stop is None:
+            stop=len(self)
+        row_size=int(np.prod(self.shape[1:])) if n_columns is None else n_columns
+        return max(stop-start,0)*row_size*self.dtype.itemsize
+
+
+    def find_time(self,t,side='left'):
+        """
+        Finds a row by time with binary search, reading only O(log(number of rows)) entries.
+        @param t Time.
+        @param side 'left': index of the first row with time >= t; 'right': index of the first row with time > t.
+        @return Row index (len(self) if there is none).
+        """
+        k=self.find_chunk(t,side)
+        if k==len(self.chunks):
+            return len(self)
+        return self.offsets[k]+_bisect(self._times(k),t,side)
+
+
+    def find_chunk(self,t,side='left'):
+        """
+        @return Index of the first chunk containing a row with time >= t (side 'left') or > t (side 'right'); len(self.chunks) if there is none.
+        """
+        if self.last_times is not None:
+            return _bisect(self.last_times,t,side)
+        last_times=[]
+        for k in range(len(self.chunks)):
+            # (an empty chunk takes the last time of the chunk before it, so last_times stays ascending)
+            last_times.append(self._times(k)[-1] if self.offsets[k+1]>self.offsets[k] else (last_times[-1] if last_times else -np.inf))
+        return _bisect(last_times,t,side)
+
+
+    def _times(self,k):
+        if self.reader is not None:
+            return self.reader(k,0 if len(self.shape)>1 else None)
+        chunk=self.chunk(k)
+        return chunk if chunk.ndim==1 else chunk[:,0]
+
+
+def _bisect(times,t,side='left'):
+    """
+    Binary search in an ascending sequence that is accessed element by element (so a memory-mapped column is not read completely).
+    @return Index of the first element >= t (side 'left') or > t (side 'right').
+    """
+    low,high=0,len(times)
+    while low<high:
+        middle=(low+high)//2
+        if times[middle]<t or (side=='right' and times[middle]==t):
+            low=middle+1
+        else:
+            high=middle
+    return low
@@ -0,0 +1,192 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package connectivity
+
+Construction of sparse random connectivity in O(number of connections).
+
+The weight matrices are assembled directly as CSR arrays from sampled presynaptic indices; no dense random matrix of size (postsynaptic neurons x presynaptic neurons) is created at any point.
+"""
+
+import numpy as np
+from scipy.sparse import csc_matrix,csr_matrix
+
+
+def bernoulli_block(n_rows,n_cols,p,rng=np.random):
+    """
+    Samples a random block in which each of the n_rows*n_cols possible connections exists independently with probability p.
+
+    Instead of drawing one random number per possible connection, the gaps between consecutive connections (in row-major order) are drawn from a geometric distribution.
+    @param n_rows Number of postsynaptic neurons.
+    @param n_cols Number of presynaptic neurons.
+    @param p Connection probability.
+    @param rng Random number generator (numpy.random, a RandomState or a Generator).
+    @return Tuple (rows,cols) of index arrays of the existing connections, sorted by row and column.
+    """
+    n_total=int(n_rows)*int(n_cols)
+    if p<=0 or n_total==0:
+        positions=np.zeros(0,dtype=np.int64)
+    elif p>=1:
+        positions=np.arange(n_total,dtype=np.int64)
+    else:
+        # expected number of connections plus a margin of several standard deviations
+        n_draw=int(n_total*p+6*np.sqrt(n_total*p*(1-p))+10)
+        positions=np.cumsum(rng.geometric(p,size=n_draw).astype(np.int64))-1
+        while positions[-1]<n_total:
+            more=np.cumsum(rng.geometric(p,size=n_draw).astype(np.int64))+positions[-1]
+            positions=np.concatenate([positions,more])
+        positions=positions[:np.searchsorted(positions,n_total)]
+
+    return positions//n_cols,positions%n_cols
+
+
+def fixed_in_degree_block(n_rows,n_cols,k,rng=np.random):
+    """
+    Samples a random block in which every row has exactly k connections to distinct, randomly chosen columns.
+    @param n_rows Number of postsynaptic neurons.
+    @param n_cols Number of presynaptic neurons.
+    @param k Number of connections per postsynaptic neuron (in-degree); at most n_cols.
+    @param rng Random number generator (numpy.random, a RandomState or a Generator).
+    @return Tuple (rows,cols) of index arrays of the existing connections, sorted by row and column.
+    """
+    k=min(int(k),int(n_cols))
+    if k<=0 or n_rows==0:
+        return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+
+    if 2*k>n_cols:
+        # dense block: keep the k smallest of n_cols random numbers per row
+        cols=np.argsort(rng.uniform(size=(n_rows,n_cols)),axis=1)[:,:k]
+    else:
+        cols=(rng.uniform(size=(n_rows,k))*n_cols).astype(np.int64)
+        cols.sort(axis=1)
+        # redraw columns that were drawn more than once for the same row, until all are distinct
+        duplicate=np.zeros(cols.shape,dtype=bool)
+        duplicate[:,1:]=cols[:,1:]==cols[:,:-1]
+        while duplicate.any():
+            cols[duplicate]=(rng.uniform(size=duplicate.sum())*n_cols).astype(np.int64)
+            cols.sort(axis=1)
+            duplicate[:,1:]=cols[:,1:]==cols[:,:-1]
+
+    cols=np.sort(cols,axis=1)
+    rows=np.repeat(np.arange(n_rows,dtype=np.int64),k)
+    return rows,cols.ravel().astype(np.int64)
+
+
+def random_weight_matrix(N_post,N_pre,J,K,fixed_in_degree=False,rng=np.random):
+    """
+    Creates a sparse random weight matrix for connections from presynaptic to postsynaptic populations.
+
+    A neuron of postsynaptic population i is connected to any presynaptic neuron with probability p_i=K/N_post[i], so it receives on average p_i*N_pre[j] connections from presynaptic population j.
+    If fixed_in_degree is True, it receives exactly round(p_i*N_pre[j]) connections from population j instead (exactly K connections, if both populations have the same size).
+    Connections from population j to population i have weight J[i,j].
+    @param N_post Array of numbers of neurons in each postsynaptic population.
+    @param N_pre Array of numbers of neurons in each presynaptic population.
+    @param J Two-dimensional array of connection strengths, J[i,j] refers to connections from presynaptic population j to postsynaptic population i.
+    @param K Average number of connections one neuron receives from neurons from any other population.
+    @param fixed_in_degree If True, every neuron receives a fixed number of connections instead of a binomially distributed one.
+    @param rng Random number generator (numpy.random, a RandomState or a Generator).
+    @return Weight matrix (scipy.sparse.csr_matrix) of shape (N_post.sum(),N_pre.sum()).
+    """
+    N_post=np.asarray(N_post,dtype=np.int64)
+    N_pre=np.asarray(N_pre,dtype=np.int64)
+    offsets_post=np.concatenate([[0],np.cumsum(N_post)]).astype(np.int64)
+    offsets_pre=np.concatenate([[0],np.cumsum(N_pre)]).astype(np.int64)
+
+    if offsets_post[-1]==0 or offsets_pre[-1]==0:
+        return csr_matrix((offsets_post[-1],offsets_pre[-1]))
+    J=np.asarray(J,dtype=float).reshape(len(N_post),len(N_pre))
+
+    rows=[]
+    cols=[]
+    data=[]
+    for i in range(0,N_post.shape[0]):
+        p_i=min(float(K)/N_post[i],1.0)
+
+        if fixed_in_degree:
+            for j in range(0,N_pre.shape[0]):
+                r,c=fixed_in_degree_block(N_post[i],N_pre[j],int(round(p_i*N_pre[j])),rng)
+                rows.append(r+offsets_post[i])
+                cols.append(c+offsets_pre[j])
+                data.append(np.ones(len(r))*J[i,j])
+        else:
+            # all presynaptic populations are connected with the same probability, so they are sampled as one block
+            r,c=bernoulli_block(N_post[i],offsets_pre[-1],p_i,rng)
+            rows.append(r+offsets_post[i])
+            cols.append(c)
+            # presynaptic population of each connection
+            data.append(J[i,np.searchsorted(offsets_pre,c,side='right')-1])
+
+    rows=np.concatenate(rows)
+    cols=np.concatenate(cols)
+    data=np.concatenate(data)
+
+    # connections with strength 0 are not stored
+    nonzero=data!=0
+    rows,cols,data=rows[nonzero],cols[nonzero],data[nonzero]
+
+    # order by row, keeping the (sorted) column order within each row
+    order=np.argsort(rows,kind='mergesort')
+    indptr=np.concatenate([[0],np.cumsum(np.bincount(rows,minlength=offsets_post[-1]))])
+
+    index_dtype=np.int32 if max(offsets_pre[-1],len(data))<np.iinfo(np.int32).max else np.int64
+    return csr_matrix((data[order],cols[order].astype(index_dtype),indptr.astype(index_dtype)),shape=(offsets_post[-1],offsets_pre[-1]))
+
+
+def synaptic_delays(W,population,tau,delay_step=None,rng=np.random):
+    """
+    Draws the delay of each connection of a weight matrix.
+    @param W Weight matrix (scipy.sparse.csc_matrix) of connections among internal neurons.
+    @param population Array holding the population of each neuron.
+    @param tau Delay of all connections (number), two-dimensional array of delays (tau[i,j] refers to connections from population j to population i), or function tau(i,j,n,rng) returning an array of n delays for connections from population j to population i.
+    @param delay_step If not None, delays are rounded to multiples of delay_step.
+    @param rng Random number generator handed to tau, if it is a function.
+    @return Array with the delay of each stored entry of W (in the order of W.data).
+    """
+    post=population[W.indices]
+    pre=np.repeat(population,np.diff(W.indptr))
+
+    if callable(tau):
+        n_populations=population.max()+1 if len(population) else 0
+        pairs=post*n_populations+pre
+        delays=np.zeros(len(pairs))
+        order=np.argsort(pairs,kind='mergesort')
+        starts=np.searchsorted(pairs[order],np.arange(n_populations**2+1))
+        for pair in range(n_populations**2):
+            positions=order[starts[pair]:starts[pair+1]]
+            if len(positions):
+                delays[positions]=tau(pair//n_populations,pair%n_populations,len(positions),rng)
+    elif np.ndim(tau)==0:
+        delays=float(tau)*np.ones(W.nnz)
+    else:
+        delays=np.asarray(tau,dtype=float)[post,pre]
+
+    if delay_step is not None:
+        delays=np.round(delays/delay_step)*delay_step
+    if (delays<0).any():
+        raise ValueError('synaptic delays must not be negative')
+    return delays
+
+
+def delay_buckets(W,delays):
+    """
+    Splits a weight matrix into one sub-matrix per distinct delay.
+
+    Every connection is stored in exactly one sub-matrix, so the buckets together hold as many entries as W.
+    @param W Weight matrix (scipy.sparse.csc_matrix).
+    @param delays Array with the delay of each stored entry of W (in the order of W.data).
+    @return Tuple (bucket_delays,matrices): sorted array of the distinct delays and list of the corresponding sub-matrices (scipy.sparse.csc_matrix of the shape of W).
+    """
+    bucket_delays,bucket=np.unique(delays,return_inverse=True)
+    if len(bucket_delays)<=1:
+        return (bucket_delays if len(bucket_delays) else np.zeros(1)),[W]
+
+    columns=np.repeat(np.arange(W.shape[1]),np.diff(W.indptr))
+    # entries of each bucket, in the (column-major) order of W
+    order=np.argsort(bucket,kind='mergesort')
+    starts=np.searchsorted(bucket[order],np.arange(len(bucket_delays)+1))
+    matrices=[]
+    for b in range(len(bucket_delays)):
+        entries=order[starts[b]:starts[b+1]]
+        indptr=np.concatenate([[0],np.cumsum(np.bincount(columns[entries],minlength=W.shape[1]))])
+        matrices.append(csc_matrix((W.data[entries],W.indices[entries],indptr.astype(W.indptr.dtype)),shape=W.shape))
+    return bucket_delays,matrices
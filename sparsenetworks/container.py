@@ -0,0 +1,237 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package container
+
+Compressed single-file output of system.WithOutput (see the parameter store of WithOutput.run).
+
+Instead of separate .npy files, the parameters, the indices of the recorded neurons and the phases and spikes of all chunks are stored in one zip file, output.zip, in the output folder.
+Each array is a compressed member of its own (a .npy file), so any chunk, and any block of columns of it, can be read without decompressing the rest (see output_analyzer.Analyzer):
+- phase_times<n>.npy holds the times of the recorded rows of chunk n (float64), phases<n>_<b>.npy the phases of the b-th block of column_block recorded neurons, in the storage dtype (float32 halves the size; phases in [0,1] then have errors below 6e-8).
+- spike_times<n>.npy holds the spike times delta-encoded: the differences of consecutive times, taken of their float64 bit patterns as 64 bit integers, so decoding is exact; the small and often repeated differences compress much better than the times. spike_ids<n>.npy holds the spiking neurons.
+- chunk<n>.json describes chunk n as the manifest does (see manifest), together with its encoding.
+Spike statistics, PSTH, metrics and checkpoints stay separate files.
+
+A chunk is appended to the container when it is complete; members written again (by a run resumed from a checkpoint) replace the earlier ones.
+The directory of a zip file is at its end, so unlike the separate files an interruption while a chunk is being appended can leave a container that cannot be read.
+"""
+
+import io
+import json
+import os
+import re
+import warnings
+import zipfile
+import numpy as np
+
+from .manifest import Manifest
+
+
+## Name of the container file in an output folder.
+CONTAINER_FILE='output.zip'
+
+## Name pattern of the chunk descriptions in a container.
+CHUNK_PATTERN=re.compile(r'chunk(\d+)\.json$')
+
+
+class ContainerStore(object):
+    """
+    Storage settings of a container; writes the members of the container of an output folder.
+    """
+
+    def __init__(self,phase_dtype=np.float32,delta_times=True,column_block=256,compression=zipfile.ZIP_DEFLATED):
+        """
+        @param phase_dtype dtype in which the phases are stored (their times are always float64).
+        @param delta_times If True, spike times are stored delta-encoded (exactly), otherwise as float64.
+        @param column_block Number of recorded neurons per member of the phases; reading the phases of one neuron decompresses its block.
+        @param compression Compression of the members (zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED; zipfile.ZIP_BZIP2 and zipfile.ZIP_LZMA with python 3).
+        """
+        self.phase_dtype=np.dtype(phase_dtype).name
+        self.delta_times=delta_times
+        self.column_block=column_block
+        self.compression=compression
+
+
+    def write(self,folder,members):
+        """
+        Appends members to the container in folder (created if it does not exist).
+        @param members List of tuples (name,data) with data as bytes (or str).
+        """
+        with warnings.catch_warnings():
+            # (members of rewritten chunks have duplicate names, the last one is read)
+            warnings.simplefilter('ignore')
+            with zipfile.ZipFile(os.path.join(folder,CONTAINER_FILE),'a',self.compression,allowZip64=True) as container:
+                for name,data in members:
+                    container.writestr(name,data)
+
+
+    def write_array(self,folder,name,array):
+        """
+        Appends array as the member name (a .npy file).
+        """
+        self.write(folder,[(name,npy_bytes(array))])
+
+
+    def write_chunk(self,folder,n,times,phases,spike_times,spike_ids):
+        """
+        Appends chunk n to the container in folder.
+        @param times Array of the times of the recorded rows.
+        @param phases Array of the recorded phases (one row per time).
+        @param spike_times,spike_ids Arrays of the spikes in event-list format (see spike_events).
+        @return Description of the chunk (an entry of manifest.Manifest, with the encoding), also written to chunk<n>.json.
+        """
+        manifest=Manifest()
+        manifest.add_chunk(n,'phases%d' % n,times,phases.shape[1]+1,'spike_times%d.npy' % n,'spike_ids%d.npy' % n,spike_times,spike_ids)
+        chunk=manifest.chunks[0]
+        n_blocks=-(-phases.shape[1]//self.column_block)
+        chunk['phases'].update({'times_file':'phase_times%d.npy' % n,'storage_dtype':self.phase_dtype,'column_block':self.column_block,
+                                'blocks':['phases%d_%d.npy' % (n,b) for b in range(n_blocks)]})
+        chunk['spikes']['time_encoding']='delta' if self.delta_times else 'raw'
+
+        members=[(chunk['phases']['times_file'],npy_bytes(np.asarray(times,dtype=float)))]
+        for b,name in enumerate(chunk['phases']['blocks']):
+            members.append((name,npy_bytes(phases[:,b*self.column_block:(b+1)*self.column_block].astype(self.phase_dtype))))
+        members.append((chunk['spikes']['times_file'],npy_bytes(encode_times(spike_times) if self.delta_times else spike_times)))
+        members.append((chunk['spikes']['ids_file'],npy_bytes(spike_ids)))
+        members.append(('chunk%d.json' % n,json.dumps(chunk,sort_keys=True)))
+        self.write(folder,members)
+        return chunk
+
+
+class Container(object):
+    """
+    Read access to the container of an output folder.
+    """
+
+    def __init__(self,folder):
+        """
+        @param folder Output folder holding CONTAINER_FILE.
+        """
+        self.zip=zipfile.ZipFile(os.path.join(folder,CONTAINER_FILE),'r')
+        numbers=sorted(set(int(match.group(1)) for match in map(CHUNK_PATTERN.match,self.zip.namelist()) if match))
+        ## manifest.Manifest of the chunks (from their descriptions chunk<n>.json)
+        self.manifest=Manifest([json.loads(self.read('chunk%d.json' % n).decode('utf-8')) for n in numbers])
+
+
+    def has(self,name):
+        """
+        @return True if the container holds the member name.
+        """
+        return name in self.zip.NameToInfo
+
+
+    def read(self,name):
+        """
+        @return Decompressed member name (bytes).
+        """
+        return self.zip.read(name)
+
+
+    def load(self,name):
+        """
+        @return Array of the member name (a .npy file).
+        """
+        return np.load(io.BytesIO(self.read(name)))
+
+
+    def phases(self,k,columns=None):
+        """
+        Reads recorded rows [t,phases] of chunk k, decompressing only the members holding the selected columns.
+        @param columns None (all columns), integer, slice or list of the columns.
+        @return Array (float64) of all rows of chunk k and the selected columns (one-dimensional for an integer).
+        """
+        description=self.manifest.chunks[k]['phases']
+        selected=np.arange(description['columns'])[slice(None) if columns is None else columns]
+        if np.ndim(selected)==0:
+            return self.phases(k,[int(selected)])[:,0]
+        result=np.empty((description['rows'],len(selected)))
+        if (selected==0).any():
+            result[:,selected==0]=self.load(description['times_file'])[:,None]
+        blocks=(selected-1)//description['column_block']
+        for b in np.unique(blocks[selected>0]):
+            in_block=(selected>0)&(blocks==b)
+            result[:,in_block]=self.load(description['blocks'][b])[:,selected[in_block]-1-b*description['column_block']]
+        return result
+
+
+    def spike_times(self,k,columns=None):
+        """
+        @return Array of the spike times of chunk k (decoded, float64).
+        """
+        description=self.manifest.chunks[k]['spikes']
+        times=self.load(description['times_file'])
+        return decode_times(times) if description.get('time_encoding')=='delta' else times
+
+
+    def spike_ids(self,k,columns=None):
+        """
+        @return Array of the spiking neurons of chunk k.
+        """
+        return self.load(self.manifest.chunks[k]['spikes']['ids_file'])
+
+
+    def close(self):
+        self.zip.close()
+
+
+def open_container(folder):
+    """
+    @return Container of folder, or None if folder has none.
+    """
+    if not os.path.exists(os.path.join(folder,CONTAINER_FILE)):
+        return None
+    return Container(folder)
+
+
+def open_file(folder,name):
+    """
+    @return Binary file object of folder/name, or of the member name of the container of folder.
+    """
+    filename=os.path.join(folder,name)
+    if not os.path.exists(filename):
+        container=open_container(folder)
+        if container is not None and container.has(name):
+            data=container.read(name)
+            container.close()
+            return io.BytesIO(data)
+    return open(filename,'rb')
+
+
+def load_array(folder,name):
+    """
+    @return Array of folder/name or of the member name of the container of folder (a .npy file), None if there is neither.
+    """
+    filename=os.path.join(folder,name)
+    if os.path.exists(filename):
+        return np.load(filename)
+    container=open_container(folder)
+    if container is None or not container.has(name):
+        return None
+    array=container.load(name)
+    container.close()
+    return array
+
+
+def npy_bytes(array):
+    """
+    @return Content of a .npy file holding array.
+    """
+    f=io.BytesIO()
+    np.save(f,np.asarray(array))
+    return f.getvalue()
+
+
+def encode_times(times):
+    """
+    @param times Array of ascending non-negative times (float64).
+    @return Array (int64) of the differences of the bit patterns of consecutive times (the first one relative to 0), see decode_times.
+    """
+    bits=np.ascontiguousarray(times,dtype=np.float64).view(np.int64)
+    return np.concatenate([bits[:1],np.diff(bits)])
+
+
+def decode_times(deltas):
+    """
+    @return Array of the times encoded by encode_times (bit-exact).
+    """
+    return np.cumsum(deltas,dtype=np.int64).view(np.float64)
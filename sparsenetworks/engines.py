@@ -0,0 +1,132 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package engines
+
+Representations of the phases of a system.System.
+
+Between two events, all phases grow with slope 1. The 'eager' engine adds the time difference to every phase at each event (O(N) per event).
+The 'lazy' engine stores phases relative to a global clock, so advancing time costs O(1) and an event only touches the neurons that spike or receive spikes (O(K) per event).
+Both store the phases in the dtype of the System (float64 or float32); the clock of the lazy engine is always a python float.
+"""
+
+import numpy as np
+
+
+## Simulated time after which the lazy engine folds its clock into the stored phases (O(N)), so they do not lose precision.
+REBASE_INTERVAL=1.0
+
+
+class EagerPhases(object):
+    """
+    Stores the phases as they are; advance shifts all of them.
+    """
+
+    def __init__(self,n_neurons,dtype=np.float64):
+        """
+        @param n_neurons Total number of neurons.
+        @param dtype dtype of the stored phases.
+        """
+        self.dtype=np.dtype(dtype)
+        self.values=np.zeros(n_neurons,dtype=self.dtype)
+
+
+    def advance(self,dt):
+        """
+        Lets all phases grow by dt.
+        """
+        self.values+=dt
+
+
+    def get(self,indices):
+        """
+        @param indices Array of neuron indices.
+        @return Array of current phases of those neurons.
+        """
+        return self.values[indices]
+
+
+    def set(self,indices,phases):
+        """
+        @param indices Array of neuron indices.
+        @param phases New phases of those neurons (array or single value).
+        """
+        self.values[indices]=phases
+
+
+    def get_all(self):
+        """
+        @return Array of current phases of all neurons.
+        """
+        return self.values
+
+
+    def set_all(self,phases):
+        """
+        @param phases Array of new phases of all neurons.
+        """
+        self.values=np.array(phases,dtype=self.dtype)
+
+
+    def get_state(self):
+        """
+        @return Picklable copy of the stored phases (for checkpoints), see set_state.
+        """
+        return {'values':self.values.copy()}
+
+
+    def set_state(self,state):
+        """
+        Restores phases returned by get_state.
+        """
+        self.values=state['values'].copy()
+
+
+class LazyPhases(EagerPhases):
+    """
+    Stores the phases relative to a global clock: the phase of neuron i is values[i]+clock.
+
+    advance only moves the clock; every REBASE_INTERVAL the clock is added to all stored values and reset to 0.
+    """
+
+    def __init__(self,n_neurons,dtype=np.float64):
+        EagerPhases.__init__(self,n_neurons,dtype)
+        ## time elapsed since the last rebase
+        self.clock=0.0
+
+
+    def advance(self,dt):
+        # (a python float does not change the dtype of the phases it is added to)
+        self.clock=float(self.clock+dt)
+        if self.clock>REBASE_INTERVAL:
+            self.values+=self.clock
+            self.clock=0.0
+
+
+    def get(self,indices):
+        return self.values[indices]+self.clock
+
+
+    def set(self,indices,phases):
+        self.values[indices]=phases-self.clock
+
+
+    def get_all(self):
+        return self.values+self.clock
+
+
+    def set_all(self,phases):
+        self.values=np.array(phases,dtype=self.dtype)-self.clock
+
+
+    def get_state(self):
+        return {'values':self.values.copy(),'clock':self.clock}
+
+
+    def set_state(self,state):
+        self.values=state['values'].copy()
+        self.clock=state['clock']
+
+
+## Available engines, see System.
+ENGINES={'eager':EagerPhases,'lazy':LazyPhases}
@@ -0,0 +1,239 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package ensemble
+
+Simulation of many replicas of one network at once.
+
+The replicas share the connectivity, the populations and all parameters of one system.System, and differ only in their initial phases and their external spikes.
+Each replica has its own time; one step of an Ensemble handles the next event of every replica, so the python overhead of a step is paid once for all replicas.
+The phases are stored as an (M,N) array and the spikes arriving in all replicas are delivered as one sparse matrix-matrix product of the weight matrix with a (neurons x replicas) matrix of spike counts.
+"""
+
+import os
+import pickle
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .random_streams import make_rng
+from . import spike_events
+from .system import System,OUTPUT_MEMORY
+
+
+class Ensemble(object):
+    """
+    M replicas of a System with the same weight matrix.
+
+    The external neurons of a replica together emit spikes as one poissonian process with the sum of all their rates; each spike is assigned to one external neuron with probability proportional to its rate.
+    This is the same (in distribution) as independent poissonian neurons, but needs only one upcoming external spike time per replica.
+    """
+
+    def __init__(self,M,N=np.array([400,100]),J_int=None,I=[1.,1.],gamma=[0.2,0.2],K=80,tau=0.05,N_ext=[],J_ext=np.array([]),rates=[],fixed_in_degree=False,seed=None):
+        """
+        @param M Number of replicas.
+        @param N One-dimensional array or list containing the number of individual neurons for each population.
+        @param J_int Two-dimensional array containing connection strengths J_int[k,l] for connections of neurons from population l to neurons of population k.
+        @param I List containing parameters I (one value per population) of the neurons.
+        @param gamma List containing parameters gamma (one value per population) of the neurons.
+        @param K Average number of connections all neurons of one population receive from any other population.
+        @param tau Delay between sending and receiving an (internal) spike (one delay for all connections).
+        @param N_ext One-dimensional array or list containing the number of neurons for each external population.
+        @param J_ext Two-dimensional array containing connection strengths J_ext[k,m] for connections from external source m to neurons of population k.
+        @param rates List of firing rates of external inputs (one constant rate per external population).
+        @param fixed_in_degree If True, each neuron receives a fixed number of connections, see System.
+        @param seed None (use the global numpy.random state), an integer seed or a random number generator; it determines the connectivity and all replicas.
+        """
+        self.parameters={'N':np.array(N),'J_int':J_int,'I':I,'gamma':gamma,'K':K,'tau':tau,'N_ext':N_ext,'J_ext':J_ext,'rates':rates,'fixed_in_degree':fixed_in_degree}
+        if not hasattr(seed,'standard_exponential'): # (generator objects are not stored)
+            self.parameters['seed']=seed
+
+        self.M=M
+        self.rng=make_rng(seed)
+
+        ## the network simulated by all replicas (its own phases and external spikes are not used)
+        self.network=System(N,J_int,I,gamma,K,tau,N_ext,J_ext,rates,fixed_in_degree=fixed_in_degree,seed=self.rng)
+        self.layout=self.network.layout
+        if len(self.network.delays)>1:
+            raise ValueError('Ensemble supports a single delay tau only')
+        self.tau=self.network.delays[0]
+        n_neurons=self.layout.offsets[-1]
+        self.weight_matrix=self.network.weight_matrix
+        # transposed weight matrix (csr); the product with the spikes then only reads the rows of spiking neurons
+        self.weight_rows=self.network.weight_columns.T
+
+        ## system time of each replica
+        self.t=np.zeros(M)
+        ## phases of all neurons of all replicas (one row per replica)
+        self.phases=self.rng.uniform(size=(M,n_neurons))
+        ## predicted threshold crossing time of each neuron of each replica
+        self.threshold_times=self.t[:,None]+1-self.phases
+
+        # the external neurons of a replica spike with the total rate, the spiking neuron is chosen by cumulative rates
+        ext_rates=self.layout.ext_rates
+        self.total_ext_rate=ext_rates.sum()
+        self.cumulative_ext_rates=np.cumsum(ext_rates)/self.total_ext_rate if self.total_ext_rate>0 else np.zeros(0)
+        ## time of the next external spike of each replica
+        self.external_times=self.get_InterSpikeInterval(np.arange(M))
+
+        ## pending internal spikes of all replicas: replica, arrival time and index of the spiking neuron
+        self.pending=(np.zeros(0,dtype=int),np.zeros(0),np.zeros(0,dtype=int))
+
+        ## for each replica, the indices of the neurons that spiked during the last step (only replicas that spiked are keys)
+        self.spike_events={}
+
+
+    def get_InterSpikeInterval(self,replicas):
+        """
+        Draws the times of the next external spikes.
+        @param replicas Array of indices of replicas.
+        @return Array of times of the next external spike of each replica (inf if there is no external input).
+        """
+        if self.total_ext_rate<=0:
+            return np.inf*np.ones(len(replicas))
+        return self.t[replicas]+self.rng.standard_exponential(len(replicas))/self.total_ext_rate
+
+
+    def step(self,t_end=np.inf):
+        """
+        Handles the next event of each replica whose time is below t_end; the other replicas are left unchanged.
+        @param t_end Replicas at or beyond this time do not take part in the step.
+        @return Boolean array, True for each replica that took part.
+        """
+        n_neurons=self.layout.offsets[-1]
+        active=self.t<t_end
+        replica_pending,time_pending,neuron_pending=self.pending
+
+        # time of the next event of each replica
+        next_arrival=np.inf*np.ones(self.M)
+        np.minimum.at(next_arrival,replica_pending,time_pending)
+        next_threshold=self.threshold_times.min(axis=1)
+        t_event=np.maximum(np.minimum(np.minimum(next_threshold,next_arrival),self.external_times),self.t)
+        t_event[~active]=self.t[~active]
+
+        self.phases+=(t_event-self.t)[:,None]
+        self.t=t_event
+
+        # neurons reaching the threshold (only rows of replicas that have any are scanned)
+        candidates=np.where(active&(next_threshold<=t_event))[0]
+        rows,spike_id=np.nonzero(self.threshold_times[candidates]<=t_event[candidates,None])
+        spike_replica=candidates[rows]
+        self.phases[spike_replica,spike_id]=0.0
+        self.threshold_times[spike_replica,spike_id]=t_event[spike_replica]+1
+
+        # internal spikes arriving at t_event
+        due=active[replica_pending]&(time_pending<=t_event[replica_pending])
+        arrival_replica=replica_pending[due]
+        arrival_id=neuron_pending[due]
+
+        # external spikes at t_event
+        ext_replica=np.where(active&(self.external_times<=t_event))[0]
+        ext_id=np.searchsorted(self.cumulative_ext_rates,self.rng.uniform(size=len(ext_replica)),side='right')
+        ext_id=np.minimum(ext_id,len(self.cumulative_ext_rates)-1)
+        self.external_times[ext_replica]=self.get_InterSpikeInterval(ext_replica)
+
+        # the spikes emitted at t_event arrive at t_event+tau
+        self.pending=(np.concatenate([replica_pending[~due],spike_replica]),np.concatenate([time_pending[~due],t_event[spike_replica]+self.tau]),np.concatenate([neuron_pending[~due],spike_id]))
+        self.spike_events={}
+        for replica in np.unique(spike_replica):
+            self.spike_events[replica]=spike_id[spike_replica==replica]
+
+        if len(arrival_replica) or len(ext_replica):
+            # (replica x presynaptic neuron) matrix of spike counts, internal neurons first, external neurons after them
+            columns=np.concatenate([arrival_id,ext_id+n_neurons])
+            replicas=np.concatenate([arrival_replica,ext_replica])
+            spikes=csr_matrix((np.ones(len(columns)),(replicas,columns)),shape=(self.M,self.weight_rows.shape[0]))
+
+            # change in potential of each neuron in each replica
+            epsilon=(spikes*self.weight_rows).tocoo()
+            target_replica,targets=epsilon.row,epsilon.col
+            self.phases[target_replica,targets]=self.h(epsilon.data,target_replica,targets)
+
+            #if the received spike is elicting another spike immediatley we neglet this further spike
+            refractory=self.phases[spike_replica,spike_id]>1
+            self.phases[spike_replica[refractory],spike_id[refractory]]=0.0
+
+            self.threshold_times[target_replica,targets]=t_event[target_replica]+1-self.phases[target_replica,targets]
+
+        return active
+
+
+    def h(self,epsilon,replicas,indices):
+        """
+        Transfer function H(phi,epsilon)=U^-1[U(phi)+epsilon], see System.h.
+        @param epsilon Array of changes in potential.
+        @param replicas,indices Arrays of the replica and the neuron each entry of epsilon refers to.
+        @return Array of updated phases.
+        """
+        I=self.network.I_gamma[0,indices]
+        gamma=self.network.I_gamma[1,indices]
+
+        log_arg=np.exp(-gamma*self.phases[replicas,indices])-gamma/I*epsilon
+        too_large=log_arg<=0
+        log_arg[too_large]=1.0
+        updated_phases=-1./gamma*np.log(log_arg)
+        updated_phases[too_large]=1.1
+
+        return updated_phases
+
+
+    def run(self,t_end,output_dir=None):
+        """
+        Runs all replicas until their system times exceed t_end.
+        @param t_end Ending time of the run.
+        @param output_dir If not None, the output of replica m is written to output_dir/replica<m> in the format of WithOutput (parameters.pickle, phases<n>.npy and the spikes in the format of spike_events).
+        """
+        if output_dir is None:
+            while (self.t<t_end).any():
+                self.step(t_end)
+            return
+
+        n_neurons=self.layout.offsets[-1]
+        replica_dirs=[os.path.join(output_dir,'replica'+str(m)) for m in range(self.M)]
+        for m,replica_dir in enumerate(replica_dirs):
+            if not os.path.isdir(replica_dir):
+                os.makedirs(replica_dir)
+            with open(replica_dir+'/parameters.pickle','wb') as f:
+                pickle.dump(dict(self.parameters,replica=m),f)
+
+        # one row per step and replica; rows of replicas that did not take part in a step are dropped when writing
+        output_size=max(int(OUTPUT_MEMORY/(n_neurons+1)/8/self.M),1)
+        outputs=np.zeros((output_size,self.M,n_neurons+1))
+        recorded=np.zeros((output_size,self.M),dtype=bool)
+        spikes=[[] for m in range(self.M)]
+        id_dtype=spike_events.id_dtype(n_neurons)
+        n_files=0
+        i=0
+        i_progress=0
+        n_progress=100
+
+        progress=0
+        sys.stdout.write('[%-20s] %d%% of t_end' % ('='*(progress//5), progress))
+
+        while (self.t<t_end).any():
+            active=self.step(t_end)
+
+            outputs[i,:,0]=self.t
+            outputs[i,:,1:]=self.phases
+            recorded[i]=active
+            for m,spike_id in self.spike_events.items():
+                spikes[m].append((self.t[m],spike_id))
+            i+=1
+            i_progress+=1
+
+            if i==output_size or not (self.t<t_end).any():
+                for m,replica_dir in enumerate(replica_dirs):
+                    np.save(replica_dir+'/phases'+str(n_files)+'.npy',outputs[:i,m][recorded[:i,m]])
+                    times=[np.ones(len(spike_id))*t_spike for t_spike,spike_id in spikes[m]]
+                    ids=[spike_id.astype(id_dtype) for t_spike,spike_id in spikes[m]]
+                    spike_events.save_chunk(replica_dir,n_files,np.concatenate(times) if times else np.zeros(0),np.concatenate(ids) if ids else np.zeros(0,dtype=id_dtype))
+                spikes=[[] for m in range(self.M)]
+                n_files+=1
+                i=0
+
+            if i_progress%n_progress==0:
+                progress=int(min(self.t.min()/t_end,1)*100)
+                sys.stdout.write('\r')
+                sys.stdout.write('[%-20s] %d%% of t_end' % ('='*(progress//5), progress))
+                sys.stdout.flush()
+        sys.stdout.write('\n')
@@ -0,0 +1,82 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package hooks
+
+Callbacks in the event loop of system.System.run, for recorders, monitors and stopping conditions.
+
+A hook is an object with any of the following attributes (the class Hook defines them all as None, so subclasses only define the ones they need):
+- on_event(system): called after each event.
+- on_spike(system,t,indices): called after each event in which neurons reached the threshold, with the spike time and the array of their indices.
+- on_interval(system,t): called at the times t_start+k*interval (attributes interval and t_start), before the first event after t; the system is still at its time system.t<=t, so the phases at t are system.phases+(t-system.t) (see phases_at).
+- start(system,t_end) and finish(system): called before and after each run (finish also if the run fails).
+
+A callback returning True stops the run after the current event (or sampling time).
+The callbacks receive the state of the system, not copies: system.phases, system.t, and index arrays that are not modified afterwards, so hooks may keep them and process them in batches.
+Without hooks, System.run executes the plain event loop, so unused hooks cost nothing.
+"""
+
+import numpy as np
+
+
+class Hook(object):
+    """
+    Base class of hooks; all callbacks are None (not called) unless a subclass defines them.
+    """
+    on_event=None
+    on_spike=None
+    on_interval=None
+    start=None
+    finish=None
+
+    ## time between two calls of on_interval
+    interval=None
+    ## time of the first call of on_interval
+    t_start=0.
+
+
+    def first_sample(self,t):
+        """
+        @param t Current time.
+        @return Number k of the first time t_start+k*interval at or after t.
+        """
+        k=max(int(np.ceil((t-self.t_start)/self.interval)),0)
+        # correct rounding errors of the division, so k is exact for the times as computed by System.run (a resumed run continues with the right time, see checkpoint)
+        while k>0 and self.t_start+(k-1)*self.interval>=t:
+            k-=1
+        while self.t_start+k*self.interval<t:
+            k+=1
+        return k
+
+
+class FunctionHook(Hook):
+    """
+    Hook calling the given functions.
+    """
+
+    def __init__(self,on_event=None,on_spike=None,on_interval=None,interval=None,t_start=0.,start=None,finish=None):
+        """
+        @param on_event,on_spike,on_interval,start,finish Functions called as the methods of the same name (see hooks), or None.
+        @param interval Time between two calls of on_interval.
+        @param t_start Time of the first call of on_interval.
+        """
+        if on_interval is not None and (interval is None or interval<=0):
+            raise ValueError('on_interval needs a positive interval')
+        self.on_event=on_event
+        self.on_spike=on_spike
+        self.on_interval=on_interval
+        self.interval=interval
+        self.t_start=t_start
+        self.start=start
+        self.finish=finish
+
+
+def phases_at(system,t,indices=None):
+    """
+    @param system system.System at time system.t<=t, with no event until t.
+    @param t Time.
+    @param indices If not None, indices of the neurons.
+    @return Phases of all neurons (or of the neurons in indices) at time t.
+    """
+    phases=system.phases if indices is None else system.engine.get(indices)
+    return phases+(t-system.t)
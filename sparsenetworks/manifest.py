@@ -0,0 +1,107 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package manifest
+
+Manifest of an output folder of system.WithOutput.
+
+The file manifest.json lists the chunks of the output in order; for the phases and the spikes of each chunk it holds the file names, the number of rows, the dtype and the first and last time.
+output_analyzer.Analyzer uses it to find the chunks overlapping a time window by binary search, without opening (or even listing) the other chunk files.
+The manifest is rewritten (atomically) after each chunk, so it describes all completely written chunks even if a run is interrupted.
+"""
+
+import json
+import os
+import numpy as np
+
+
+## Version of the output format described by the manifest.
+FORMAT_VERSION=1
+
+## Name of the manifest file in an output folder.
+MANIFEST_FILE='manifest.json'
+
+
+class Manifest(object):
+    """
+    List of the chunks of an output folder.
+
+    Each entry of chunks is a dictionary {'chunk':n,'phases':{...},'spikes':{...}}; phases holds 'file', 'rows', 'columns', 'dtype', 't_min' and 't_max', spikes holds 'times_file', 'ids_file', 'rows', 'dtype' (of the neuron indices), 't_min' and 't_max'.
+    The times are None for chunks without rows.
+    """
+
+    def __init__(self,chunks=None,format_version=FORMAT_VERSION):
+        self.chunks=[] if chunks is None else chunks
+        self.format_version=format_version
+
+
+    def add_chunk(self,n,phases_file,phase_times,columns,times_file,ids_file,spike_times,spike_ids,dtype='float64'):
+        """
+        Appends the description of chunk n.
+        @param phases_file,times_file,ids_file Names of the chunk's files (relative to the output folder).
+        @param phase_times Array of the times of the recorded rows [t,phases] of the chunk.
+        @param columns Number of columns of the rows (including the time).
+        @param spike_times,spike_ids Arrays of the chunk's spikes in event-list format.
+        @param dtype dtype of the rows as read.
+        """
+        self.chunks.append({'chunk':n,
+                            'phases':{'file':phases_file,'rows':len(phase_times),'columns':columns,'dtype':str(np.dtype(dtype)),'t_min':_time(phase_times[:1]),'t_max':_time(phase_times[-1:])},
+                            'spikes':{'times_file':times_file,'ids_file':ids_file,'rows':len(spike_times),'dtype':str(np.asarray(spike_ids).dtype),'t_min':_time(spike_times[:1]),'t_max':_time(spike_times[-1:])}})
+
+
+    def files(self,kind,key='file'):
+        """
+        @param kind 'phases' or 'spikes'.
+        @param key Entry holding the file name ('file' for phases, 'times_file' or 'ids_file' for spikes).
+        @return List of the file names, in chunk order.
+        """
+        return [chunk[kind][key] for chunk in self.chunks]
+
+
+    def rows(self,kind):
+        """
+        @return List of the numbers of rows of the chunks.
+        """
+        return [chunk[kind]['rows'] for chunk in self.chunks]
+
+
+    def last_times(self,kind):
+        """
+        @return List of the last time of each chunk; a chunk without rows takes the last time of the chunk before it, so the list is ascending.
+        """
+        last_times=[]
+        for chunk in self.chunks:
+            t_max=chunk[kind]['t_max']
+            last_times.append(t_max if t_max is not None else (last_times[-1] if last_times else -np.inf))
+        return last_times
+
+
+    def write(self,folder):
+        """
+        Writes the manifest to folder/MANIFEST_FILE (via a temporary file, so readers never see a partially written manifest).
+        """
+        filename=os.path.join(folder,MANIFEST_FILE)
+        with open(filename+'.tmp','w') as f:
+            json.dump({'format_version':self.format_version,'chunks':self.chunks},f,indent=1,sort_keys=True)
+        if os.path.exists(filename) and os.name=='nt': # (os.rename does not replace files on windows)
+            os.remove(filename)
+        os.rename(filename+'.tmp',filename)
+
+
+def read_manifest(folder):
+    """
+    @param folder Output folder.
+    @return Manifest of folder, or None if it has none (outputs of older versions).
+    """
+    filename=os.path.join(folder,MANIFEST_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        content=json.load(f)
+    if content['format_version']>FORMAT_VERSION:
+        raise ValueError('%s has format version %d, only versions up to %d are supported' % (filename,content['format_version'],FORMAT_VERSION))
+    return Manifest(content['chunks'],content['format_version'])
+
+
+def _time(times):
+    return float(times[0]) if len(times) else None
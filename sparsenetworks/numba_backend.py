@@ -0,0 +1,300 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package numba_backend
+
+Compiled event loop for system.System.run.
+
+The whole loop of system.System.jump_to_next_event runs as one function over plain arrays (CSC weights, phases, threshold times, a heap of external spike times, a FIFO queue of internal spike arrivals and a block of pre-generated random numbers), compiled with numba if it is installed.
+The state of the System is exported to these arrays before and imported back after the loop, so the python and the compiled path can be used alternately on the same System.
+Without numba, system.System.run uses its pure-python path.
+"""
+
+import numpy as np
+
+try:
+    import numba
+    NUMBA_AVAILABLE=True
+    jit=numba.njit(cache=True)
+except ImportError:
+    NUMBA_AVAILABLE=False
+    # the functions below stay plain python functions (useful for debugging, but slow)
+    jit=lambda f: f
+
+
+## Return codes of event_loop.
+FINISHED=0
+OUT_OF_RANDOM_NUMBERS=1
+QUEUE_FULL=2
+
+
+@jit
+def _sift_down(times,ids,pos):
+    """
+    Restores the heap property of the min-heap (times,ids) below position pos.
+    """
+    n=len(times)
+    while True:
+        child=2*pos+1
+        if child>=n:
+            return
+        if child+1<n and times[child+1]<times[child]:
+            child+=1
+        if times[child]<times[pos]:
+            times[pos],times[child]=times[child],times[pos]
+            ids[pos],ids[child]=ids[child],ids[pos]
+            pos=child
+        else:
+            return
+
+
+@jit
+def heapify(times,ids):
+    """
+    Turns the arrays (times,ids) into a min-heap ordered by times (in place).
+    """
+    for pos in range(len(times)//2-1,-1,-1):
+        _sift_down(times,ids,pos)
+
+
+@jit
+def event_loop(t_end,phases,threshold_times,I,gamma,indptr,indices,data,tau,ext_times,ext_ids,ext_rates,exponentials,queue_times,queue_starts,queue_lengths,ring,state):
+    """
+    Runs the simulation until time state time exceeds t_end, or until random numbers or queue space run out.
+
+    The phases, threshold_times and all queues are updated in place.
+    @param t_end Ending time of the run.
+    @param phases Phases of all neurons at the current time.
+    @param threshold_times Predicted threshold crossing time of each neuron.
+    @param I,gamma Parameters I and gamma of each neuron.
+    @param indptr,indices,data CSC arrays of the weight matrix (internal neurons' columns first, then external neurons').
+    @param tau Delay of internal spikes.
+    @param ext_times,ext_ids Min-heap of the next spike times of the external neurons and their indices.
+    @param ext_rates Rate of each external neuron.
+    @param exponentials Block of standard exponential random numbers for the external inter-spike intervals.
+    @param queue_times,queue_starts,queue_lengths Ring buffer of pending internal arrivals: arrival time, position of the first spiking neuron's index in ring and number of spiking neurons.
+    @param ring Ring buffer of indices of spiking neurons.
+    @param state Float array [t,position in exponentials,queue head,queue count,ring head,ring count,number of events,number of spikes].
+    @return FINISHED, OUT_OF_RANDOM_NUMBERS or QUEUE_FULL.
+    """
+    n_neurons=len(phases)
+    n_ext=len(ext_times)
+    queue_size=len(queue_times)
+    ring_size=len(ring)
+
+    t=state[0]
+    exp_pos=int(state[1])
+    q_head=int(state[2])
+    q_count=int(state[3])
+    r_head=int(state[4])
+    r_count=int(state[5])
+    n_events=int(state[6])
+    n_spikes=int(state[7])
+
+    epsilon=np.zeros(n_neurons)
+    received=np.zeros(n_neurons,dtype=np.bool_)
+    targets=np.zeros(n_neurons,dtype=np.int64)
+    spiking=np.zeros(n_neurons,dtype=np.int64)
+    status=FINISHED
+
+    while t<t_end:
+        # the loop is only left between events, so no event is handled partially
+        if exp_pos+n_ext>len(exponentials):
+            status=OUT_OF_RANDOM_NUMBERS
+            break
+        if q_count==queue_size or r_count+n_neurons>ring_size:
+            status=QUEUE_FULL
+            break
+
+        # time of the next event
+        t_event=np.inf
+        if q_count>0:
+            t_event=queue_times[q_head]
+        if n_ext>0 and ext_times[0]<t_event:
+            t_event=ext_times[0]
+        for i in range(n_neurons):
+            if threshold_times[i]<t_event:
+                t_event=threshold_times[i]
+        if t_event<t:
+            t_event=t
+        dt=t_event-t
+        t=t_event
+
+        for i in range(n_neurons):
+            phases[i]+=dt
+
+        # neurons reaching the threshold
+        n_spiking=0
+        for i in range(n_neurons):
+            if threshold_times[i]<=t_event:
+                spiking[n_spiking]=i
+                n_spiking+=1
+                phases[i]=0.0
+                threshold_times[i]=t_event+1.0
+
+        # epsilon of all neurons receiving spikes arriving at t_event
+        n_targets=0
+        while q_count>0 and queue_times[q_head]<=t_event:
+            start=queue_starts[q_head]
+            for k in range(queue_lengths[q_head]):
+                column=ring[(start+k)%ring_size]
+                for p in range(indptr[column],indptr[column+1]):
+                    row=indices[p]
+                    if not received[row]:
+                        received[row]=True
+                        targets[n_targets]=row
+                        n_targets+=1
+                    epsilon[row]+=data[p]
+            r_head=(r_head+queue_lengths[q_head])%ring_size
+            r_count-=queue_lengths[q_head]
+            q_head=(q_head+1)%queue_size
+            q_count-=1
+        while n_ext>0 and ext_times[0]<=t_event:
+            column=n_neurons+ext_ids[0]
+            for p in range(indptr[column],indptr[column+1]):
+                row=indices[p]
+                if not received[row]:
+                    received[row]=True
+                    targets[n_targets]=row
+                    n_targets+=1
+                epsilon[row]+=data[p]
+            # draw the next spike time of this external neuron
+            ext_times[0]=t_event+exponentials[exp_pos]/ext_rates[ext_ids[0]]
+            exp_pos+=1
+            _sift_down(ext_times,ext_ids,0)
+
+        # update phases of the receiving neurons using transfer function h
+        for k in range(n_targets):
+            i=targets[k]
+            log_arg=np.exp(-gamma[i]*phases[i])-gamma[i]/I[i]*epsilon[i]
+            if log_arg<=0:
+                phases[i]=1.1
+            else:
+                phases[i]=-1.0/gamma[i]*np.log(log_arg)
+            epsilon[i]=0.0
+            received[i]=False
+
+        #if the received spike is elicting another spike immediatley we neglet this further spike
+        if n_targets>0:
+            for k in range(n_spiking):
+                if phases[spiking[k]]>1:
+                    phases[spiking[k]]=0.0
+        for k in range(n_targets):
+            threshold_times[targets[k]]=t_event+1.0-phases[targets[k]]
+
+        # the indices of the neurons [which spike at t_event] are queued for time t_event+tau
+        if n_spiking>0:
+            q_tail=(q_head+q_count)%queue_size
+            queue_times[q_tail]=t_event+tau
+            queue_starts[q_tail]=(r_head+r_count)%ring_size
+            queue_lengths[q_tail]=n_spiking
+            q_count+=1
+            for k in range(n_spiking):
+                ring[(r_head+r_count)%ring_size]=spiking[k]
+                r_count+=1
+            n_spikes+=n_spiking
+
+        n_events+=1
+
+    state[0]=t
+    state[1]=exp_pos
+    state[2]=q_head
+    state[3]=q_count
+    state[4]=r_head
+    state[5]=r_count
+    state[6]=n_events
+    state[7]=n_spikes
+    return status
+
+
+def run(system,t_end):
+    """
+    Runs system until system.t exceeds t_end with the compiled event loop.
+
+    The state of system (phases, scheduled events, random numbers) is exported to arrays, the loop is run (repeatedly, if random numbers or queue space run out) and the state is imported back into system.
+    @param system A system.System using a scheduler.HeapScheduler and a single delay bucket (system.delays).
+    @param t_end Ending time of the run.
+    @return Tuple (number of events,number of spikes).
+    """
+    scheduler=system.scheduler
+    n_neurons=system.layout.offsets[-1]
+    W=system.weight_columns
+
+    phases=np.array(system.phases,dtype=float)
+    threshold_times=scheduler.threshold_times.copy()
+    ext_ids=np.arange(system.layout.ext_offsets[-1],dtype=np.int64)
+    ext_times=scheduler.external_times.copy()
+    heapify(ext_times,ext_ids)
+
+    arrivals=scheduler.pending_arrivals()
+    queue_size=max(2*len(arrivals),1024)
+    ring_size=max(2*sum(len(a[1]) for a in arrivals),4*n_neurons)
+    queue_times,queue_starts,queue_lengths,ring=_new_queue(arrivals,queue_size,ring_size)
+
+    state=np.array([system.t,0,0,len(arrivals),0,sum(len(a[1]) for a in arrivals),0,0],dtype=float)
+    indptr=W.indptr.astype(np.int64)
+    indices=W.indices.astype(np.int64)
+
+    while True:
+        # random numbers for the external neurons are taken from the System's buffer, so the compiled and the python path draw the same intervals
+        buffer=system.isi_buffer
+        exponentials=buffer.block[buffer.position:]
+        status=event_loop(t_end,phases,threshold_times,system.I_gamma[0],system.I_gamma[1],indptr,indices,W.data,system.delays[0],ext_times,ext_ids,system.layout.ext_rates,exponentials,queue_times,queue_starts,queue_lengths,ring,state)
+        buffer.position+=int(state[1])
+        state[1]=0
+
+        if status==OUT_OF_RANDOM_NUMBERS:
+            # refill the buffer, so it holds enough numbers for at least one more event
+            n=len(ext_ids)+buffer.block_size
+            buffer.take(n)
+            buffer.position-=n
+        elif status==QUEUE_FULL:
+            arrivals=_read_queue(queue_times,queue_starts,queue_lengths,ring,state)
+            queue_times,queue_starts,queue_lengths,ring=_new_queue(arrivals,2*len(queue_times),2*len(ring))
+            state[2:6]=[0,len(arrivals),0,sum(len(a[1]) for a in arrivals)]
+        else:
+            break
+
+    # import the state back into system
+    system.t=state[0]
+    system.phases=phases
+    scheduler.clear()
+    scheduler.set_external(ext_ids,ext_times)
+    scheduler.set_threshold(np.arange(n_neurons),threshold_times)
+    for time,spike_id in _read_queue(queue_times,queue_starts,queue_lengths,ring,state):
+        scheduler.push_arrival(time,spike_id)
+    system.spike_event=None
+
+    return int(state[6]),int(state[7])
+
+
+def _new_queue(arrivals,queue_size,ring_size):
+    """
+    @param arrivals List of (arrival time,array of spiking neurons), sorted by time.
+    @return Arrays (queue_times,queue_starts,queue_lengths,ring) holding arrivals.
+    """
+    queue_times=np.zeros(queue_size)
+    queue_starts=np.zeros(queue_size,dtype=np.int64)
+    queue_lengths=np.zeros(queue_size,dtype=np.int64)
+    ring=np.zeros(ring_size,dtype=np.int64)
+    position=0
+    for k,(time,spike_id) in enumerate(arrivals):
+        queue_times[k]=time
+        queue_starts[k]=position
+        queue_lengths[k]=len(spike_id)
+        ring[position:position+len(spike_id)]=spike_id
+        position+=len(spike_id)
+    return queue_times,queue_starts,queue_lengths,ring
+
+
+def _read_queue(queue_times,queue_starts,queue_lengths,ring,state):
+    """
+    @return List of (arrival time,array of spiking neurons) of the arrivals in the ring buffers, sorted by time.
+    """
+    arrivals=[]
+    q_head,q_count=int(state[2]),int(state[3])
+    for k in range(q_count):
+        q=(q_head+k)%len(queue_times)
+        positions=(queue_starts[q]+np.arange(queue_lengths[q]))%len(ring)
+        arrivals.append((queue_times[q],ring[positions]))
+    return arrivals
@@ -14,9 +14,18 @@ This file holds a class designed to analyze phases- and spikes-files created wit
 """
 
 import numpy as np
-import sys
 
-## Defines the memory cap, if an array exceeds it, no other array will be loaded from file.
+from .populations import PopulationLayout
+from . import spike_events
+from .recording import PHASE_INDICES_FILE
+from .chunks import ChunkedArray
+from .container import load_array,open_container,open_file
+from .manifest import read_manifest
+from . import rates
+from .spike_statistics import SpikeStatistics
+from . import psth as psth_files
+
+## Defines the memory cap; read_phases and read_spikes raise MemoryError instead of reading a selection exceeding it.
 ARRAY_MEMORY=1.6*10**9 # in byte
 
 class Analyzer:
@@ -26,13 +35,18 @@ class Analyzer:
     def __init__(self,folder):
         """
         Constructor.
-        @param folder Folder (string) that holds the phases*.npy and spikes*.npy files to be analyzed.
+        @param folder Folder (string) that holds the phases*.npy and spikes*.npy files (or the container, see container) to be analyzed.
         """
     
         self.folder=folder
     
         self.read_parameters()
 
+        ## container.Container of the output, None if it is written to separate files
+        self.container=open_container(folder)
+        ## manifest.Manifest of the output (None for outputs of older versions, whose chunk files are found by name)
+        self.manifest=self.container.manifest if self.container is not None else read_manifest(folder)
+
     def read_parameters(self):
         """
         Loads parameters from 'parameters.pickle' file in self.folder.
@@ -41,200 +55,262 @@ class Analyzer:
         """
         import pickle
 
-        with open(self.folder+'/parameters.pickle','rb') as f:
+        with open_file(self.folder,'parameters.pickle') as f:
             ## holds the parameters of the simulation that is to be analyzed (reads them from )
             self.parameters=pickle.load(f)
+
+        ## offsets and neuron->population maps of the simulated populations
+        self.layout=PopulationLayout(self.parameters['N'],self.parameters.get('N_ext',[]),self.parameters.get('rates',[]))
             
         
-    def read_spikes(self,indices=None):
+    def open_phases(self):
         """
-        Reads spikes from spikes*.npy in self.folder.
-        @param indices If not None, it needs to be an array of indices of neurons of which the spikes are to be read; if None, spikes for all neurons will be read.
+        Opens the phases*.npy files of self.folder memory-mapped, without reading them.
+        With a manifest, each file is only opened when rows of it are accessed.
+        @return chunks.ChunkedArray: lazy view of all recorded rows [t,phases], in chunk order.
         """
-        import glob
+        if self.manifest is not None:
+            return self.open_chunks('phases','file',(self.manifest.chunks[0]['phases']['columns'],) if self.manifest.chunks else None)
+        return ChunkedArray([filename for n,filename in spike_events.chunk_files(self.folder,'phases')])
 
-        f_list=glob.glob(self.folder+'/spikes*.npy')
-        f_list.sort()
 
-        ## array that holds spikes (of all neurons or all neurons specified in self.read_spikes)
-        self.spike_array=None
-        memory_use=0
+    def open_spikes(self):
+        """
+        Opens the spike files of self.folder in event-list format memory-mapped, without reading them (see spike_events).
+        @return Tuple (times,ids) of chunks.ChunkedArray: lazy views of the spike times and of the indices of the spiking neurons.
+        """
+        if self.manifest is not None:
+            return self.open_chunks('spikes','times_file',(),float),self.open_chunks('spikes','ids_file',())
+        times=ChunkedArray([filename for n,filename in spike_events.chunk_files(self.folder,spike_events.SPIKE_TIMES)])
+        ids=ChunkedArray([filename for n,filename in spike_events.chunk_files(self.folder,spike_events.SPIKE_IDS)])
+        return times,ids
 
-        for i in range(0,len(f_list)):
-            if memory_use<ARRAY_MEMORY:
-                current_array=np.load(f_list[i])
-                if indices==None:
-                    pass
-                else:
-                    current_array=current_array[:,[0]+list(indices)]
-                
 
-                if self.spike_array==None:
-                    self.spike_array=current_array
-                else:
-                    if not current_array.shape[0]==0:
-                        handle=self.spike_array
-                        #print handle.shape
-                        #print current_array.shape
-                        self.spike_array=np.concatenate((handle,current_array))
-                        del handle
-
-                memory_use=self.spike_array.shape[0]*self.spike_array.shape[1]*8
-            else:
-                print 'WARNING: to much memory in use already'
-                break
+    def open_chunks(self,kind,key,row_shape,dtype=None):
+        """
+        Opens the chunk files listed in self.manifest lazily: find_time searches the chunks by the times in the manifest, so only chunks overlapping a time window are opened.
+        The chunks of a container are read from it, decompressing only the members of the selected chunks and columns.
+        @param kind 'phases' or 'spikes'.
+        @param key Entry of the manifest holding the file name, see manifest.Manifest.
+        @param row_shape Shape of a row of the files.
+        @param dtype dtype of the files (None: as in the manifest).
+        @return chunks.ChunkedArray.
+        """
+        import os
 
-        if indices==None:
-            self.spike_indices=np.arange(0,self.spike_array.shape[1]+1)
-        else:
-            ## If spikes were not read for all neurons, this variable stores for which neurons the spikes were read
-            self.spike_indices=np.array(indices)
+        chunks=self.manifest.chunks
+        if dtype is None and chunks:
+            dtype=chunks[0][kind]['dtype']
+        if self.container is not None:
+            reader={'file':self.container.phases,'times_file':self.container.spike_times,'ids_file':self.container.spike_ids}[key]
+            return ChunkedArray(self.manifest.files(kind,key),lengths=self.manifest.rows(kind),last_times=self.manifest.last_times(kind),row_shape=row_shape,dtype=dtype,reader=reader)
+        return ChunkedArray([os.path.join(self.folder,filename) for filename in self.manifest.files(kind,key)],
+                            lengths=self.manifest.rows(kind),last_times=self.manifest.last_times(kind),row_shape=row_shape,dtype=dtype)
 
 
-    def read_phases(self,start_step=None,end_step=None,indices=None):
+    def read_spike_statistics(self):
         """
-        Reads phases from phases*.npy in self.folder.
-        @param start_step NOT IMPLEMENTED YET; the user should be able to define a time step from where to start (for memory reasons).
-        @param end_step NOT IMPLEMENTED YET; the user should be able to define a time step at which to end (for memory reasons).
-        @param indices If not None, it needs to be an array of indices of neurons of which the phases are to be read; if None, phases for all neurons will be read.
+        Reads the per-neuron spike statistics accumulated during the simulation (see system.System, parameter spike_statistics).
+        @return spike_statistics.SpikeStatistics (with rates and cv), or None if the output has none.
         """
+        return SpikeStatistics.load(self.folder)
 
-        import glob
-        f_list=glob.glob(self.folder+'/phases*.npy')
-        f_list.sort()
-
-        self.phase_array=None
-        memory_use=0
 
-        if start_step==None and end_step==None:
-            for i in range(0,len(f_list)):
-                current_array=np.load(f_list[i])
+    def read_psth(self):
+        """
+        Reads the spike counts per population and time bin recorded during the simulation (see system.System, parameter psth_bin).
+        @return PSTH array (one row [bin start,spike counts of each population] per bin) for compute_rates, or None if the output has none.
+        """
+        return psth_files.load(self.folder)
 
-                if indices==None:
-                    pass
-                else:
-                    current_array=current_array[:,[0]+list(indices)]
-                    
-                if self.phase_array==None:
-                    self.phase_array=current_array
-                        
-                else:
-                    if memory_use<ARRAY_MEMORY:
-                        handle=self.phase_array
-                        self.phase_array=np.concatenate((handle,current_array))
-                        del handle
-                    else:
-                        print 'ERROR in read_phases: too much memory used.'
-                        sys.exit(1)
-                
-    
 
-                memory_use=self.phase_array.shape[0]*self.phase_array.shape[1]*8 # in byte for float64
+    def read_spikes(self,indices=None,t_min=None,t_max=None):
+        """
+        Reads spikes from the spike files in self.folder, in event-list format (spike_times*.npy and spike_ids*.npy) or from dense spikes*.npy of older outputs, see spike_events.
 
-        if indices==None:
-            self.phases_indices=np.arange(1,self.phase_array.shape[1]+1)
+        The spikes are stored in self.spike_times (time of each spike) and self.spike_ids (index of the spiking neuron), ordered by time.
+        Spike files in event-list format are memory-mapped, so only the spikes within [t_min,t_max) are read.
+        @param indices If not None, it needs to be an array of indices of neurons of which the spikes are to be read; if None, spikes for all neurons will be read.
+        @param t_min If not None, only spikes at or after t_min are read.
+        @param t_max If not None, only spikes before t_max are read.
+        """
+        if self.manifest is not None or spike_events.has_events(self.folder):
+            times,ids=self.open_spikes()
+            start=0 if t_min is None else times.find_time(t_min)
+            stop=len(times) if t_max is None else times.find_time(t_max)
+            self.check_memory(times.nbytes(start,stop)+ids.nbytes(start,stop))
+            self.spike_times=times.rows(start,stop)
+            self.spike_ids=ids.rows(start,stop)
         else:
-            self.phases_indices=np.array(indices)
+            chunk_times=[]
+            chunk_ids=[]
+            for current_times,current_ids in spike_events.load_chunks(self.folder):
+                chunk_times.append(current_times)
+                chunk_ids.append(current_ids)
+            self.spike_times=np.concatenate(chunk_times) if chunk_times else np.zeros(0)
+            self.spike_ids=np.concatenate(chunk_ids) if chunk_ids else np.zeros(0,dtype=int)
+            selected=np.ones(len(self.spike_times),dtype=bool)
+            if t_min is not None:
+                selected&=self.spike_times>=t_min
+            if t_max is not None:
+                selected&=self.spike_times<t_max
+            self.spike_times,self.spike_ids=self.spike_times[selected],self.spike_ids[selected]
+
+        if indices is not None:
+            selected=np.in1d(self.spike_ids,indices)
+            self.spike_times,self.spike_ids=self.spike_times[selected],self.spike_ids[selected]
+
+        if indices is None:
+            self.spike_indices=np.arange(0,self.layout.offsets[-1])
+        else:
+            ## If spikes were not read for all neurons, this variable stores for which neurons the spikes were read
+            self.spike_indices=np.array(indices)
 
 
-    def compute_CV(self):
-        """
-        Computes the coefficient of variation (CV) of the inter-spike intervals (ISI) for each neuron.
-        
-        The CV is defined as standard deviation std devided by mean m, std/m.
-        @return 1-d array containing one CV value per neuron; if the value is -1, this means that there were not enough spikes (or ISIs) to compute the CV.
+    def read_phases(self,start_step=None,end_step=None,indices=None,t_min=None,t_max=None):
         """
-        vCV=[]
+        Reads phases from phases*.npy in self.folder into self.phase_array (first column: time).
 
+        The files are memory-mapped, so only the selected rows and columns are read from disk.
+        @param start_step If not None, index of the first recorded row (time step) to read.
+        @param end_step If not None, index after the last recorded row to read.
+        @param indices If not None, it needs to be an array of indices of neurons of which the phases are to be read; if None, phases for all neurons will be read.
+        If only a subset of neurons was recorded (see recording.RecordingPolicy), indices have to be among them.
+        @param t_min If not None, only rows with time at or after t_min are read.
+        @param t_max If not None, only rows with time before t_max are read.
+        """
+        phases=self.open_phases()
+
+        # neurons whose phases were recorded (numbered from 1, like self.phases_indices)
+        recorded=load_array(self.folder,PHASE_INDICES_FILE)
+        if recorded is not None:
+            recorded=recorded+1
+        columns=None
+        if indices is not None:
+            if recorded is None:
+                columns=[0]+list(indices)
+            else:
+                columns=[0]+[int(np.where(recorded==index)[0][0])+1 for index in indices]
 
-        n_no_two_spikes=0
-        n_enough_spikes=0
+        start=0 if start_step is None else start_step
+        stop=len(phases) if end_step is None else min(end_step,len(phases))
+        if t_min is not None:
+            start=max(start,phases.find_time(t_min))
+        if t_max is not None:
+            stop=min(stop,phases.find_time(t_max))
 
-        for i in range(1, self.spike_array.shape[1]):
+        self.check_memory(phases.nbytes(start,stop,None if columns is None else len(columns)))
+        ## array of the rows [t,phases] read by read_phases
+        self.phase_array=phases.rows(start,stop,columns)
 
-            ind_vec=np.where(self.spike_array[:,i])[0] #this vector gives all the rows of spikes matrix, that contain a spike of neuron i
-            vISI=np.array(self.spike_array[ind_vec[1:],0]-self.spike_array[ind_vec[:-1],0]) #this is the vector that contains all ISIs for neuron i
-            
-            if vISI.shape[0]>0:
-                n_enough_spikes+=1
-                m=vISI.mean()
-                std=vISI.std()
-                if m==0:
-                    CV=0
-                    
-                else:
-                    CV=std/m
-                    
+        if indices is None:
+            self.phases_indices=np.arange(1,self.phase_array.shape[1]) if recorded is None else recorded
+        else:
+            self.phases_indices=np.array(indices)
 
 
-                vCV.append(CV)
-                
+    def check_memory(self,nbytes):
+        """
+        Raises MemoryError if reading nbytes bytes would exceed ARRAY_MEMORY.
+        """
+        if nbytes>ARRAY_MEMORY:
+            raise MemoryError('reading %d bytes exceeds ARRAY_MEMORY, select fewer steps, a time range or fewer neurons' % nbytes)
 
-            else:
-                n_no_two_spikes+=1
-                vCV.append(-1)
 
+    def compute_CV(self,log_file=None):
+        """
+        Computes the coefficient of variation (CV) of the inter-spike intervals (ISI) for each neuron.
         
+        The CV is defined as standard deviation std devided by mean m, std/m.
+        The ISIs of all neurons are computed at once from the spikes grouped by neuron; per-population summaries are stored in self.CV_summary (see summarize_CV).
+        @param log_file If not None, name of a file to which a warning is written if not all neurons spiked often enough.
+        @return 1-d array containing one CV value per neuron; if the value is -1, this means that there were not enough spikes (or ISIs) to compute the CV.
+        """
+        # spike times grouped by neuron (ordered by time within each neuron)
+        order=np.argsort(self.spike_ids,kind='mergesort')
+        ids=self.spike_ids[order]
+        times=self.spike_times[order]
+        first=np.searchsorted(ids,self.spike_indices,side='left')
+        last=np.searchsorted(ids,self.spike_indices,side='right')
+
+        # ISIs between consecutive spikes of the same neuron, labeled with the neuron's index
+        same=ids[1:]==ids[:-1]
+        vISI=(times[1:]-times[:-1])[same]
+        isi_ids=ids[1:][same]
+        n_ids=int(max(ids.max() if len(ids) else 0,np.max(self.spike_indices) if len(self.spike_indices) else 0))+1
+
+        n_ISI=np.maximum(last-first-1,0)
+        enough=n_ISI>0
+        m=np.zeros(len(self.spike_indices))
+        std=np.zeros(len(self.spike_indices))
+        if enough.any():
+            m_ids=np.bincount(isi_ids,weights=vISI,minlength=n_ids)[self.spike_indices]
+            m[enough]=m_ids[enough]/n_ISI[enough]
+            # (two passes, deviations from the mean, as numpy.std)
+            mean_of_isi=np.zeros(n_ids)
+            mean_of_isi[self.spike_indices]=m
+            squares=np.bincount(isi_ids,weights=(vISI-mean_of_isi[isi_ids])**2,minlength=n_ids)[self.spike_indices]
+            std[enough]=np.sqrt(squares[enough]/n_ISI[enough])
+
+        CV=-np.ones(len(self.spike_indices))
+        positive=enough&(m!=0)
+        CV[enough&(m==0)]=0
+        CV[positive]=std[positive]/m[positive]
+
+        n_no_two_spikes=int((~enough).sum())
+        n_enough_spikes=int(enough.sum())
         if n_no_two_spikes>0:
-            f=open('CV_log.txt','w')
             log_s=''
 
             log_s+='WARNING: not all neurons spiked often enough to compute CV\n'
 
-            log_s+='Of '+str(self.spike_array.shape[1]-1)+' neurons, for '+str(n_no_two_spikes)+' those values could not be computed.\n'
-            log_s+='Of '+str(self.spike_array.shape[1]-1)+' neurons, for '+str(n_enough_spikes)+' those values were be computed.\n'
+            log_s+='Of '+str(len(self.spike_indices))+' neurons, for '+str(n_no_two_spikes)+' those values could not be computed.\n'
+            log_s+='Of '+str(len(self.spike_indices))+' neurons, for '+str(n_enough_spikes)+' those values were be computed.\n'
 
             print log_s
-            
 
-            f.write(log_s)
-            f.close()
-        
+            if log_file is not None:
+                with open(log_file,'w') as f:
+                    f.write(log_s)
+
+        ## per-population summaries of the last computed CVs, see summarize_CV
+        self.CV_summary=self.summarize_CV(CV)
+
+        return CV
 
-        return np.array(vCV)
 
-    def compute_rates(self,dt,shape='triangle',kw_params={'width':1.0,'height':1.0}):
+    def summarize_CV(self,CV):
+        """
+        Summarizes CVs (as returned by compute_CV) per population.
+        @param CV Array with one CV per neuron of self.spike_indices (-1: not computed).
+        @return List with one dictionary per population: 'neurons' (number of neurons of self.spike_indices in the population), 'computed' (number of them with a CV), and 'mean', 'std' and 'median' of their CVs (nan if there are none).
+        """
+        population=self.layout.population[self.spike_indices]
+        summary=[]
+        for i in range(self.layout.n_populations()):
+            values=CV[(population==i)&(CV>=0)]
+            summary.append({'neurons':int((population==i).sum()),'computed':len(values),
+                            'mean':values.mean() if len(values) else np.nan,
+                            'std':values.std() if len(values) else np.nan,
+                            'median':np.median(values) if len(values) else np.nan})
+        return summary
+
+    def compute_rates(self,dt,shape='triangle',kw_params={'width':1.0,'height':1.0},psth=None):
         """
         Compute the rates for each population with a sliding window of specified shape.
 
-        At the moment only the option 'triangle' is implemented for the shape parameter.
+        The spikes are grouped by population once; 'triangle' and 'box' are evaluated exactly at the spike times, the other shapes on spike counts binned with time step dt (see rates).
         @param dt Time step of the sliding window in periods T of the oscillators (neurons).
-        @param shape Keyword (string) defining the shape of the sliding window; only 'triangle' implemented by now.
-        @param kw_params Dictionary that holds parameters for the sliding window; for triangle it needs to specify 'width' and 'height'.
+        @param shape Keyword (string) defining the shape of the sliding window: 'triangle', 'box', 'gaussian', 'exponential' (causal) or 'alpha' (causal).
+        @param kw_params Dictionary that holds parameters for the sliding window: 'width' (half width of triangle and box, standard deviation of gaussian, time constant of exponential and alpha) and, for triangle and box, 'height'.
+        @param psth If not None, PSTH array (see read_psth) from which the rates are computed instead of the spikes; dt is then rounded to a multiple of its bin width and all shapes are averaged over the bins (see rates.psth_rates).
         @return Array holding center of sliding window (time in terms of periods T) in first row, rates for each population in following row, total rates for all internal neurons of the simulated system in last row.
         """
-        spikes_sums=[]
-        for i in range(0,self.parameters['N'].shape[0]): # for number of populations
-            sums=np.sum(self.spike_array[:,self.parameters['N'][:i].sum()+1:self.parameters['N'][:i+1].sum()+1],axis=1)
-            # sums = array of summed-up number of spikes for population i at each event (that is, point in time) 
-            spikes_sums.append(sums)
-        
-        spikes_sums.append(np.sum(self.spike_array[:,1:self.parameters['N'].sum()+1],axis=1))
-
-
-        t=np.arange(0,self.spike_array[:,0][-1],dt)
-        rates=np.zeros((t.shape[0],len(self.parameters['N'])+2))
-
-        rates[:,0]=t
-        if shape=='triangle':
-            f=lambda(delta_t): kw_params['height']*(1-np.abs(delta_t)/kw_params['width'])
-            A=kw_params['width']*kw_params['height']
-            
-            i=0
-            for t_i in t:
-                in_range=np.where((self.spike_array[:,0]<=t_i+kw_params['width']) & (self.spike_array[:,0]>=t_i-kw_params['width']))[0]
-                
-                delta_t=self.spike_array[:,0][in_range]-t_i # difference between each time stamp 'in range' and the current center of the time triangle t_i
-
-                for j in range(1,rates.shape[1]-1):
-                    tri=f(delta_t)
-                    #print tri.shape
-                    rates[i,j]=((tri*spikes_sums[j-1][in_range]).sum())/A/self.parameters['N'][j-1]
-                #rates[i,j+1]= --> for all populations
-                rates[i,j+1]=((tri*spikes_sums[j][in_range]).sum())/A/self.parameters['N'].sum()
-                i+=1
-                
-        return rates
+        if psth is not None:
+            bin_width=psth[1,0]-psth[0,0] if len(psth)>1 else dt
+            return rates.psth_rates(psth,self.parameters['N'],shape,kw_params,max(int(round(dt/bin_width)),1))
+        t=np.arange(0,self.spike_times[-1],dt)
+        return rates.population_rates(self.spike_times,self.layout.population[self.spike_ids],self.parameters['N'],t,shape,kw_params)
 
         
     def plot_rates(self,ax,rates,plot_args=[],plot_kwargs={}):
@@ -265,7 +341,7 @@ class Analyzer:
         ax.set_title('Coefficient of variation')
 
     def plot_single_spike_train(self,ax,t_indices,size,offset,plot_args=[],plot_kwargs={}):
-        return ax.vlines(self.spike_array[:,0][t_indices],offset,offset+size,*plot_args,**plot_kwargs)
+        return ax.vlines(self.spike_times[t_indices],offset,offset+size,*plot_args,**plot_kwargs)
         
     def plot_spike_trains(self,ax,indices,size=1,distance=0.0,plot_args=[],plot_kwargs={}):
         lines=[]
@@ -275,8 +351,7 @@ class Analyzer:
 
 
         for i in indices:
-            index=np.where(self.spike_indices==i)[0]+1
-            t_indices=np.where(self.spike_array[:,index]==1)[0]
+            t_indices=np.where(self.spike_ids==i)[0]
             lines.append(self.plot_single_spike_train(ax,t_indices,size,offset,plot_args,plot_kwargs))
             offset=offset+size+distance
         return lines
@@ -0,0 +1,72 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package populations
+
+The class PopulationLayout describes how the neurons of a system.System are grouped into populations.
+It is shared by system.System, system.WithOutput and output_analyzer.Analyzer, so population offsets are computed only once.
+"""
+
+import numpy as np
+
+
+class PopulationLayout(object):
+    """
+    Positions of the internal and external populations within the arrays of a system.System.
+
+    Internal neuron n belongs to population population[n], which occupies the indices offsets[i]:offsets[i+1]; the same holds for external neurons with ext_population and ext_offsets.
+    """
+
+    def __init__(self,N,N_ext=[],rates=[]):
+        """
+        @param N One-dimensional array or list containing the number of individual neurons for each population.
+        @param N_ext One-dimensional array or list containing the number of neurons for each external population.
+        @param rates List of firing rates of external inputs (one constant rate per external population).
+        """
+        self.N=np.array(N,dtype=int)
+        self.N_ext=np.array(N_ext,dtype=int)
+
+        ## offsets[i] is the index of the first neuron of population i, offsets[-1] the total number of neurons
+        self.offsets=np.concatenate([[0],np.cumsum(self.N)]).astype(int)
+        ## offsets[j] is the index of the first neuron of external population j, ext_offsets[-1] the total number of external neurons
+        self.ext_offsets=np.concatenate([[0],np.cumsum(self.N_ext)]).astype(int)
+
+        ## for each internal neuron, the index of its population
+        self.population=np.repeat(np.arange(len(self.N)),self.N)
+        ## for each external neuron, the index of its population
+        self.ext_population=np.repeat(np.arange(len(self.N_ext)),self.N_ext)
+
+        ## for each external neuron, the rate of its poissonian firing
+        self.ext_rates=np.asarray(rates,dtype=float)[self.ext_population] if len(self.N_ext) else np.zeros(0)
+
+
+    def n_populations(self):
+        """
+        @return Number of internal populations.
+        """
+        return len(self.N)
+
+
+    def slice(self,i):
+        """
+        @param i Index of an internal population.
+        @return Slice of the indices of the neurons of population i.
+        """
+        return slice(self.offsets[i],self.offsets[i+1])
+
+
+    def ext_slice(self,j):
+        """
+        @param j Index of an external population.
+        @return Slice of the indices of the neurons of external population j.
+        """
+        return slice(self.ext_offsets[j],self.ext_offsets[j+1])
+
+
+    def per_neuron(self,values):
+        """
+        Expands one value per internal population to one value per internal neuron.
+        @param values List or array with one value per population.
+        @return Array with one value per neuron.
+        """
+        return np.asarray(values,dtype=float)[self.population]
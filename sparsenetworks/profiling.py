@@ -0,0 +1,180 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package profiling
+
+The class Profiler measures where the time of a simulation goes (see the parameter profile of system.System).
+
+During a run it counts the events by type and accumulates the wall time of the steps of System.jump_to_next_event; it reports events and spikes per second and the peak memory of the output buffers of system.WithOutput, and can write these metrics periodically to a JSON-lines file (one JSON object per line, so it can be followed with tail -f).
+The steps are timed by wrapping the methods of the System, its scheduler and its engine for the duration of a run, so jump_to_next_event itself is unchanged and a System without Profiler runs without any instrumentation.
+"""
+
+import json
+from timeit import default_timer as clock
+
+from .hooks import Hook
+
+
+## Name of the metrics file in an output folder of system.WithOutput.
+METRICS_FILE='metrics.jsonl'
+
+## Types of events: arrival of internal spikes, arrival of external spikes, threshold crossing, or more than one of them at the same time.
+EVENT_TYPES=('internal','external','threshold','coincident')
+
+## Steps of System.jump_to_next_event that are timed, with the methods (of the System, its scheduler or its engine) belonging to them; the remaining time of the event loop is reported as 'other'.
+PHASES=(('scheduler',(('scheduler','pop_until'),('scheduler','set_threshold'),('scheduler','set_external'),('system','schedule_arrivals'))),
+        ('advance',(('engine','advance'),)),
+        ('delivery',(('system','epsilon'),)),
+        ('transfer',(('system','h'),)),
+        ('external_isi',(('system','get_InterSpikeInterval'),)))
+
+
+class Profiler(Hook):
+    """
+    Counters and timers of the runs of a System (a hook, see hooks); the values accumulate over all runs.
+    """
+
+    def __init__(self,metrics_file=None,report_interval=10.,check_events=1000):
+        """
+        @param metrics_file If not None, name of the JSON-lines file to which the metrics are appended during each run and at its end.
+        @param report_interval Wall time (seconds) between two lines of the metrics file.
+        @param check_events Number of events between two checks of the wall time.
+        """
+        self.metrics_file=metrics_file
+        self.report_interval=report_interval
+        self.check_events=check_events
+        ## number of events of each type (see EVENT_TYPES)
+        self.event_types=dict((name,0) for name in EVENT_TYPES)
+        ## number of events
+        self.n_events=0
+        ## number of spikes (threshold crossings)
+        self.n_spikes=0
+        ## wall time of each timed step (see PHASES)
+        self.phase_time=dict((name,0.) for name,methods in PHASES)
+        ## wall time of the runs
+        self.wall_time=0.
+        ## largest memory (bytes) of the output buffers, see observe_buffers
+        self.peak_buffer_bytes=0
+        self.file=None
+
+
+    def start(self,system,t_end):
+        self.instrument(system)
+        if self.metrics_file is not None:
+            self.file=open(self.metrics_file,'a')
+        self.run_start=clock()
+        self.last_report=self.run_start
+        self.events_at_check=self.n_events
+
+
+    def on_event(self,system):
+        if self.n_events-self.events_at_check>=self.check_events:
+            self.events_at_check=self.n_events
+            now=clock()
+            if self.file is not None and now-self.last_report>=self.report_interval:
+                self.last_report=now
+                self.write(system,now)
+
+
+    def finish(self,system):
+        now=clock()
+        self.uninstrument(system)
+        if self.file is not None:
+            self.write(system,now,final=True)
+            self.file.close()
+            self.file=None
+        self.wall_time+=now-self.run_start
+        del self.run_start
+
+
+    def observe_buffers(self,nbytes):
+        """
+        Records the current memory of the output buffers (called by system.WithOutput before a chunk is written).
+        @param nbytes Bytes held by the buffers.
+        """
+        self.peak_buffer_bytes=max(self.peak_buffer_bytes,nbytes)
+
+
+    def report(self,system=None,now=None):
+        """
+        @param system If not None, the System (its time is reported).
+        @param now Current wall clock (timeit.default_timer), if a run is in progress.
+        @return Dictionary of the metrics: 't' (system time), 'wall_time', 'events', 'spikes', 'events_per_s', 'spikes_per_s', 'event_types', 'phase_time' (including 'other': time of the event loop outside the timed steps) and 'peak_buffer_bytes'.
+        """
+        wall_time=self.wall_time
+        if now is not None and hasattr(self,'run_start'):
+            wall_time+=now-self.run_start
+        phase_time=dict(self.phase_time)
+        phase_time['other']=max(wall_time-sum(self.phase_time.values()),0.)
+        return {'t':None if system is None else float(system.t),'wall_time':wall_time,
+                'events':self.n_events,'spikes':self.n_spikes,
+                'events_per_s':self.n_events/wall_time if wall_time>0 else 0.,
+                'spikes_per_s':self.n_spikes/wall_time if wall_time>0 else 0.,
+                'event_types':dict(self.event_types),'phase_time':phase_time,
+                'peak_buffer_bytes':self.peak_buffer_bytes}
+
+
+    def write(self,system,now,final=False):
+        """
+        Appends a line with the current metrics (see report) to the metrics file.
+        """
+        metrics=self.report(system,now)
+        metrics['final']=final
+        self.file.write(json.dumps(metrics,sort_keys=True)+'\n')
+        self.file.flush()
+
+
+    def instrument(self,system):
+        """
+        Replaces the timed methods of system, its scheduler and its engine (see PHASES) by timed wrappers, and counts the events returned by the scheduler.
+        """
+        owners={'system':system,'scheduler':system.scheduler,'engine':system.engine}
+        for phase,methods in PHASES:
+            for owner,name in methods:
+                function=getattr(owners[owner],name)
+                if owner=='scheduler' and name=='pop_until':
+                    function=self._counted(function)
+                setattr(owners[owner],name,self._timed(phase,function))
+
+
+    def uninstrument(self,system):
+        """
+        Removes the wrappers of instrument.
+        """
+        owners={'system':system,'scheduler':system.scheduler,'engine':system.engine}
+        for phase,methods in PHASES:
+            for owner,name in methods:
+                if name in vars(owners[owner]):
+                    delattr(owners[owner],name)
+
+
+    def _timed(self,phase,function):
+        phase_time=self.phase_time
+        def timed(*args):
+            start=clock()
+            result=function(*args)
+            phase_time[phase]+=clock()-start
+            return result
+        return timed
+
+
+    def _counted(self,pop_until):
+        event_types=self.event_types
+        def counted(time):
+            arrivals,ext_indices,spike_id=pop_until(time)
+            internal=any(len(arrival) for arrival in arrivals)
+            external=len(ext_indices)>0
+            threshold=len(spike_id)>0
+            kinds=internal+external+threshold
+            if kinds>1:
+                event_types['coincident']+=1
+            elif internal:
+                event_types['internal']+=1
+            elif external:
+                event_types['external']+=1
+            elif threshold:
+                event_types['threshold']+=1
+            self.n_events+=1
+            self.n_spikes+=len(spike_id)
+            return arrivals,ext_indices,spike_id
+        return counted
@@ -0,0 +1,92 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package psth
+
+The class PSTHRecorder counts the spikes of each population in fixed time bins while a system.System runs (see the parameter psth_bin of System).
+
+The result is a small array with one row [bin start,spike counts of each population] per bin; rates.psth_rates (and output_analyzer.Analyzer.compute_rates with psth) turns it into population rates, so rate plots of long runs need no spike trains.
+"""
+
+import os
+import numpy as np
+
+from .hooks import Hook
+
+
+## Name of the file (in the output folder) holding the PSTH array, see PSTHRecorder.save.
+PSTH_FILE='psth.npy'
+
+
+class PSTHRecorder(Hook):
+    """
+    Spike counts per population in the bins [t_start+k*bin_width,t_start+(k+1)*bin_width); as a hook (see hooks), it adds the spikes of a System while it runs.
+    """
+
+    def __init__(self,layout,bin_width,t_start=0.):
+        """
+        @param layout populations.PopulationLayout of the System.
+        @param bin_width Width of the time bins.
+        @param t_start Start of the first bin.
+        """
+        if bin_width<=0:
+            raise ValueError('the bin width of the PSTH has to be positive')
+        self.population=layout.population
+        self.n_populations=layout.n_populations()
+        self.bin_width=bin_width
+        self.t_start=t_start
+        ## spike counts of the bins (rows) and populations (columns); grown when a spike falls behind the last row
+        self.counts=np.zeros((1024,self.n_populations),dtype=np.int64)
+        ## number of bins up to the last spike
+        self.n_bins=0
+
+
+    def add(self,t,indices):
+        """
+        Adds the spikes at time t of the neurons in indices.
+        """
+        k=int((t-self.t_start)//self.bin_width)
+        if k>=len(self.counts):
+            grown=np.zeros((max(2*len(self.counts),k+1),self.n_populations),dtype=np.int64)
+            grown[:len(self.counts)]=self.counts
+            self.counts=grown
+        if len(indices)==1:
+            self.counts[k,self.population[indices[0]]]+=1
+        else:
+            self.counts[k]+=np.bincount(self.population[indices],minlength=self.n_populations)
+        self.n_bins=max(self.n_bins,k+1)
+
+
+    def on_spike(self,system,t,indices):
+        self.add(t,indices)
+
+
+    def array(self,t_end=None):
+        """
+        @param t_end If not None, the array covers all bins starting before t_end (including empty bins at the end).
+        @return Array with one row [bin start,spike counts of each population] per bin.
+        """
+        n_bins=self.n_bins
+        if t_end is not None:
+            n_bins=max(n_bins,int(np.ceil((t_end-self.t_start)/self.bin_width)))
+        counts=np.zeros((n_bins,self.n_populations),dtype=np.int64)
+        filled=min(n_bins,len(self.counts))
+        counts[:filled]=self.counts[:filled]
+        return np.column_stack([self.t_start+np.arange(n_bins)*self.bin_width,counts])
+
+
+    def save(self,folder,t_end=None):
+        """
+        Writes array(t_end) to folder/PSTH_FILE.
+        """
+        np.save(os.path.join(folder,PSTH_FILE),self.array(t_end))
+
+
+def load(folder):
+    """
+    @return PSTH array of folder/PSTH_FILE (see PSTHRecorder.array), or None if there is none.
+    """
+    filename=os.path.join(folder,PSTH_FILE)
+    if not os.path.exists(filename):
+        return None
+    return np.load(filename)
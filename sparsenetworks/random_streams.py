@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package random_streams
+
+Random number generation for system.System.
+
+Drawing random numbers one at a time costs far more (in python overhead) than drawing them in large blocks, so the exponentially distributed inter-spike intervals of the external neurons are pre-generated in blocks and consumed from a buffer.
+"""
+
+import numpy as np
+
+
+## Number of standard exponential random numbers generated at once by an ExponentialBuffer.
+ISI_BLOCK_SIZE=2**16
+
+
+def make_rng(seed=None):
+    """
+    Creates the random number generator of a System.
+    @param seed None, an integer seed, or a random number generator (numpy.random.Generator or numpy.random.RandomState) that is used as it is.
+    @return If seed is None the global numpy.random state (so numpy.random.seed keeps working), otherwise a numpy.random.Generator (a numpy.random.RandomState for numpy versions without Generator).
+    """
+    if seed is None:
+        return np.random
+    if hasattr(seed,'standard_exponential'):
+        return seed
+    if hasattr(np.random,'default_rng'):
+        return np.random.default_rng(seed)
+    return np.random.RandomState(seed)
+
+
+class ExponentialBuffer(object):
+    """
+    Buffer of standard exponentially distributed random numbers, refilled in blocks of size block_size.
+
+    Dividing them by a rate l gives inter-spike intervals of a poissonian process with rate l, so one buffer serves all external populations.
+    """
+
+    def __init__(self,rng=np.random,block_size=ISI_BLOCK_SIZE):
+        """
+        @param rng Random number generator used to fill the buffer.
+        @param block_size Number of random numbers generated at once.
+        """
+        self.rng=rng
+        self.block_size=block_size
+        self.block=np.zeros(0)
+        ## position of the next unused number in self.block
+        self.position=0
+
+
+    def take(self,n):
+        """
+        @param n Number of random numbers.
+        @return Array of n standard exponentially distributed random numbers.
+        """
+        if self.position+n>len(self.block):
+            self.block=np.concatenate([self.block[self.position:],self.rng.standard_exponential(max(self.block_size,n))])
+            self.position=0
+        values=self.block[self.position:self.position+n]
+        self.position+=n
+        return values
+
+
+    def get_state(self):
+        """
+        @return Picklable copy of the unused numbers (for checkpoints), see set_state; the state of the generator is not included.
+        """
+        return {'block':self.block[self.position:].copy()}
+
+
+    def set_state(self,state):
+        """
+        Restores the unused numbers returned by get_state.
+        """
+        self.block=state['block'].copy()
+        self.position=0
+
+
+def rng_state(rng):
+    """
+    @param rng Random number generator as returned by make_rng.
+    @return Picklable state of rng (including its kind), see rng_from_state.
+    """
+    if rng is np.random:
+        return {'kind':'global','state':np.random.get_state()}
+    if hasattr(rng,'bit_generator'):
+        return {'kind':'generator','state':rng.bit_generator.state}
+    return {'kind':'random_state','state':rng.get_state()}
+
+
+def rng_from_state(state):
+    """
+    Creates a random number generator of the kind of a state returned by rng_state, in that state (for the global numpy.random state, the state is restored).
+    @return The random number generator.
+    """
+    if state['kind']=='global':
+        rng=np.random
+    elif state['kind']=='generator':
+        rng=np.random.Generator(getattr(np.random,state['state']['bit_generator'])())
+    else:
+        rng=np.random.RandomState()
+    set_rng_state(rng,state)
+    return rng
+
+
+def set_rng_state(rng,state):
+    """
+    Sets the state of rng (of the same kind) to a state returned by rng_state.
+    """
+    if state['kind']=='generator':
+        rng.bit_generator.state=state['state']
+    else:
+        rng.set_state(state['state'])
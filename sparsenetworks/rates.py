@@ -0,0 +1,191 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package rates
+
+Estimation of population firing rates from spikes, see output_analyzer.Analyzer.compute_rates.
+
+The rate of a population at time t is the sum of a kernel K(t-s) over the spikes s of its neurons, divided by the number of neurons; the kernels are normalized to unit area, so rates are spikes per neuron and unit time.
+- 'triangle' and 'box' are evaluated exactly at the spike times with cumulative sums over the sorted spike times: a few binary searches per time point, independent of the number of spikes in the window.
+- 'gaussian', 'exponential' (causal) and 'alpha' (causal) are evaluated on spike counts binned to the time points, convolved by FFT with the mean of the kernel over each bin; this equals the exact rate if spikes are spread uniformly within bins (the causal kernels count a spike at the first time point at or after it, never before it occurs).
+
+Binned spike counts recorded during the simulation (see psth) are converted by psth_rates, with the same bin averages for all kernels.
+"""
+
+import numpy as np
+from scipy.signal import fftconvolve
+from scipy.special import ndtr
+
+
+## Shapes of the kernels: with an exact evaluation at the spike times, and evaluated on binned spike counts.
+EXACT_KERNELS=('triangle','box')
+BINNED_KERNELS=('gaussian','exponential','alpha')
+KERNELS=EXACT_KERNELS+BINNED_KERNELS
+
+## Support of the kernels in units of their width for the evaluation on binned counts (gaussian, exponential and alpha are cut off beyond it).
+SUPPORT={'triangle':1.,'box':1.,'gaussian':6.,'exponential':20.,'alpha':25.}
+
+
+def kernel_integral(shape,x,width):
+    """
+    @param shape One of KERNELS.
+    @param x Array of lags t-s.
+    @param width Half width ('triangle','box'), standard deviation ('gaussian') or time constant ('exponential','alpha').
+    @return Integral of the kernel (normalized to unit area) from -infinity to x.
+    """
+    x=np.asarray(x,dtype=float)
+    if shape=='triangle':
+        y=np.clip(x/width,-1,1)
+        return np.where(y<0,(1+y)**2/2,1-(1-y)**2/2)
+    if shape=='box':
+        return np.clip((x/width+1)/2,0,1)
+    if shape=='gaussian':
+        return ndtr(x/width)
+    positive=np.maximum(x,0)/width
+    if shape=='exponential':
+        return 1-np.exp(-positive)
+    if shape=='alpha':
+        return 1-(1+positive)*np.exp(-positive)
+    raise ValueError('unknown kernel shape %r, available: %s' % (shape,', '.join(KERNELS)))
+
+
+def causal(shape):
+    """
+    @return True if the kernel shape only counts spikes before the time point.
+    """
+    return shape in ('exponential','alpha')
+
+
+def window_sums(times,t,shape,width,height=1.):
+    """
+    Sums of a triangle or box kernel over spikes, evaluated exactly.
+    @param times Ascending array of spike times.
+    @param t Array of time points (centers of the kernel).
+    @param shape 'triangle' (height*(1-|s-t|/width) for |s-t|<=width) or 'box' (height for |s-t|<=width).
+    @param width Half width of the kernel.
+    @param height Height of the kernel.
+    @return Array with the (not normalized) kernel sum at each time point.
+    """
+    lo=np.searchsorted(times,t-width,side='left')
+    hi=np.searchsorted(times,t+width,side='right')
+    if shape=='box':
+        return height*(hi-lo).astype(float)
+    if shape!='triangle':
+        raise ValueError('%r is not evaluated exactly, available: %s' % (shape,', '.join(EXACT_KERNELS)))
+    mid=np.searchsorted(times,t,side='right')
+    cumulative=np.concatenate([[0.],np.cumsum(times)])
+    n_left=(mid-lo).astype(float)
+    n_right=(hi-mid).astype(float)
+    # sum over s<=t of (1-(t-s)/width) and over s>t of (1-(s-t)/width)
+    left=n_left-(t*n_left-(cumulative[mid]-cumulative[lo]))/width
+    right=n_right-((cumulative[hi]-cumulative[mid])-t*n_right)/width
+    return height*(left+right)
+
+
+def bin_counts(times,labels,n_labels,t,shape,extra=0):
+    """
+    Counts spikes per label in bins around the time points t (equidistant, starting at t[0]).
+    @param times Array of spike times.
+    @param labels Array of labels (e.g. populations) of the spikes, from 0 to n_labels-1.
+    @param n_labels Number of labels.
+    @param t Array of time points.
+    @param shape Kernel shape: for causal kernels, a spike is counted at the first time point at or after it, otherwise at the nearest one.
+    @param extra Number of bins after the last time point to keep (spikes after them are dropped).
+    @return Array of shape (len(t)+extra,n_labels).
+    """
+    dt=t[1]-t[0] if len(t)>1 else 1.
+    position=(np.asarray(times)-t[0])/dt
+    bins=(np.ceil(position) if causal(shape) else np.floor(position+0.5)).astype(int)
+    n_bins=len(t)+extra
+    kept=(bins>=0)&(bins<n_bins)
+    counts=np.bincount(bins[kept]*n_labels+np.asarray(labels)[kept],minlength=n_bins*n_labels)
+    return counts.reshape(n_bins,n_labels).astype(float)
+
+
+def convolve_counts(counts,dt,shape,width,n_points=None):
+    """
+    Convolves binned spike counts with a kernel (by FFT).
+    @param counts Array of shape (bins,labels) as returned by bin_counts (with extra bins for symmetric kernels).
+    @param dt Bin width.
+    @param shape One of KERNELS.
+    @param width Width of the kernel, see kernel_integral.
+    @param n_points Number of time points of the result (default: all bins).
+    @return Array of shape (n_points,labels) with the kernel sums at the time points.
+    """
+    if n_points is None:
+        n_points=len(counts)
+    if shape not in SUPPORT:
+        raise ValueError('unknown kernel shape %r, available: %s' % (shape,', '.join(KERNELS)))
+    n_lags=min(int(np.ceil(SUPPORT[shape]*width/dt)),len(counts))
+    # a spike counted m bins before a time point has a lag in [m*dt,(m+1)*dt) (causal) or [(m-1/2)*dt,(m+1/2)*dt); its weight is the mean of the kernel over this interval, so the weights sum to one
+    if causal(shape):
+        edges=np.arange(0,n_lags+2)*dt
+        first=0
+    else:
+        edges=(np.arange(-n_lags,n_lags+2)-0.5)*dt
+        first=n_lags
+    values=np.diff(kernel_integral(shape,edges,width))/dt
+    if len(counts)==0:
+        return np.zeros((n_points,counts.shape[1]))
+    # (FFT round-off can leave tiny negative values where the kernel sum is zero)
+    return np.maximum(fftconvolve(counts,values[:,None],mode='full',axes=0)[first:first+n_points],0)
+
+
+def population_rates(times,populations,N,t,shape='triangle',kw_params={'width':1.0,'height':1.0}):
+    """
+    Rates of each population and of all neurons at the time points t.
+    @param times Ascending array of spike times.
+    @param populations Array of the populations of the spiking neurons.
+    @param N Array of the numbers of neurons of the populations.
+    @param t Array of equidistant time points.
+    @param shape Kernel shape, one of KERNELS.
+    @param kw_params Dictionary of kernel parameters: 'width' (half width of triangle and box, standard deviation of gaussian, time constant of exponential and alpha) and 'height' (triangle and box; it cancels with the normalization).
+    @return Array holding t in the first column, the rates for each population in the following columns and the total rate of all neurons in the last column.
+    """
+    if shape not in KERNELS:
+        raise ValueError('unknown kernel shape %r, available: %s' % (shape,', '.join(KERNELS)))
+    N=np.asarray(N)
+    width=kw_params['width']
+    rates=np.zeros((len(t),len(N)+2))
+    rates[:,0]=t
+    if shape in EXACT_KERNELS:
+        height=kw_params.get('height',1.0)
+        area=width*height*(1. if shape=='triangle' else 2.)
+        for i in range(len(N)):
+            rates[:,i+1]=window_sums(times[populations==i],t,shape,width,height)/area
+    elif len(t):
+        dt=t[1]-t[0] if len(t)>1 else 1.
+        extra=0 if causal(shape) else int(np.ceil(SUPPORT[shape]*width/dt))
+        rates[:,1:-1]=convolve_counts(bin_counts(times,populations,len(N),t,shape,extra),dt,shape,width,len(t))
+    return _normalize(rates,N)
+
+
+def psth_rates(psth,N,shape='triangle',kw_params={'width':1.0,'height':1.0},factor=1):
+    """
+    Rates of each population and of all neurons from binned spike counts.
+    @param psth Array with one row [bin start,spike counts of each population] per bin (equidistant bins), see psth.PSTHRecorder.array.
+    @param N Array of the numbers of neurons of the populations.
+    @param shape Kernel shape, one of KERNELS; all kernels are averaged over the bins (see convolve_counts).
+    @param kw_params Dictionary of kernel parameters, see population_rates.
+    @param factor Number of consecutive bins merged into one time step (the rest at the end is dropped).
+    @return Array as returned by population_rates; the time points are the bin centers, for the causal kernels the bin ends.
+    """
+    if shape not in KERNELS:
+        raise ValueError('unknown kernel shape %r, available: %s' % (shape,', '.join(KERNELS)))
+    N=np.asarray(N)
+    n_bins=len(psth)//factor
+    bin_width=(psth[1,0]-psth[0,0])*factor if len(psth)>1 else 1.
+    starts=psth[:n_bins*factor:factor,0]
+    counts=psth[:n_bins*factor,1:].reshape(n_bins,factor,-1).sum(axis=1).astype(float)
+    rates=np.zeros((n_bins,len(N)+2))
+    rates[:,0]=starts+(bin_width if causal(shape) else bin_width/2)
+    if n_bins:
+        rates[:,1:-1]=convolve_counts(counts,bin_width,shape,kw_params['width'],n_bins)
+    return _normalize(rates,N)
+
+
+def _normalize(rates,N):
+    # kernel sums per population -> rates per neuron, and the total rate of all neurons in the last column
+    rates[:,-1]=rates[:,1:-1].sum(axis=1)/N.sum()
+    rates[:,1:-1]/=N
+    return rates
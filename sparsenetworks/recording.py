@@ -0,0 +1,81 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package recording
+
+The class RecordingPolicy decides which phases system.WithOutput.run writes to its output.
+
+By default, the phases of all neurons are recorded after every event, as in earlier versions; a policy can instead sample them at a fixed interval of simulated time, record only a subset of neurons, skip an initial transient, or record no phases at all.
+Spikes are recorded completely, unless they are switched off (e.g. for long runs that only need the spike statistics of system.System, see spike_statistics).
+"""
+
+import numpy as np
+
+
+## Name of the file (in the output folder) holding the indices of the neurons whose phases were recorded, if they are a subset.
+PHASE_INDICES_FILE='phase_indices.npy'
+
+
+class RecordingPolicy(object):
+    """
+    Which phases are written to the phases*.npy files, and when.
+
+    With interval None, a row [t,phases] is written after every event at or after t_start.
+    With an interval, rows are written at the times t_start+k*interval (k=0,1,...) only; since phases grow with slope 1 between events, the phases at a sampling time are computed from the state after the last event before it.
+    """
+
+    def __init__(self,interval=None,indices=None,t_start=0.,phases=True,spikes=True):
+        """
+        @param interval Interval of simulated time between two recorded rows; None records a row after every event.
+        @param indices Array of indices of the neurons whose phases are recorded; None records all neurons.
+        @param t_start No phases are recorded before this time (transient).
+        @param phases If False, no phases are recorded at all (only spikes).
+        @param spikes If False, no spikes are recorded (the spike files of the output are empty).
+        """
+        if interval is not None and interval<=0:
+            raise ValueError('the recording interval has to be positive')
+        self.interval=interval
+        self.indices=None if indices is None else np.asarray(indices,dtype=int)
+        self.t_start=t_start
+        self.phases=phases
+        self.spikes=spikes
+
+
+    def n_columns(self,n_neurons):
+        """
+        @param n_neurons Total number of neurons of the System.
+        @return Number of phase columns of a recorded row (without the time column).
+        """
+        if not self.phases:
+            return 0
+        return n_neurons if self.indices is None else len(self.indices)
+
+
+    def samples(self):
+        """
+        @return True if phases are recorded at sampling times (instead of after events).
+        """
+        return self.phases and self.interval is not None
+
+
+    def first_sample(self,t):
+        """
+        @param t Current time.
+        @return Number k of the first sampling time t_start+k*interval at or after t.
+        """
+        return max(int(np.ceil((t-self.t_start)/self.interval)),0)
+
+
+    def sample_time(self,k):
+        """
+        @return k-th sampling time t_start+k*interval.
+        """
+        return self.t_start+k*self.interval
+
+
+    def records_event(self,t):
+        """
+        @param t Time of an event.
+        @return True if the phases after the event at time t are recorded.
+        """
+        return self.phases and self.interval is None and t>=self.t_start
@@ -0,0 +1,216 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package scheduler
+
+Event schedulers for system.System.
+
+A scheduler keeps every upcoming event of a simulation -- arrivals of internal spikes, arrivals of external (poissonian) spikes and predicted threshold crossings of the internal neurons -- ordered by time, so that the next event can be found without scanning all neurons.
+Any class providing the methods of HeapScheduler can be passed to system.System as scheduler.
+"""
+
+import heapq
+import itertools
+import numpy as np
+
+
+## Kinds of events held by a scheduler.
+INTERNAL=0
+EXTERNAL=1
+THRESHOLD=2
+
+
+class HeapScheduler(object):
+    """
+    One binary heap holding all events of a System, keyed by time.
+
+    Entries are tuples (time,kind,key) for external spikes and threshold crossings (key is the index of the external resp. internal neuron) and (time,kind,sequence_number,payload) for internal spike arrivals.
+    The currently valid time for each neuron is stored in external_times and threshold_times, the time of its entry in the heap in entry_times.
+    Rescheduling a neuron to an earlier time pushes a new entry and leaves the old one in the heap, where it is recognized as outdated and dropped once it reaches the top.
+    Rescheduling it to a later time only updates the stored time; the (too early) entry is moved to the stored time once it reaches the top. Inhibitory input, which delays threshold crossings, therefore costs no heap operation.
+    Finding the next event costs O(log(number of events)), independent of the number of neurons.
+    """
+
+    def __init__(self,n_neurons,n_external):
+        """
+        @param n_neurons Total number of internal neurons.
+        @param n_external Total number of external neurons.
+        """
+        self.heap=[]
+        self.sequence=itertools.count()
+
+        ## for each external neuron, the (arrival) time of its next spike (inf if none is scheduled)
+        self.external_times=np.inf*np.ones(n_external)
+        ## for each internal neuron, the predicted time at which its phase reaches the threshold (inf if none is scheduled)
+        self.threshold_times=np.inf*np.ones(n_neurons)
+        ## for each kind of event, the stored times and the times of the earliest valid heap entry of each neuron (inf if it has none)
+        self.entry_times={EXTERNAL:np.inf*np.ones(n_external),THRESHOLD:np.inf*np.ones(n_neurons)}
+        self.stored_times={EXTERNAL:self.external_times,THRESHOLD:self.threshold_times}
+
+        ## number of internal spike arrivals in the heap
+        self.n_arrivals=0
+
+        # the heap is rebuilt from the arrays above once it holds this many more entries than events
+        self.max_outdated=2*(n_neurons+n_external)+1024
+
+
+    def clear(self):
+        """
+        Removes all events.
+        """
+        self.heap=[]
+        self.n_arrivals=0
+        for kind in (EXTERNAL,THRESHOLD):
+            self.stored_times[kind][:]=np.inf
+            self.entry_times[kind][:]=np.inf
+
+
+    def get_state(self):
+        """
+        @return Picklable copy of the schedule (for checkpoints), see set_state.
+        """
+        sequence=next(self.sequence)
+        self.sequence=itertools.count(sequence)
+        return {'heap':list(self.heap),'sequence':sequence,'n_arrivals':self.n_arrivals,
+                'stored_times':dict((kind,times.copy()) for kind,times in self.stored_times.items()),
+                'entry_times':dict((kind,times.copy()) for kind,times in self.entry_times.items())}
+
+
+    def set_state(self,state):
+        """
+        Restores a schedule returned by get_state (of a scheduler with the same numbers of neurons).
+        The time arrays are overwritten in place, so references to external_times and threshold_times stay valid.
+        """
+        self.heap=list(state['heap'])
+        self.sequence=itertools.count(state['sequence'])
+        self.n_arrivals=state['n_arrivals']
+        for kind in (EXTERNAL,THRESHOLD):
+            self.stored_times[kind][:]=state['stored_times'][kind]
+            self.entry_times[kind][:]=state['entry_times'][kind]
+
+
+    def pending_arrivals(self):
+        """
+        @return List of tuples (time,payload) of all scheduled internal spike arrivals, sorted by time.
+        """
+        return [(entry[0],entry[3]) for entry in sorted(entry for entry in self.heap if entry[1]==INTERNAL)]
+
+
+    def push_arrival(self,time,payload):
+        """
+        Schedules the arrival of internal spikes.
+        @param time Arrival time.
+        @param payload Object describing the arriving spikes; it is handed back unchanged by pop_until.
+        """
+        heapq.heappush(self.heap,(time,INTERNAL,next(self.sequence),payload))
+        self.n_arrivals+=1
+
+
+    def set_external(self,indices,times):
+        """
+        (Re)schedules the next spikes of external neurons.
+        @param indices Array of (distinct) indices of external neurons.
+        @param times Array of times of their next spikes (same length as indices).
+        """
+        self._set(EXTERNAL,indices,times)
+
+
+    def set_threshold(self,indices,times):
+        """
+        (Re)schedules the predicted threshold crossings of internal neurons.
+        @param indices Array of (distinct) indices of internal neurons.
+        @param times Array of times at which their phases reach the threshold (same length as indices).
+        """
+        self._set(THRESHOLD,indices,times)
+
+
+    def _set(self,kind,indices,times):
+        indices=np.asarray(indices)
+        times=np.asarray(times,dtype=float)
+        self.stored_times[kind][indices]=times
+
+        # only neurons that are now scheduled earlier than their heap entry need a new entry
+        entry_times=self.entry_times[kind]
+        earlier=times<entry_times[indices]
+        indices=indices[earlier]
+        times=times[earlier]
+        entry_times[indices]=times
+
+        heap=self.heap
+        push=heapq.heappush
+        for key,time in zip(indices.tolist(),times.tolist()):
+            push(heap,(time,kind,key))
+
+        if len(heap)>self.max_outdated+self.n_arrivals:
+            self._rebuild()
+
+
+    def _rebuild(self):
+        """
+        Drops all outdated entries from the heap.
+        """
+        heap=[entry for entry in self.heap if entry[1]==INTERNAL]
+        for kind in (EXTERNAL,THRESHOLD):
+            stored_times=self.stored_times[kind]
+            keys=np.where(np.isfinite(stored_times))[0]
+            heap.extend(zip(stored_times[keys].tolist(),[kind]*len(keys),keys.tolist()))
+            self.entry_times[kind][:]=stored_times
+        heapq.heapify(heap)
+        self.heap=heap
+
+
+    def _is_due(self,entry):
+        """
+        Checks whether the entry at the top of the heap is an event happening at the entry's time.
+        Outdated entries are removed, entries of neurons that were rescheduled to a later time are moved to that time.
+        @return True if the entry is due, False if it was removed or moved.
+        """
+        time,kind,key=entry[:3]
+        if kind==INTERNAL:
+            return True
+        if self.entry_times[kind][key]!=time:
+            heapq.heappop(self.heap)
+            return False
+        stored_time=self.stored_times[kind][key]
+        if stored_time!=time:
+            self.entry_times[kind][key]=stored_time
+            if stored_time<np.inf:
+                heapq.heapreplace(self.heap,(stored_time,kind,key))
+            else:
+                heapq.heappop(self.heap)
+            return False
+        return True
+
+
+    def next_time(self):
+        """
+        @return Time of the next event of any kind (inf if there is none).
+        """
+        heap=self.heap
+        while heap:
+            if self._is_due(heap[0]):
+                return heap[0][0]
+        return np.inf
+
+
+    def pop_until(self,time):
+        """
+        Removes all events happening at or before time from the schedule.
+        @param time Time up to which events are removed.
+        @return Tuple (payloads,external_indices,threshold_indices): list of payloads of internal spike arrivals, array of indices of external neurons that spike and array of indices of internal neurons that reach the threshold.
+        """
+        heap=self.heap
+        payloads=[]
+        popped={EXTERNAL:[],THRESHOLD:[]}
+        while heap and heap[0][0]<=time:
+            if self._is_due(heap[0]):
+                entry=heapq.heappop(heap)
+                if entry[1]==INTERNAL:
+                    payloads.append(entry[3])
+                    self.n_arrivals-=1
+                else:
+                    popped[entry[1]].append(entry[2])
+                    self.stored_times[entry[1]][entry[2]]=np.inf
+                    self.entry_times[entry[1]][entry[2]]=np.inf
+
+        return payloads,np.array(popped[EXTERNAL],dtype=int),np.array(popped[THRESHOLD],dtype=int)
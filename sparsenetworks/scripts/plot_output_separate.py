@@ -55,7 +55,7 @@ a.read_spikes()
 
 trains_indices=[]
 for i in range(0,len(a.parameters['N'])):
-    trains_indices.append(r.sample(np.arange(a.parameters['N'][:i].sum()+1,a.parameters['N'][:i+1].sum()),30))
+    trains_indices.append(r.sample(np.arange(a.layout.offsets[i]+1,a.layout.offsets[i+1]),30))
 
 f,ax=plt.subplots(len(a.parameters['N']),1,sharex=True)
 f.subplots_adjust(left=0.1,right=0.99,bottom=0.1,top=0.9,hspace=0.01)
@@ -111,7 +111,7 @@ del rates
 
 sys.stdout.write('CV ...')
 
-CV=a.compute_CV()
+CV=a.compute_CV(folder+'/CV_log.txt')
 
 #print CV.shape
 
@@ -123,7 +123,7 @@ bins=np.linspace(0.0,2.0,40)
 
 for i in range(0,len(a.parameters['N'])):
 
-    a.plot_CV(ax,CV[a.parameters['N'][:i].sum():a.parameters['N'][:i+1].sum()],bins,hist_kwargs={'alpha':1.0-i*0.8/len(a.parameters['N']),'label':'pop '+str(i+1)})
+    a.plot_CV(ax,CV[a.layout.slice(i)],bins,hist_kwargs={'alpha':1.0-i*0.8/len(a.parameters['N']),'label':'pop '+str(i+1)})
 
 
 ax.legend()
@@ -137,7 +137,7 @@ if options['show']:
 del CV
 
 
-del a.spike_array
+del a.spike_times,a.spike_ids
 
 sys.stdout.write('\r')
 sys.stdout.write('CV done\n')
@@ -154,7 +154,7 @@ f,ax=plt.subplots(len(a.parameters['N']),1,sharex=True)
 
 #phases_indices=[]
 for i in range(0,len(a.parameters['N'])):
-    phases_indices=r.sample(np.arange(a.parameters['N'][:i].sum()+1,a.parameters['N'][:i+1].sum()+1),5)
+    phases_indices=r.sample(np.arange(a.layout.offsets[i]+1,a.layout.offsets[i+1]+1),5)
 
     for ind in phases_indices:
         a.plot_single_phase_dynamics(ax[i],ind)
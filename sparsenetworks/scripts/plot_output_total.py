@@ -49,7 +49,7 @@ a.read_spikes()
 
 f,ax=plt.subplots(1,1)
 
-a.plot_spike_trains(ax,r.sample(np.arange(1,a.spike_array.shape[1]-1),50))
+a.plot_spike_trains(ax,r.sample(np.arange(0,a.layout.offsets[-1]),50))
 
 ax.set_xlabel('$t\;[T]$',fontsize=18)
 ax.set_ylabel('spike trains',fontsize=18)
@@ -92,7 +92,7 @@ if True:
 
     sys.stdout.write('CV ...')
 
-    CV=a.compute_CV()
+    CV=a.compute_CV(folder+'/CV_log.txt')
 
     #print CV.shape
     #print VMR.shape
@@ -112,7 +112,7 @@ if True:
 
     del CV
 
-    del a.spike_array
+    del a.spike_times,a.spike_ids
 
     sys.stdout.write('\r')
     sys.stdout.write('CV done\n')
@@ -0,0 +1,17 @@
+#!/usr/bin/python
+
+"""
+Runs the benchmarks of simulation and analysis with fixed seeds and compares them with stored results, see sparsenetworks.benchmarks.
+
+Usage:
+    sn_benchmark.py baseline.json --quick
+    sn_benchmark.py results.json --quick --baseline baseline.json
+"""
+
+import sys
+## adds the upper folder to python path for this session.
+sys.path.append('..')
+
+from sparsenetworks import benchmarks
+
+sys.exit(benchmarks.main())
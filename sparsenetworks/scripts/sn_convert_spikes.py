@@ -0,0 +1,16 @@
+#!/usr/bin/python
+
+"""
+Converts the dense spike files spikes<n>.npy of older WithOutput output folders to the event-list format (spike_times<n>.npy, spike_ids<n>.npy), see sparsenetworks.spike_events.
+
+Usage:
+    sn_convert_spikes.py folder [folder ...] [--remove]
+"""
+
+import sys
+## adds the upper folder to python path for this session.
+sys.path.append('..')
+
+from sparsenetworks import spike_events
+
+sys.exit(spike_events.main())
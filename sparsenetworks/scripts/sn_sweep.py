@@ -0,0 +1,21 @@
+#!/usr/bin/python
+
+"""
+Runs WithOutput simulations for all points of a parameter grid on a pool of processes, see sparsenetworks.sweep.
+
+Example configuration file (json), for a grid of 2x2 runs:
+    {"base": {"N": [800, 800], "J_int": [[-0.6, -0.3], [-0.3, -0.6]], "I": [4, 4], "gamma": [1, 1],
+              "N_ext": [800], "J_ext": [[0.2], [0.2]], "rates": [0.1], "tau": 0.05},
+     "grid": {"K": [26, 52], "rates": [[0.1], [0.2]]}}
+
+Usage:
+    sn_sweep.py config.json out_sweep --t_end 8 --processes 8
+"""
+
+import sys
+## adds the upper folder to python path for this session.
+sys.path.append('..')
+
+from sparsenetworks import sweep
+
+sys.exit(sweep.main())
@@ -0,0 +1,133 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package spike_events
+
+Event-list format of the spike output of system.WithOutput.
+
+Chunk n of the output holds two arrays of equal length: spike_times<n>.npy (float64, the time of each spike) and spike_ids<n>.npy (integer, the index of the spiking neuron), ordered by time.
+The files of a chunk are written once, when the chunk is complete, and never changed afterwards.
+Older outputs hold dense arrays spikes<n>.npy instead (one row per spike event: time, followed by a 0/1 entry for each neuron); convert_dense_folder converts them.
+
+Command line usage:
+    python -m sparsenetworks.spike_events folder [folder ...] [--remove]
+"""
+
+import glob
+import os
+import re
+import sys
+import numpy as np
+
+
+## File name prefix of the spike times of a chunk.
+SPIKE_TIMES='spike_times'
+## File name prefix of the spiking neurons' indices of a chunk.
+SPIKE_IDS='spike_ids'
+## File name prefix of the dense spike arrays of older outputs.
+DENSE_SPIKES='spikes'
+
+
+def id_dtype(n_neurons):
+    """
+    @return Smallest of int32/int64 that holds the indices of n_neurons neurons.
+    """
+    return np.int32 if n_neurons<np.iinfo(np.int32).max else np.int64
+
+
+def chunk_files(folder,prefix):
+    """
+    @param folder Output folder.
+    @param prefix File name prefix, e.g. SPIKE_TIMES.
+    @return List of tuples (chunk number,file name) of the files prefix<n>.npy in folder, sorted by chunk number (so chunk 10 comes after chunk 2).
+    """
+    pattern=re.compile(re.escape(prefix)+r'(\d+)\.npy$')
+    files=[]
+    for filename in glob.glob(os.path.join(folder,prefix+'*.npy')):
+        match=pattern.match(os.path.basename(filename))
+        if match:
+            files.append((int(match.group(1)),filename))
+    files.sort()
+    return files
+
+
+def has_events(folder):
+    """
+    @return True if folder holds spikes in event-list format.
+    """
+    return len(chunk_files(folder,SPIKE_TIMES))>0
+
+
+def save_chunk(folder,n,times,ids):
+    """
+    Writes chunk n of the spikes.
+    @param folder Output folder.
+    @param n Chunk number.
+    @param times Array of spike times.
+    @param ids Array of indices of the spiking neurons (same length as times).
+    """
+    np.save(os.path.join(folder,SPIKE_IDS+str(n)+'.npy'),np.asarray(ids))
+    np.save(os.path.join(folder,SPIKE_TIMES+str(n)+'.npy'),np.asarray(times,dtype=float))
+
+
+def dense_to_events(spike_array):
+    """
+    @param spike_array Dense spike array (one row per spike event: time, followed by a 0/1 entry for each neuron).
+    @return Tuple (times,ids) of the spikes in event-list format.
+    """
+    rows,columns=np.nonzero(np.asarray(spike_array)[:,1:])
+    return spike_array[rows,0],columns.astype(id_dtype(spike_array.shape[1]))
+
+
+def load_chunks(folder,chunks=None):
+    """
+    Reads the spikes of folder, in event-list format or (converted in memory) from dense spike arrays.
+    @param folder Output folder.
+    @param chunks If not None, list of the chunk numbers to read.
+    @return Generator of tuples (times,ids), one per chunk.
+    """
+    if has_events(folder):
+        for (n,times_file),(m,ids_file) in zip(chunk_files(folder,SPIKE_TIMES),chunk_files(folder,SPIKE_IDS)):
+            if chunks is None or n in chunks:
+                yield np.load(times_file),np.load(ids_file)
+    else:
+        for n,filename in chunk_files(folder,DENSE_SPIKES):
+            if chunks is None or n in chunks:
+                yield dense_to_events(np.load(filename))
+
+
+def convert_dense_folder(folder,remove=False):
+    """
+    Converts the dense spike arrays spikes<n>.npy of folder to the event-list format.
+    @param folder Output folder.
+    @param remove If True, the dense files are deleted after conversion.
+    @return Number of converted chunks.
+    """
+    files=chunk_files(folder,DENSE_SPIKES)
+    for n,filename in files:
+        times,ids=dense_to_events(np.load(filename))
+        save_chunk(folder,n,times,ids)
+    if remove:
+        for n,filename in files:
+            os.remove(filename)
+    return len(files)
+
+
+def main(argv=None):
+    """
+    Command line entry point, see the description of this module.
+    """
+    import argparse
+
+    parser=argparse.ArgumentParser(description='Convert dense spikes<n>.npy files to the event-list format (spike_times<n>.npy, spike_ids<n>.npy).')
+    parser.add_argument('folders',nargs='+',help='output folders of WithOutput')
+    parser.add_argument('--remove',action='store_true',help='delete the dense files after conversion')
+    args=parser.parse_args(argv)
+
+    for folder in args.folders:
+        print('%s: %d chunks converted' % (folder,convert_dense_folder(folder,args.remove)))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package spike_statistics
+
+The class SpikeStatistics accumulates per-neuron spike statistics while a system.System runs (see the parameter spike_statistics of System), so firing rates and ISI CVs are available without storing spike trains.
+
+For each neuron it keeps the spike count, the time of the last spike and the mean and variance of the inter-spike intervals (ISI), updated with Welford's streaming algorithm.
+The CVs equal those of output_analyzer.Analyzer.compute_CV for the same spikes (up to rounding).
+"""
+
+import os
+import numpy as np
+
+from .hooks import Hook
+
+
+## Name of the file (in the output folder) holding the statistics, see SpikeStatistics.save.
+SPIKE_STATISTICS_FILE='spike_statistics.npz'
+
+
+class SpikeStatistics(Hook):
+    """
+    Running spike statistics of n neurons since time t_start; as a hook (see hooks), it adds the spikes of a System while it runs.
+    """
+
+    def __init__(self,n,t_start=0.):
+        """
+        @param n Number of neurons.
+        @param t_start Time from which spikes are counted.
+        """
+        self.t_start=t_start
+        ## time up to which spikes were counted (time of the last spike, or of the end of the last run)
+        self.t_end=t_start
+        ## number of spikes of each neuron
+        self.count=np.zeros(n,dtype=np.int64)
+        ## time of the last spike of each neuron (nan before its first spike)
+        self.last_time=np.nan*np.ones(n)
+        ## mean ISI of each neuron
+        self.isi_mean=np.zeros(n)
+        ## sum of the squared deviations of the ISIs from their mean (Welford), see isi_variance
+        self.isi_m2=np.zeros(n)
+
+
+    def add(self,t,indices):
+        """
+        Adds one spike at time t of each neuron in indices.
+        @param t Spike time (not before any earlier spike time).
+        @param indices Array of indices of the spiking neurons (without repetitions).
+        """
+        previous=self.last_time[indices]
+        spiked=self.count[indices]>0
+        if spiked.any():
+            neurons=indices[spiked]
+            isi=t-previous[spiked]
+            # Welford: the k-th ISI updates mean and squared deviations
+            k=self.count[neurons]
+            delta=isi-self.isi_mean[neurons]
+            self.isi_mean[neurons]+=delta/k
+            self.isi_m2[neurons]+=delta*(isi-self.isi_mean[neurons])
+        self.count[indices]+=1
+        self.last_time[indices]=t
+        self.t_end=t
+
+
+    def on_spike(self,system,t,indices):
+        self.add(t,indices)
+
+
+    def finish(self,system):
+        self.t_end=system.t
+
+
+    def isi_variance(self):
+        """
+        @return Variance of the ISIs of each neuron (0 for neurons with less than one ISI).
+        """
+        n_isi=np.maximum(self.count-1,1)
+        return self.isi_m2/n_isi
+
+
+    def cv(self):
+        """
+        @return Coefficient of variation (std/mean) of the ISIs of each neuron, as output_analyzer.Analyzer.compute_CV: -1 for neurons with less than two spikes, 0 if the mean ISI is 0.
+        """
+        cv=-np.ones(len(self.count))
+        enough=self.count>1
+        positive=enough&(self.isi_mean>0)
+        cv[enough]=0
+        cv[positive]=np.sqrt(self.isi_variance()[positive])/self.isi_mean[positive]
+        return cv
+
+
+    def rates(self,t_end=None):
+        """
+        @param t_end End of the observation period (default: self.t_end).
+        @return Firing rate (spikes per unit time) of each neuron between self.t_start and t_end.
+        """
+        if t_end is None:
+            t_end=self.t_end
+        duration=t_end-self.t_start
+        return self.count/duration if duration>0 else np.zeros(len(self.count))
+
+
+    def save(self,folder):
+        """
+        Writes the statistics to folder/SPIKE_STATISTICS_FILE.
+        """
+        np.savez(os.path.join(folder,SPIKE_STATISTICS_FILE),t_start=self.t_start,t_end=self.t_end,count=self.count,last_time=self.last_time,isi_mean=self.isi_mean,isi_m2=self.isi_m2)
+
+
+    @classmethod
+    def load(cls,folder):
+        """
+        @return SpikeStatistics read from folder/SPIKE_STATISTICS_FILE, or None if there is none.
+        """
+        filename=os.path.join(folder,SPIKE_STATISTICS_FILE)
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as content:
+            statistics=cls(len(content['count']),float(content['t_start']))
+            statistics.t_end=float(content['t_end'])
+            for name in ('count','last_time','isi_mean','isi_m2'):
+                setattr(statistics,name,content[name])
+        return statistics
@@ -0,0 +1,170 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package sweep
+
+Runs system.WithOutput simulations for all points of a parameter grid on a pool of processes.
+
+Each run writes to its own folder output_dir/run<k> (readable with output_analyzer.Analyzer) and uses the seed [seed,k], so every run has an independent random number stream that does not depend on the number of processes or on the order in which runs are executed.
+The file output_dir/summary.txt lists the parameters and the status of each run; it is rewritten whenever a run ends, so it is up to date even if the sweep is interrupted.
+
+Command line usage (see main):
+    python -m sparsenetworks.sweep config.json output_dir --t_end 8 --processes 8
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import numpy as np
+
+from .system import WithOutput
+
+
+## Keyword arguments of system.WithOutput that are converted to arrays when read from a configuration file.
+ARRAY_PARAMETERS=['N','J_int','J_ext']
+
+
+def parameter_grid(base,grid):
+    """
+    Lists all combinations of the values in grid.
+    @param base Dictionary of keyword arguments of system.WithOutput shared by all runs.
+    @param grid Dictionary mapping keyword arguments of system.WithOutput to lists of values (e.g. {'K':[20,40],'tau':[0.05,0.1]}).
+    @return List of dictionaries of keyword arguments, one per grid point (the last parameter in sorted order varies fastest).
+    """
+    names=sorted(grid)
+    points=[]
+    for values in itertools.product(*[grid[name] for name in names]):
+        parameters=dict(base)
+        parameters.update(zip(names,values))
+        points.append(parameters)
+    return points
+
+
+def run_sweep(base,grid,t_end,output_dir,processes=None,seed=0):
+    """
+    Runs a simulation for each point of the parameter grid.
+    @param base Dictionary of keyword arguments of system.WithOutput shared by all runs.
+    @param grid Dictionary mapping keyword arguments of system.WithOutput to lists of values, see parameter_grid.
+    @param t_end Ending time of each run.
+    @param output_dir Folder holding the folders run<k> of the runs and summary.txt.
+    @param processes Number of worker processes (default: number of cores); with 1, all runs are executed in this process.
+    @param seed Integer seed of the sweep; run k uses the seed [seed,k].
+    @return List of dictionaries (one per run, in grid order) with keys 'run', 'folder', 'status' ('finished' or 'failed'), 'wall_time' and 'error'.
+    """
+    points=parameter_grid(base,grid)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    tasks=[(k,parameters,t_end,os.path.join(output_dir,'run'+str(k)),[seed,k]) for k,parameters in enumerate(points)]
+    results=[{'run':k,'folder':task[3],'status':'pending','wall_time':np.nan,'error':''} for k,task in enumerate(tasks)]
+    write_summary(output_dir,sorted(grid),points,results)
+
+    if processes==1:
+        finished=(_run_point(task) for task in tasks)
+    else:
+        pool=multiprocessing.Pool(processes)
+        finished=pool.imap_unordered(_run_point,tasks)
+
+    for result in finished:
+        results[result['run']]=result
+        write_summary(output_dir,sorted(grid),points,results)
+
+    if processes!=1:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def write_summary(output_dir,names,points,results):
+    """
+    Writes the tab separated table output_dir/summary.txt with one line per run: run index, folder, status, wall time in seconds and the values of the parameters in names.
+    """
+    with open(os.path.join(output_dir,'summary.txt'),'w') as f:
+        f.write('\t'.join(['run','folder','status','wall_time']+names)+'\n')
+        for parameters,result in zip(points,results):
+            values=[_format(parameters[name]) for name in names]
+            f.write('\t'.join([str(result['run']),result['folder'],result['status'],'%.2f' % result['wall_time']]+values)+'\n')
+
+
+def _format(value):
+    if isinstance(value,np.ndarray):
+        value=value.tolist()
+    return json.dumps(value)
+
+
+def _run_point(task):
+    """
+    Runs the simulation of one grid point (in a worker process); its progress bar and possible errors are written to run.log in its folder.
+    @param task Tuple (run index,keyword arguments of system.WithOutput,t_end,folder,seed).
+    @return Dictionary describing the run, see run_sweep.
+    """
+    k,parameters,t_end,folder,seed=task
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    result={'run':k,'folder':folder,'status':'finished','wall_time':np.nan,'error':''}
+    stdout=sys.stdout
+    start=time.time()
+    with open(os.path.join(folder,'run.log'),'w') as log:
+        sys.stdout=log
+        try:
+            s=WithOutput(seed=seed,**parameters)
+            s.run(t_end,folder)
+        except Exception:
+            result['status']='failed'
+            result['error']=traceback.format_exc()
+            log.write('\n'+result['error'])
+        finally:
+            sys.stdout=stdout
+    result['wall_time']=time.time()-start
+    return result
+
+
+def read_config(filename):
+    """
+    Reads a sweep configuration from a json file.
+
+    The file holds an object with the entries 'base' and 'grid' (see run_sweep); the entries N, J_int and J_ext (nested lists) are converted to arrays.
+    @return Tuple (base,grid).
+    """
+    with open(filename) as f:
+        config=json.load(f)
+    base=config.get('base',{})
+    grid=config.get('grid',{})
+    for name in ARRAY_PARAMETERS:
+        if name in base:
+            base[name]=np.array(base[name])
+        if name in grid:
+            grid[name]=[np.array(value) for value in grid[name]]
+    return base,grid
+
+
+def main(argv=None):
+    """
+    Command line entry point, see the description of this module.
+    """
+    import argparse
+
+    parser=argparse.ArgumentParser(description='Run system.WithOutput simulations for all points of a parameter grid.')
+    parser.add_argument('config',help='json file with the entries "base" (keyword arguments of WithOutput) and "grid" (lists of values)')
+    parser.add_argument('output_dir',help='folder for the runs and summary.txt')
+    parser.add_argument('--t_end',type=float,default=8.,help='ending time of each run')
+    parser.add_argument('--processes',type=int,default=None,help='number of worker processes (default: number of cores)')
+    parser.add_argument('--seed',type=int,default=0,help='seed of the sweep')
+    args=parser.parse_args(argv)
+
+    base,grid=read_config(args.config)
+    results=run_sweep(base,grid,args.t_end,args.output_dir,args.processes,args.seed)
+
+    failed=[result['run'] for result in results if result['status']!='finished']
+    print('%d of %d runs finished, see %s' % (len(results)-len(failed),len(results),os.path.join(args.output_dir,'summary.txt')))
+    return 1 if failed else 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -12,18 +12,45 @@
 @package system
 
 The class System represents a model of a system of one or more populations of leaky integrate and fire neurons.
+
+Precision: with dtype=numpy.float32, phases, I_gamma, weights and the phase updates (h) are single precision, which halves their memory and the memory traffic per event.
+Times stay float64 (self.t, all scheduled events, spike times and the times of recorded phases), and threshold times are computed from the phases in float64, so the order of events is decided in double precision.
+Each phase update rounds to about 6e-8, which shifts spike times by about 1e-5 per time unit: in a network of 2x200 neurons with K=26, the spike sequence over 20 time units equals that of float64, with spike times within 1e-5.
+With many inputs per neuron, these differences grow like any small perturbation of the dynamics: with 2x2000 neurons and K=200, the spike sequences agree for about 1.4 time units (spike times within 4e-4), afterwards only statistics agree (population rates within 0.5%).
 """
 
+import sys
 import numpy as np
-from scipy.sparse import csr_matrix,lil_matrix
+from scipy.sparse import hstack
+
+from .checkpoint import connectivity_digest,load_connectivity,read_checkpoint,restore_system_state,save_connectivity,system_state,write_checkpoint
+from .container import open_file
+from .connectivity import delay_buckets,random_weight_matrix,synaptic_delays
+from .engines import ENGINES
+from .manifest import Manifest,read_manifest
+from . import numba_backend
+from . import spike_events
+from .populations import PopulationLayout
+from .random_streams import ExponentialBuffer,make_rng,rng_from_state
+from .recording import PHASE_INDICES_FILE,RecordingPolicy
+from .scheduler import HeapScheduler
+from .spike_statistics import SpikeStatistics
+from .hooks import FunctionHook
+from .profiling import METRICS_FILE,Profiler
+from .psth import PSTHRecorder
+from .writer import ChunkWriter
 
 
 ## Defines the maximum memory that's available for the phases-array. When it's full it gets written to a file and emptied.
 # We never explored the limits, but you shouldn't reserve more than half you computer's memory for this.
+# (With the background writer of WithOutput.run, it is shared by the two buffers.)
 OUTPUT_MEMORY=1.5*10**9
 
+## Maximum number of spike events held in memory by WithOutput.run; a chunk is written when it is reached, even if the phase buffer is not full.
+SPIKE_CHUNK_EVENTS=10**6
+
 
-class System:
+class System(object):
     """
     System of one or more populations of leaky integrate and fire neurons.
     Neurons share the same statistical properties among one population; they are modeled as leaky integrate and fire neurons in phase representation as in 'How chaotic is the balanced state' by Jahnke, Memmesheimer and Timme.
@@ -38,33 +65,62 @@ class System:
     # @param I List containing parameters (currents, one value per population) defining properties of the leaky integrate and fire neurons.
     # @param gamma List containing parameters (leak-factor?, one value per population) defining properties of the leaky integrate and fire neurons.
     # @param K Average number of connections all neurons of one population receive from any other population.
-    # @param tau Delay between sending and receiving an (internal) spike.
-    def __init__(self,N=np.array([400,100]),J_int=None,I=[1.,1.],gamma=[0.2,0.2],K=80,tau=0.05,N_ext=[],J_ext=np.array([]),rates=[]):
+    # @param tau Delay between sending and receiving an (internal) spike: a number, a two-dimensional array of delays per population pair (tau[k,l] for connections from population l to population k), or a function tau(k,l,n,rng) drawing the delays of n connections from population l to population k (see connectivity.synaptic_delays).
+    # @param scheduler Class (or factory) of the event scheduler, called with the total numbers of internal and external neurons; defaults to scheduler.HeapScheduler.
+    # @param fixed_in_degree If True, each neuron receives exactly the average number of connections from each population instead of a binomially distributed number (see connectivity.random_weight_matrix).
+    # @param seed Seed (integer) or random number generator (numpy.random.Generator) for all random numbers of this System; if None, the global numpy.random state is used.
+    # @param engine Representation of the phases, 'eager' (all phases are shifted at each event) or 'lazy' (phases relative to a global clock, O(K) per event), see engines.
+    # @param backend 'python' or 'numba'; with 'numba', run uses the compiled event loop of numba_backend (falls back to 'python' if numba is not installed).
+    # @param delay_step If not None, synaptic delays are rounded to multiples of delay_step; connections with equal delays form one delay bucket (see delays), so continuous delay distributions need a delay_step.
+    # @param spike_statistics If True, per-neuron spike counts, last spike times and ISI means and variances are accumulated during the simulation in self.spike_statistics (see spike_statistics.SpikeStatistics); like all hooks, it needs the python loop (see run).
+    # @param psth_bin If not None, the spikes of each population are counted in time bins of this width during the simulation in self.psth (see psth.PSTHRecorder); like all hooks, it needs the python loop (see run).
+    # @param profile If True, events are counted by type and the steps of jump_to_next_event are timed in self.profiler (see profiling.Profiler); like all hooks, it needs the python loop (see run).
+    # @param dtype dtype of the phases, of I_gamma and of the weights, numpy.float64 or numpy.float32 (see the description of this module); times are always float64.
+    def __init__(self,N=np.array([400,100]),J_int=None,I=[1.,1.],gamma=[0.2,0.2],K=80,tau=0.05,N_ext=[],J_ext=np.array([]),rates=[],scheduler=None,fixed_in_degree=False,seed=None,engine='eager',backend='python',delay_step=None,spike_statistics=False,psth_bin=None,profile=False,dtype=np.float64):
         self.N=np.array(N)
         self.N_ext=np.array(N_ext)
         self.tau=tau
+        self.fixed_in_degree=fixed_in_degree
+
+        if np.dtype(dtype) not in (np.dtype(np.float64),np.dtype(np.float32)):
+            raise ValueError('dtype has to be float64 or float32')
+        ## dtype of the phases, I_gamma and the weights
+        self.dtype=np.dtype(dtype)
+
+        if backend=='numba' and not numba_backend.NUMBA_AVAILABLE:
+            print('WARNING: numba is not installed, using the python backend')
+            backend='python'
+        ## 'python' or 'numba', see run
+        self.backend=backend
+
+        ## random number generator used for initial phases, connectivity and external spikes
+        self.rng=make_rng(seed)
+        ## pre-generated standard exponential random numbers for the external neurons' inter-spike intervals
+        self.isi_buffer=ExponentialBuffer(self.rng)
+
+        ## offsets, neuron->population maps and per-neuron external rates of all populations
+        self.layout=PopulationLayout(self.N,self.N_ext,rates)
 
         ## Holds an array of size N (total number of neurons) containing paraters I and gamma for each neuron.
-        self.I_gamma=np.ones((2,self.N.sum()))
+        # (first row I[i], second row gamma[i] of the population i of each neuron)
+        self.I_gamma=np.array([self.layout.per_neuron(I),self.layout.per_neuron(gamma)],dtype=self.dtype)
 
-        #for each population...
-        for i in range(0,self.N.shape[0]):
-            if i==0:
-                index_i=0
-            else:
-                index_i=self.N[:i].sum()
-            # ... set value in first column to I[i] and in second column to gamma[i]
-            self.I_gamma[0,index_i:index_i+self.N[i]]=self.I_gamma[0,index_i:index_i+self.N[i]]*I[i]
-            self.I_gamma[1,index_i:index_i+self.N[i]]=self.I_gamma[1,index_i:index_i+self.N[i]]*gamma[i]
-            
         self.t=0
-        self.events=[]
+
+        ## holds the phases of all neurons, see phases
+        self.engine=ENGINES[engine](self.N.sum(),self.dtype)
+
+        if scheduler is None:
+            scheduler=HeapScheduler
+        ## holds all upcoming events (arrivals of internal and external spikes, threshold crossings) ordered by time
+        self.scheduler=scheduler(self.N.sum(),self.N_ext.sum())
+        self.spike_event=None
 
         ## one rate value per external population
         self.rates=rates
 
-        ## for each external neuron, holds the (arrival) time of its next spike  
-        self.external_events=np.ones(self.N_ext.sum())
+        ## for each external neuron, holds the (arrival) time of its next spike (kept up to date by self.scheduler)
+        self.external_events=self.scheduler.external_times
         
         # compute initial inter-spike intervals (for each neuron, time when next spike arrives at internal population)
         self.get_initial_ISI()
@@ -73,8 +129,31 @@ class System:
         # create random initial phases between 0 and 1
         self.create_phases()
 
+        W_int=self.create_weight_matrix(J_int,K).astype(self.dtype,copy=False)
+        W_ext=self.create_ext_weight_matrix(J_ext,K).astype(self.dtype,copy=False)
         ## weight matrix, representing the connections and their strengths from any neuron to any other neuron
-        self.weight_matrix=csr_matrix(np.concatenate([self.create_weight_matrix(J_int,K),self.create_ext_weight_matrix(J_ext,K)],1))
+        self.weight_matrix=hstack([W_int,W_ext],format='csr')
+
+        ## delays of the delay buckets; the spikes of internal neurons arrive at their targets after delays[b] via the connections in bucket b
+        self.delays,buckets=self.create_delay_buckets(W_int.tocsc(),tau,delay_step)
+        ## column-oriented weight matrix with the connections of each delay bucket in its own block of columns (column b*N.sum()+j holds the connections of neuron j in bucket b), followed by the columns of the external neurons; the outgoing connections of a neuron are stored contiguously, see epsilon
+        self.weight_columns=hstack(buckets+[W_ext],format='csc')
+
+        if self.backend=='numba' and len(self.delays)>1:
+            print('WARNING: the numba backend supports a single delay only, using the python backend')
+            self.backend='python'
+
+        ## hooks called during every run (see hooks and add_hook)
+        self.hooks=[]
+        ## spike_statistics.SpikeStatistics of all neurons since the start (a hook), None if not requested
+        self.spike_statistics=SpikeStatistics(self.N.sum(),self.t) if spike_statistics else None
+        ## psth.PSTHRecorder counting the spikes of each population in bins of width psth_bin (a hook), None if not requested
+        self.psth=PSTHRecorder(self.layout,psth_bin,self.t) if psth_bin is not None else None
+        ## profiling.Profiler of the runs (a hook), None if not requested
+        self.profiler=Profiler() if profile else None
+        for hook in (self.spike_statistics,self.psth,self.profiler):
+            if hook is not None:
+                self.add_hook(hook)
 
 
 
@@ -82,225 +161,161 @@ class System:
         """
         One step of simulation; searches for and handles the next event.
 
-        Checks whether the next event is the arrival of one or more internal/external spikes or the reset and spike of one or more neurons.
+        The next event is taken from self.scheduler; it is the arrival of one or more internal/external spikes, the reset and spike of one or more neurons, or both at the same time.
         Updates system time self.t by the difference dt between current time and the event found to happen next.
         """
 
+        # time of the next event; threshold crossings can lie in the past, if a previous spike caused a phase to exceed 1, they are handled right away
+        t_event=max(self.scheduler.next_time(),self.t)
+        dt=t_event-self.t
 
-        # location holds the information of which spikes are found to be the next event
-        location=0 # 0 for no spike, 1 for internal, 2 for external, 3 for internal and external simultaneously
+        # arrivals = index arrays of internal neurons whose spikes arrive at t_event, ext_indices = external neurons spiking at t_event, spike_id = neurons reaching the threshold at t_event
+        arrivals,ext_indices,spike_id=self.scheduler.pop_until(t_event)
 
-        ## set dt (time to next event) to a random too large value ... this will only be used for comparison with time to next emission of spike if there are no other (already emitted) spikes to consider at all
-        dt=500.0
+        # update phases with temporal difference dt and system time by dt (new ISIs of external neurons are drawn relative to t_event)
+        engine=self.engine
+        engine.advance(dt)
+        self.t=t_event
 
-        if len(self.events): # events=[] --> events=[(time_of_arrival,spike_vector),....,]
-            dt=self.events[0][0]-self.t
-            location=1
+        ## [spike_time,spike_indices] of the spikes emitted during the last call of jump_to_next_event, None if no neuron spiked
+        self.spike_event=None
 
+        if len(spike_id): # True if any phase reaches threshold
 
-        ##check for external event
-        if self.external_events.any(): # if there is at least one external event ...
-            min_dt=self.external_events.min()-self.t # check when it will occur
-            if min_dt<dt:
-                dt=min_dt
-                location=2
-            elif min_dt==dt:
-                location=3
-            
-        # from here on: min_dt = time until the next phase reaches the threshold without any incoming spikes.
-        min_dt=1-self.phases.max()
-        
-        if min_dt<dt: # True if any phase reaches threshold before a spike arrives.
-            
-            
-            # min_dt can be smaller than 0, if a previous spike caused a phase to exceed 1
-            dt=max(min_dt,0) 
+            # set phases of neurons that spiked to 0
+            engine.set(spike_id,0.0)
+            self.scheduler.set_threshold(spike_id,np.ones(len(spike_id))*(t_event+1))
 
-            # update phases with temporal difference dt
-            
-            self.phases=self.phases+dt 
-            
-            
-            # find phases that exceed 1
-            spike_id=np.where(self.phases>=1.0)
-            # create an array with 1 for each neuron that spikes, 0 else
-            spikes=np.zeros_like(self.phases)
-            spikes[spike_id]=1.0
-
-            # set phases of neurons that spiked to 0        
-            self.phases=self.phases-spikes*self.phases
-            # append spike vector to list of events
-            self.events.append([self.tau+self.t+dt,spikes]) #the spike vector [which refers to spikes that happen at self.t+dt] is saved at time self.t+dt+tau [which is already the receiving time]
-            
-        
-        elif min_dt==dt: # True if time of next spike arrivals equals time of next phase reaching threshold
-            
-            # indices of neurons that reach thresholds next
-            neuron_id=np.where(self.phases==self.phases.max())[0] 
-            
-            # min_dt can be smaller than 0, if a previous spike caused a phase to exceed 1
-            dt=max(min_dt,0)
-            self.phases=self.phases+dt
-            
-            # find phases that exceed 1
-            spike_id=np.where(self.phases>=1.0)
-            # create an array with 1 for each neuron that spikes, 0 else
-            spikes=np.zeros_like(self.phases)
-            spikes[spike_id]=1.0
+            # the indices of the neurons [which spike at t_event] are scheduled at time t_event+delay [which is already the receiving time], once per delay bucket
+            self.schedule_arrivals(t_event,spike_id)
+            self.spike_event=[t_event,spike_id]
 
-            # set phases of neurons that spiked to 0
-            self.phases=self.phases-spikes*self.phases
-            # append spike vector to list of events
-            self.events.append([self.tau+self.t+dt,spikes]) #the spike vector [which refers to spikes that happen at self.t+dt] is saved at time self.t+dt+taum [which is already the receiving time]
+        if len(arrivals) or len(ext_indices): # True if spikes arrive
 
-            
-            if location==1: # if next event is an internal spike
+            # draw new ISIs for the external neurons that spiked, each with the rate of its population
+            self.scheduler.set_external(ext_indices,self.get_InterSpikeInterval(self.layout.ext_rates[ext_indices]))
 
-                # get the whole spike vector (concatenated from internal and external spikes)
-                # (in this case, external spikes is a 0-array)
-                spike_vector=np.concatenate([self.events.pop(0)[1],np.zeros(self.N_ext.sum())])
+            # get the indices of all arriving spikes (columns of self.weight_columns: internal neurons of each delay bucket first, external neurons after them)
+            spike_indices=np.concatenate(arrivals+[ext_indices+len(self.delays)*self.layout.offsets[-1]])
 
-            elif location==2: # if next event is an external spike
+            # calculate change in voltage (epsilon) for each neuron receiving one of the spikes
+            targets,epsilon=self.epsilon(spike_indices)
+            # update phases of those neurons using transfer function h
+            engine.set(targets,self.h(epsilon,targets))
 
-                
-                ext_vect=np.zeros(self.N_ext.sum()) # create an empty array to contain possible external spikes
-                indices=np.where(self.external_events==self.t+dt)[0] # find all external spikes arriving at t+dt (their indices in the external populations)
-                for index in indices: # for each external neurons that is spiking ...
-                    ext_vect[index]=1 # ... set value to one in the vector of external spikes 
-                    
-                    # keeps track with which rate to draw a new ISI
-                    rate_index=None 
-                    for i in range(1,len(self.rates)+1):
-                        if index < self.N_ext[:i].sum():
-                            rate_index=i-1
-                            break
-                    
-                    # draw new ISI for external neuron index
-                    self.external_events[index]=self.get_InterSpikeInterval(self.rates[rate_index])
-                
-                # get the whole spike vector (concatenated from internal and external spikes)
-                # (in this case, internal spikes is a 0-array)
-                spike_vector=np.concatenate([np.zeros(self.N.sum()),ext_vect])
-
-            elif location==3: # if external and internal spikes arrive at the same time
-
-                # create an empty array to contain possible external spikes
-                ext_vect=np.zeros(self.N_ext.sum()) 
-                # find all external spikes arriving at t+dt (their indices in the external populations)
-                indices=np.where(self.external_events==self.t+dt)[0] 
-
-                for index in indices: # for each external neurons that is spiking ...
-                    ext_vect[index]=1 # ... set value to one in the vector of external spikes 
-                    
-                    # keeps track with which rate to draw a new ISI
-                    rate_index=None
-                    for i in range(1,len(self.rates)+1):
-                        if index < self.N_ext[:i].sum():
-                            rate_index=i-1
-                            break
-                    
-                    # draw new ISI
-                    self.external_events[index]=self.get_InterSpikeInterval(self.rates[rate_index])
-
-                # get the whole spike vector (concatenated from internal and external spikes)
-                spike_vector=np.concatenate([self.events.pop(0)[1],ext_vect])
-                
-            # calculate change in voltage (epsilon) for each neuron
-            epsilon=self.epsilon(spike_vector)   
-            # update phases using transfer function h
-            self.phases=self.h(epsilon)
+            #if the received spike is elicting another spike immediatley we neglet this further spike
+            refractory=spike_id[engine.get(spike_id)>1]
+            engine.set(refractory,0.0)
 
-            
-            for i in range(len(neuron_id)):
-                if self.phases[neuron_id[i]]>1:  #if the received spike is elicting another spike immediatley we neglet this further spike
-                    self.phases[neuron_id[i]]=0
-                    
+            # neurons that received input reach the threshold at a different time now (computed in float64, also for float32 phases)
+            self.scheduler.set_threshold(targets,t_event+1-np.asarray(engine.get(targets),dtype=float))
 
-        else: # next spikes arrive before a neuron reaches its threshold on its own
-            
 
-            self.phases=self.phases+dt
-            
-            
 
-            # next spike is an internal spike ... 
-            if location==1: 
-                # ... so the external part is a 0-array
-                spike_vector=np.concatenate([self.events.pop(0)[1],np.zeros(self.N_ext.sum())])
+    ## Phases of all neurons at the current system time self.t (array with one entry per neuron).
+    # Assigning an array sets all phases.
+    @property
+    def phases(self):
+        return self.engine.get_all()
 
-            # next spike is an external spike ...
-            elif location==2:
+    @phases.setter
+    def phases(self,phases):
+        self.engine.set_all(phases)
 
-                
-                ext_vect=np.zeros(self.N_ext.sum())
-                indices=np.where(self.external_events==self.t+dt)[0]
-                for index in indices:
-                    ext_vect[index]=1
-                    
-                    rate_index=None
-
-                    for i in range(1,len(self.rates)+1):
-                        if index < self.N_ext[:i].sum():
-                            rate_index=i-1
-                            break
-                    
-                    self.external_events[index]=self.get_InterSpikeInterval(self.rates[rate_index])
-                
-                # ... so the internal part is empty
-                spike_vector=np.concatenate([np.zeros(self.N.sum()),ext_vect])
-
-
-            # next external and internal spikes arrive at same time
-            elif location==3:
-
-                ext_vect=np.zeros(self.N_ext.sum())
-                indices=np.where(self.external_events==self.t+dt)[0]
-                for index in indices:
-                    ext_vect[index]=1
-                    
-                    rate_index=0
-                    for i in range(1,len(self.rates)+1):
-                        if index < self.N_ext[:i].sum():
-                            rate_index=i-1
-                            break
-                    
-                    self.external_events[index]=self.get_InterSpikeInterval(self.rates[rate_index])
-                spike_vector=np.concatenate([self.events.pop(0)[1],ext_vect])
-                
 
-            epsilon=self.epsilon(spike_vector)   
-            self.phases=self.h(epsilon)
+    ## Run the simulation until system time self.t exceeds t_end.
+    # With backend 'numba' the whole loop runs compiled in numba_backend.run (which requires the default scheduler); hooks need the python loop, so with hooks the python backend is used.
+    # Without hooks, the loop only calls jump_to_next_event.
+    # @param t_end Ending time of the run.
+    # @param hooks List of hooks (see hooks) called in this run, in addition to self.hooks.
+    # @return True if a hook stopped the run before t_end, False otherwise.
+    def run(self,t_end=1,hooks=None):
+        hooks=self.hooks+list(hooks or [])
+        if not hooks:
+            if self.backend=='numba':
+                numba_backend.run(self,t_end)
+                return False
+            while self.t<t_end:
+                self.jump_to_next_event()
+            return False
+        if self.backend=='numba':
+            print('WARNING: the numba backend does not call hooks, using the python loop for this run')
+
+        event_hooks=[hook.on_event for hook in hooks if hook.on_event is not None]
+        spike_hooks=[hook.on_spike for hook in hooks if hook.on_spike is not None]
+        # [hook,number of its next sampling time] of the hooks called at intervals
+        interval_hooks=[[hook,hook.first_sample(self.t)] for hook in hooks if hook.on_interval is not None]
+
+        for hook in hooks:
+            if hook.start is not None:
+                hook.start(self,t_end)
+        stopped=False
+        try:
+            while self.t<t_end and not stopped:
+
+                if interval_hooks:
+                    # sampling times before the next event (the phases grow with slope 1 until then)
+                    t_next=min(max(self.scheduler.next_time(),self.t),t_end)
+                    for sampling in interval_hooks:
+                        hook=sampling[0]
+                        t_sample=hook.t_start+sampling[1]*hook.interval
+                        while t_sample<t_next and not stopped:
+                            stopped=bool(hook.on_interval(self,t_sample))
+                            sampling[1]+=1
+                            t_sample=hook.t_start+sampling[1]*hook.interval
+                    if stopped:
+                        break
 
+                self.jump_to_next_event()
 
+                if self.spike_event is not None:
+                    for on_spike in spike_hooks:
+                        if on_spike(self,self.spike_event[0],self.spike_event[1]):
+                            stopped=True
+                for on_event in event_hooks:
+                    if on_event(self):
+                        stopped=True
+        finally:
+            for hook in hooks:
+                if hook.finish is not None:
+                    hook.finish(self)
+        return self.t<t_end
 
-        # update system time by difference dt between this event and the last event (old system time).
-        self.t+=dt 
 
+    ## Adds a hook (see hooks) called during every run.
+    def add_hook(self,hook):
+        self.hooks.append(hook)
 
 
-    ## Run the simulation until system time self.t exceeds t_end.
-    # @param t_end Ending time of the run.
-    def run(self,t_end=1):
-        while self.t<t_end:
-            self.jump_to_next_event()
+    ## Removes a hook added by add_hook.
+    def remove_hook(self,hook):
+        self.hooks.remove(hook)
      
             
     ## Update phases according to function H_epsilon(phi) as in 'How chaotic is the balanced state' by Jahnke, Memmesheimer and Timme.
 
     # H(phi,epsilon)=U^-1[U(phi)+epsilon]
-    # @param epsilon Change/jump in potential for each neuron (vector/array with one entry per neuron).
-    # @return Updated phases.
-    def h(self,epsilon):
-        
+    # @param epsilon Change/jump in potential for each neuron (vector/array with one entry per neuron, or per entry of indices).
+    # @param indices If not None, array of indices of the neurons epsilon refers to; only their phases are updated.
+    # @return Updated phases (of all neurons, or of the neurons in indices).
+    def h(self,epsilon,indices=None):
+
+        if indices is None:
+            indices=slice(None)
+            phases=self.phases
+        else:
+            phases=self.engine.get(indices)
+        I=self.I_gamma[0,indices]
+        gamma=self.I_gamma[1,indices]
 
         # compute the argument to the logarithm
-        log_arg=np.exp(-self.I_gamma[1,:]*self.phases)-self.I_gamma[1,:]/self.I_gamma[0,:]*epsilon
+        log_arg=np.exp(-gamma*phases)-gamma/I*epsilon
         # find those that are invalid arguments for the logarithm
         too_large=np.where(log_arg<=0)[0]
         # set those invalid to some valid value
-        log_arg[too_large]=1.0        
+        log_arg[too_large]=1.0
         # update phases according to H(.)
-        updated_phases=-1./self.I_gamma[1,:]*np.log(log_arg)
+        updated_phases=-1./gamma*np.log(log_arg)
 
         # change those that were invalid before to a value above threshold
         updated_phases[too_large]=1.1
@@ -308,30 +323,57 @@ class System:
         return updated_phases
 
 
-    ## Gets the change of the potential for each neuron caused by internal spikes.
-    # @param spike_vector Vector of spikes; one entry per neuron (=1 if the neuron spikes, =0 if it does not).
-    # @return epsilon=change in potential for each neuron.
-    def epsilon(self,spike_vector):
-        return self.weight_matrix.dot(spike_vector)
+    ## Schedules the arrivals of spikes emitted at time t_spike, one arrival per delay bucket.
+    # With more than one bucket, buckets without connections of the spiking neurons are skipped.
+    # @param t_spike Time of the spikes.
+    # @param spike_id Array of indices of the spiking neurons.
+    def schedule_arrivals(self,t_spike,spike_id):
+        if len(self.delays)==1:
+            self.scheduler.push_arrival(t_spike+self.delays[0],spike_id)
+            return
+        indptr=self.weight_columns.indptr
+        for b,delay in enumerate(self.delays):
+            columns=spike_id+b*self.layout.offsets[-1]
+            columns=columns[indptr[columns+1]>indptr[columns]]
+            if len(columns):
+                self.scheduler.push_arrival(t_spike+delay,columns)
+
+
+    ## Gets the change of the potential caused by spikes of internal and external neurons.
+    # Only the columns of the spiking neurons are read from self.weight_columns, so the cost scales with the number of spikes times the number of their connections.
+    # @param spike_indices Array of indices of the spiking neurons (columns of self.weight_columns; neuron j has index b*N.sum()+j in delay bucket b, external neuron j has index len(self.delays)*N.sum()+j); an index may occur more than once.
+    # @return Tuple (targets,epsilon): array of indices of the neurons receiving any of the spikes and the change in potential epsilon for each of them.
+    def epsilon(self,spike_indices):
+        W=self.weight_columns
+        starts=W.indptr[spike_indices]
+        lengths=W.indptr[spike_indices+1]-starts
+
+        if len(spike_indices)==1:
+            return W.indices[starts[0]:starts[0]+lengths[0]],W.data[starts[0]:starts[0]+lengths[0]]
+
+        # positions of all entries of the spiking neurons' columns in W.indices and W.data
+        offsets=np.cumsum(lengths)-lengths
+        positions=np.arange(lengths.sum())+np.repeat(starts-offsets,lengths)
+
+        targets,inverse=np.unique(W.indices[positions],return_inverse=True)
+        # (bincount sums in float64)
+        return targets,np.bincount(inverse,weights=W.data[positions],minlength=len(targets)).astype(W.dtype,copy=False)
 
     ## Draws a random inter-spike interval according to given rate, and already adds it up to current system time.
-    # @param l_i Rate of the poissonian firing of the neuron for which the next spiking time is drawn.
-    # @return Time of next spike.
+    # The intervals are taken from self.isi_buffer.
+    # @param l_i Rate of the poissonian firing of the neuron for which the next spiking time is drawn; if it is an array of rates, one interval is drawn for each entry.
+    # @return Time of next spike (array of times, if l_i is an array).
     def get_InterSpikeInterval(self,l_i):
-        return self.t-1./l_i*np.log(np.random.rand())
+        if np.ndim(l_i):
+            return self.t+self.isi_buffer.take(len(l_i))/l_i
+        return self.t+self.isi_buffer.take(1)[0]/l_i
 
 
     def get_initial_ISI(self):
         """
         Fills self.external_events with initial (arrival) times of each external neurons' spikes.
         """
-        for n in range(0,len(self.N_ext)):
-            if n==0:
-                index_i=0
-            else:
-                index_i=self.N_ext[:n].sum()
-            for i in range(0,self.N_ext[n]):
-                self.external_events[index_i+i]=self.get_InterSpikeInterval(self.rates[n])
+        self.scheduler.set_external(np.arange(self.layout.ext_offsets[-1]),self.get_InterSpikeInterval(self.layout.ext_rates))
 
 
 
@@ -341,85 +383,58 @@ class System:
         Creates an initial random phase for each neuron.
         """
         N=self.N.sum()
-        self.phases=np.random.rand(N)
+        self.phases=self.rng.uniform(size=N)
+        # without input, phases grow with slope 1 and reach the threshold 1 after 1-phase (of the stored phases, which may be float32)
+        self.scheduler.set_threshold(np.arange(N),self.t+1-np.asarray(self.phases,dtype=float))
+
+
+    def create_delay_buckets(self,W,tau,delay_step=None):
+        """
+        Assigns a delay to each internal connection and groups the connections by delay.
+
+        Each delay bucket holds its own sparse sub-matrix, so an arriving spike only reads its connections with the arriving delay, and memory does not grow with the number of distinct delays (apart from one column pointer array per bucket).
+        @param W Weight matrix of the internal connections (scipy.sparse.csc_matrix).
+        @param tau Number, array of delays per population pair or function drawing delays, see System.
+        @param delay_step If not None, delays are rounded to multiples of delay_step.
+        @return Tuple (delays,matrices): array of the delays of the buckets and list of their sub-matrices of W.
+        """
+        if np.ndim(tau)==0 and not callable(tau):
+            return np.array([float(tau)]),[W]
+        return delay_buckets(W,synaptic_delays(W,self.layout.population,tau,delay_step,self.rng))
 
 
     def create_ext_weight_matrix(self,J_ext,K):
         """
         Creates the external weight matrix, that is, weight of connections from each external neuron to each internal neuron.
-        
-        First, a matrix of random values between 0 and 1 of appropriate size is created. Then, depending on K and the resulting probability to have a connection, the values in the random matrix are set either to 1 or 0 (connection or no connection).
+
+        Depending on K, the resulting probability to have a connection and self.fixed_in_degree, the presynaptic external neurons of each internal neuron are sampled directly (see connectivity.random_weight_matrix), so memory and time scale with the number of connections.
         The connections' weights are then set according to J_ext.
         @param J_ext Array of connection strength, J_ext[j,i] refers to connections from external population i to internal population j.
         @param K Average number of connections one neuron receives from neurons from any other population.
-        @return External weight matrix.
+        @return External weight matrix (scipy.sparse.csr_matrix).
         """
-        r=np.random.rand(self.N.sum(),self.N_ext.sum())
-
-        for i in range(0,self.N.shape[0]):
-
-            if i==0:
-                index_i=0
-            else:
-                index_i=self.N[:i].sum()
-            p_i=float(K)/self.N[i]
-        
-            r[index_i:index_i+self.N[i],:]=np.ones(r[index_i:index_i+self.N[i],].shape)-(r[index_i:index_i+self.N[i],]+(1-p_i)).astype(int)
-        
-            
-            for j in range(0,self.N_ext.shape[0]):
+        return random_weight_matrix(self.N,self.N_ext,J_ext,K,self.fixed_in_degree,self.rng)
 
-                if j==0:
-                    index_j=0
-                else:
-                    index_j=self.N_ext[:j].sum()
-                
-                r[index_i:index_i+self.N[i],index_j:index_j+self.N_ext[j]]=r[index_i:index_i+self.N[i],index_j:index_j+self.N_ext[j]]*J_ext[i,j]
-        return r
-        
 
     def create_weight_matrix(self,J_int,K):
         """
         Creates the weight matrix, that is, weight of connections from any internal neuron to each internal neuron.
 
-        First, a matrix of random values between 0 and 1 of appropriate size is created. Then, depending on K and the resulting probability to have a connection, the values in the random matrix are set either to 1 or 0 (connection or no connection).
-        The connections' weights are then set according to J_ext.
-        @param J_ext Array of connection strength, J_ext[j,i] refers to connections from external population i to internal population j.
+        Depending on K, the resulting probability to have a connection and self.fixed_in_degree, the presynaptic neurons of each neuron are sampled directly (see connectivity.random_weight_matrix), so memory and time scale with the number of connections.
+        The connections' weights are then set according to J_int.
+        @param J_int Array of connection strength, J_int[j,i] refers to connections from internal population i to internal population j.
         @param K Average number of connections one neuron receives from neurons from any other population.
-        @return Weight matrix.
+        @return Weight matrix (scipy.sparse.csr_matrix).
         """
-        r=np.random.rand(self.N.sum(),self.N.sum())
+        return random_weight_matrix(self.N,self.N,J_int,K,self.fixed_in_degree,self.rng)
 
-        for i in range(0,self.N.shape[0]):
-
-            if i==0:
-                index_i=0
-            else:
-                index_i=self.N[:i].sum()
-            p_i=float(K)/self.N[i]
-            #print 'p_i='+str(p_i)
-            r[index_i:index_i+self.N[i],:]=np.ones(r[index_i:index_i+self.N[i],].shape)-(r[index_i:index_i+self.N[i],]+(1-p_i)).astype(int)
-
-            
-            for j in range(0,self.N.shape[0]):
-
-                if j==0:
-                    index_j=0
-                else:
-                    index_j=self.N[:j].sum()
-                
-                r[index_i:index_i+self.N[i],index_j:index_j+self.N[j]]=r[index_i:index_i+self.N[i],index_j:index_j+self.N[j]]*J_int[i,j]
-
-        return r
-                
-           
 
 
 class WithOutput(System):
     """
     WithOutput inherits the class System. It is very similar, but has some functionalities implemented to write data generated during a simulation to an output folder. Furthermore, it displays some more output on the command line when the simulation is running (progress bar).
     """
-    def __init__(self,N=np.array([400,100]),J_int=np.array([]),I=[1.,1.],gamma=[0.2,0.2],K=50,tau=0.05,N_ext=[],J_ext=np.array([]),rates=[]):
+    def __init__(self,N=np.array([400,100]),J_int=np.array([]),I=[1.,1.],gamma=[0.2,0.2],K=50,tau=0.05,N_ext=[],J_ext=np.array([]),rates=[],scheduler=None,fixed_in_degree=False,seed=None,engine='eager',backend='python',delay_step=None,spike_statistics=False,psth_bin=None,profile=False,dtype=np.float64):
         """
         Initializes a 'WithOutput'-object.
         @param N One-dimensional array or list containing the number of individual neurons for each population.
@@ -429,20 +444,43 @@ class WithOutput(System):
         @param I List containing parameters (currents, one value per population) defining properties of the leaky integrate and fire neurons.
         @param gamma List containing parameters (leak-factor?, one value per population) defining properties of the leaky integrate and fire neurons.
         @param K Average number of connections all neurons of one population receive from any other population.
-        @param tau Delay between sending and receiving an (internal) spike.
+        @param tau Delay between sending and receiving an (internal) spike: a number, an array of delays per population pair or a function drawing delays (it has to be picklable, i.e. defined at module level), see System.
+        @param scheduler Class (or factory) of the event scheduler, see System.
+        @param fixed_in_degree If True, each neuron receives a fixed number of connections, see System.
+        @param seed Seed or random number generator of this System, see System.
+        @param engine Representation of the phases, 'eager' or 'lazy', see System.
+        @param backend 'python' or 'numba', see System; WithOutput.run records every event and always uses the python loop.
+        @param delay_step If not None, synaptic delays are rounded to multiples of delay_step, see System.
+        @param spike_statistics If True, per-neuron spike statistics are accumulated (see System) and written to the output folder at the end of each run.
+        @param psth_bin If not None, the spikes of each population are counted in bins of this width (see System) and written to the output folder (psth.npy) at the end of each run.
+        @param profile If True, the runs are profiled (see System); the metrics, including the peak memory of the output buffers, are appended to metrics.jsonl in the output folder during each run.
+        @param dtype dtype of phases and weights, see System; the output buffers hold the phases in this dtype (their times in float64), so float32 doubles the rows per chunk. The phase files are float64, for float32 phases in the output use a container.ContainerStore.
         """
 
-        self.parameters={'N':np.array(N),'J_int':J_int,'I':I,'gamma':gamma,'K':K,'tau':tau,'N_ext':N_ext,'J_ext':J_ext,'rates':rates}
+        self.parameters={'N':np.array(N),'J_int':J_int,'I':I,'gamma':gamma,'K':K,'tau':tau,'N_ext':N_ext,'J_ext':J_ext,'rates':rates,'fixed_in_degree':fixed_in_degree,'delay_step':delay_step,'spike_statistics':spike_statistics,'psth_bin':psth_bin,'profile':profile,'dtype':np.dtype(dtype).name}
+        if not hasattr(seed,'standard_exponential'): # (generator objects are not stored)
+            self.parameters['seed']=seed
         
         self.n_files=0
-        System.__init__(self,N,J_int,I,gamma,K,tau,N_ext,J_ext,rates)
+        ## time of the last recorded spike event (spikes at the same time as the previous event are not recorded again)
+        self.last_spike_time=0
+        ## md5 digest of the connectivity, computed for the first checkpoint (see checkpoint)
+        self.connectivity_md5=None
+        System.__init__(self,N,J_int,I,gamma,K,tau,N_ext,J_ext,rates,scheduler,fixed_in_degree,seed,engine,backend,delay_step,spike_statistics,psth_bin,profile,dtype)
         
 
-    def run(self,t_end,output_dir):
+    def run(self,t_end,output_dir,recording=None,background_writer=True,hooks=None,checkpoint_interval=None,store=None):
         """
         Run the simulation until system time self.t exceeds t_end, creates folder output_dir and writes output to it.
+        The output is recorded by hooks (see hooks) in the event loop of System.run.
         @param t_end Ending time of the run.
         @param output_dir A string specifying the folder to which the output should be written.
+        @param recording recording.RecordingPolicy deciding which phases are written (sampling interval, neuron subset, transient); None records the phases of all neurons after every event.
+        @param background_writer If True, chunks are written by a background thread (see writer.ChunkWriter) while the simulation fills a second buffer; an error while writing is raised here.
+        @param hooks List of further hooks called in this run, see System.run.
+        @param checkpoint_interval If not None, a checkpoint (see checkpoint) is written to output_dir after the first event at or after each multiple of checkpoint_interval (simulated time), see resume; the current chunk is written first, so the chunks depend on checkpoint_interval.
+        @param store If not None, a container.ContainerStore: parameters, recorded neuron indices, phases and spikes are written compressed to one container file (output.zip) with its storage dtypes instead of separate .npy files.
+        @return True if a hook stopped the run before t_end, False otherwise.
         """
 
 
@@ -454,85 +492,258 @@ class WithOutput(System):
         if True:
 
             import pickle
-            with open(output_dir+'/parameters.pickle','wb') as f:
-                pickle.dump(self.parameters,f)
-
-            output_size=int(OUTPUT_MEMORY/(self.N.sum()+1)/8)
+            ## container.ContainerStore of the current run, None for separate files
+            self.store=store
+            if store is not None:
+                store.write(output_dir,[('parameters.pickle',pickle.dumps(self.parameters))])
+            else:
+                with open(output_dir+'/parameters.pickle','wb') as f:
+                    pickle.dump(self.parameters,f)
+
+            if recording is None:
+                recording=RecordingPolicy()
+            ## policy deciding which phases are recorded during the current run
+            self.recording=recording
+            if recording.indices is not None:
+                if store is not None:
+                    store.write_array(output_dir,PHASE_INDICES_FILE,recording.indices)
+                else:
+                    np.save(output_dir+'/'+PHASE_INDICES_FILE,recording.indices)
+            n_columns=recording.n_columns(self.N.sum())
 
-            #print output_size
+            if self.profiler is not None:
+                self.profiler.metrics_file=os.path.join(output_dir,METRICS_FILE)
 
-            self.outputs=np.zeros((output_size,self.N.sum()+1))
+            ## manifest of the chunks written to output_dir, rewritten after each chunk (a continued run appends to the existing one)
+            self.manifest=(read_manifest(output_dir) if self.n_files>0 else None) or Manifest()
+            # (chunks written after the checkpoint a run is resumed from are written again)
+            self.manifest.chunks=[chunk for chunk in self.manifest.chunks if chunk['chunk']<self.n_files]
 
-            spikes=lil_matrix((output_size,self.N.sum()+1))
+            n_buffers=2 if background_writer else 1
+            self.output_size=int(OUTPUT_MEMORY/n_buffers/(n_columns*self.dtype.itemsize+8))
 
-            i=0
-            i_spike=0
-            i_progess=0
-            n_progress=100
+            #print output_size
 
-            last_t=0
+            ## buffers (times,phases) of the recorded rows, used alternately; the one not in use may still be written by self.writer
+            self.buffers=[(np.zeros(self.output_size),np.zeros((self.output_size,n_columns),dtype=self.dtype)) for i in range(n_buffers)]
+            ## times (float64) and phases (self.dtype) of the rows of the current chunk
+            self.output_times,self.outputs=self.buffers[0]
+            ## writes the chunks (in a background thread, if background_writer is True)
+            self.writer=ChunkWriter(background_writer)
+            ## number of rows of self.outputs filled in the current chunk
+            self.i_output=0
+
+            ## spikes of the current chunk in event-list format (see spike_events): one array of spike times and one of spiking neurons per spike event
+            self.spike_times=[]
+            self.spike_ids=[]
+            ## dtype of the neuron indices in the spike files
+            self.id_dtype=spike_events.id_dtype(self.N.sum())
+            ## number of spike events after which a chunk is written
+            self.max_spike_events=min(self.output_size,SPIKE_CHUNK_EVENTS)
+            ## number of events of this run, see show_progress
+            self.i_progress=0
+
+            output_hooks=[]
+            if recording.samples():
+                output_hooks.append(FunctionHook(on_interval=lambda system,t: self.record_phases(output_dir,t,self.recorded_phases()+(t-self.t)),interval=recording.interval,t_start=recording.t_start))
+            if recording.spikes:
+                output_hooks.append(FunctionHook(on_spike=lambda system,t,indices: self.record_spikes(output_dir,t,indices)))
+            if recording.phases and not recording.samples():
+                output_hooks.append(FunctionHook(on_event=lambda system: self.record_event(output_dir)))
+            output_hooks.append(FunctionHook(on_event=lambda system: self.show_progress(t_end)))
+            checkpoint_hooks=[]
+            if checkpoint_interval is not None:
+                if not hasattr(self.scheduler,'get_state'):
+                    raise ValueError('checkpoints need a scheduler with get_state and set_state, like scheduler.HeapScheduler')
+                ## time from which the next checkpoint is written
+                self.next_checkpoint=(np.floor(self.t/checkpoint_interval)+1)*checkpoint_interval
+                # (after all other hooks, so the checkpoint includes their results of the event)
+                checkpoint_hooks.append(FunctionHook(on_event=lambda system: self.record_checkpoint(output_dir,t_end,checkpoint_interval)))
             
             progress=0
             sys.stdout.write('[%-20s] %d%% of t_end' % ('='*(progress/5), progress))
 
-            while self.t<t_end:
-
-                self.jump_to_next_event()
-
-                if len(self.events):
-                    if self.events[-1][0]>last_t:
-                        spikes[i_spike,0]=self.events[-1][0]-self.tau
-                        spikes[i_spike,1:]=self.events[-1][1]
-                        last_t=self.events[-1][0]
-                        #print str(self.t)+':  '+str(i_spike)
-                        i_spike+=1
-
-                self.outputs[i,1:]=self.phases
-                self.outputs[i,0]=self.t
-                i+=1
-                if i==output_size:
-                    np.save(output_dir+'/phases'+str(self.n_files)+'.npy',self.outputs)
-                    del self.outputs
-
-                    out_spikes=spikes[:i_spike,:].todense()
-                    del spikes
-                    np.save(output_dir+'/spikes'+str(self.n_files)+'.npy',out_spikes)
-                    del out_spikes
-                    spikes=lil_matrix((output_size,self.N.sum()+1))
-
-                    self.outputs=np.zeros((output_size,self.N.sum()+1))
-                    self.n_files+=1
-                    i=0
-                    i_spike=0
-                    
-                if i_progess%n_progress==0:
-                    progress=int(self.t/t_end*100)
-                    sys.stdout.write('\r')
-                    sys.stdout.write('[%-20s] %d%% of t_end' % ('='*(progress/5), progress))
-                    sys.stdout.flush()
-
-                    
-
-            np.save(output_dir+'/phases'+str(self.n_files)+'.npy',self.outputs[:i])
-            del self.outputs
-
-            out_spikes=spikes[:i_spike,:].todense()
-            del spikes
-            np.save(output_dir+'/spikes'+str(self.n_files)+'.npy',out_spikes)
-            del out_spikes
-                    
-
-            self.n_files+=1
+            try:
+                stopped=System.run(self,t_end,output_hooks+list(hooks or [])+checkpoint_hooks)
+
+                self.save_chunk(output_dir)
+                self.writer.close()
+                if self.spike_statistics is not None:
+                    self.spike_statistics.save(output_dir)
+                if self.psth is not None:
+                    self.psth.save(output_dir,self.t)
+            except:
+                # stop the writer thread, but report the original error
+                self.writer.close(raise_errors=False)
+                raise
+            finally:
+                del self.output_times,self.outputs,self.buffers
+            return stopped
                 
         else:
             print "ERROR: something wrong with given directory"
-            
+
+
+    @classmethod
+    def resume(cls,output_dir,t_end=None,background_writer=True,hooks=None):
+        """
+        Resumes an interrupted run from the checkpoint in output_dir (see run and checkpoint): the WithOutput is created from output_dir/parameters.pickle, the connectivity referenced by the checkpoint and the state of the checkpoint, and the run continues with the same recording policy, checkpoint interval and store.
+        The output (chunks, manifest, spike statistics, PSTH) is identical to that of the uninterrupted run.
+        @param output_dir Output folder of the interrupted run.
+        @param t_end Ending time of the run; None continues until the ending time of the interrupted run.
+        @param background_writer,hooks See run.
+        @return The WithOutput, at the end of the resumed run.
+        """
+        import pickle
+        checkpoint=read_checkpoint(output_dir)
+        if checkpoint is None:
+            raise ValueError('%s has no checkpoint' % output_dir)
+        with open_file(output_dir,'parameters.pickle') as f:
+            parameters=pickle.load(f)
+        state=checkpoint['system']
+        kwargs=dict((key,value) for key,value in parameters.items() if key!='seed')
+        system=cls(scheduler=state['scheduler'],seed=rng_from_state(state['rng']),engine=state['engine'],backend=state['backend'],**kwargs)
+        system.parameters=parameters
+        load_connectivity(output_dir,system,checkpoint['connectivity'])
+        system.connectivity_md5=checkpoint['connectivity']['md5']
+        restore_system_state(system,state)
+        system.n_files=checkpoint['n_files']
+        system.last_spike_time=checkpoint['last_spike_time']
+        system.run(checkpoint['t_end'] if t_end is None else t_end,output_dir,checkpoint['recording'],background_writer,hooks,checkpoint['checkpoint_interval'],checkpoint['store'])
+        return system
+
+
+    def record_checkpoint(self,output_dir,t_end,checkpoint_interval):
+        """
+        Writes a checkpoint if self.next_checkpoint is reached (and the run continues).
+        """
+        if self.next_checkpoint<=self.t<t_end:
+            self.checkpoint(output_dir,t_end,checkpoint_interval)
+            self.next_checkpoint=(np.floor(self.t/checkpoint_interval)+1)*checkpoint_interval
+
+
+    def checkpoint(self,output_dir,t_end,checkpoint_interval=None):
+        """
+        Writes the current chunk and then a checkpoint of the run to output_dir (see checkpoint); the connectivity is written once and referenced.
+        @param t_end,checkpoint_interval Parameters of the current run, used by resume.
+        """
+        self.save_chunk(output_dir)
+        # the checkpoint refers only to completely written chunks
+        self.writer.wait()
+        if self.connectivity_md5 is None:
+            self.connectivity_md5=connectivity_digest(self)
+        write_checkpoint(output_dir,{'system':system_state(self),'connectivity':save_connectivity(output_dir,self,self.connectivity_md5),
+                                     'n_files':self.n_files,'last_spike_time':self.last_spike_time,
+                                     'recording':self.recording,'t_end':t_end,'checkpoint_interval':checkpoint_interval,'store':self.store})
+
+
+    def record_spikes(self,output_dir,t,indices):
+        """
+        Appends the spikes at time t (of the neurons in indices) to the current chunk; writes the chunk after self.max_spike_events spike events.
+        """
+        if t>self.last_spike_time:
+            self.spike_times.append(np.ones(len(indices))*t)
+            self.spike_ids.append(indices.astype(self.id_dtype))
+            self.last_spike_time=t
+            if len(self.spike_times)==self.max_spike_events:
+                self.save_chunk(output_dir)
+
+
+    def record_event(self,output_dir):
+        """
+        Records the phases after an event, if self.recording records it.
+        """
+        if self.recording.records_event(self.t):
+            self.record_phases(output_dir,self.t,self.recorded_phases())
+
+
+    def show_progress(self,t_end,n_progress=100):
+        """
+        Redraws the progress bar every n_progress events.
+        """
+        self.i_progress+=1
+        if self.i_progress%n_progress==0:
+            progress=int(self.t/t_end*100)
+            sys.stdout.write('\r')
+            sys.stdout.write('[%-20s] %d%% of t_end' % ('='*(progress/5), progress))
+            sys.stdout.flush()
+
+
+    def recorded_phases(self):
+        """
+        @return Array of the current phases of the neurons recorded by self.recording.
+        """
+        if self.recording.indices is None:
+            return self.phases
+        return self.engine.get(self.recording.indices)
+
+
+    def record_phases(self,output_dir,t,phases):
+        """
+        Appends the row [t,phases] to self.output_times and self.outputs; writes the chunk if they are full.
+        """
+        self.outputs[self.i_output]=phases
+        self.output_times[self.i_output]=t
+        self.i_output+=1
+        if self.i_output==self.output_size:
+            self.save_chunk(output_dir)
+
+
+    def save_chunk(self,output_dir):
+        """
+        Hands the recorded phases and spikes of the current chunk n=self.n_files to self.writer and starts the next chunk in the other buffer.
+        """
+        if self.profiler is not None:
+            self.profiler.observe_buffers(sum(times.nbytes+phases.nbytes for times,phases in self.buffers)+sum(times.nbytes+ids.nbytes for times,ids in zip(self.spike_times,self.spike_ids)))
+        self.writer.submit(self.write_chunk,output_dir,self.n_files,self.output_times[:self.i_output],self.outputs[:self.i_output],self.spike_times,self.spike_ids)
+        # submit returns once the previous chunk is written, so the other buffer is free again
+        self.buffers.append(self.buffers.pop(0))
+        self.output_times,self.outputs=self.buffers[0]
+
+        self.spike_times=[]
+        self.spike_ids=[]
+        self.i_output=0
+        self.n_files+=1
+
+
+    def write_chunk(self,output_dir,n,times,phases,spike_times,spike_ids):
+        """
+        Writes chunk n: the recorded rows [t,phases] (phases<n>.npy, float64) and the spikes in event-list format (see spike_events); then adds the chunk to the manifest of output_dir (see manifest).
+        With a store, the chunk is appended to the container instead (see container).
+        @param times Array of the times of the recorded rows.
+        @param phases Array of the recorded phases (one row per time).
+        @param spike_times List of arrays of spike times.
+        @param spike_ids List of arrays of spiking neurons (same lengths as the arrays in spike_times).
+        """
+        id_dtype=spike_events.id_dtype(self.N.sum())
+        spike_times=np.concatenate(spike_times) if spike_times else np.zeros(0)
+        spike_ids=np.concatenate(spike_ids) if spike_ids else np.zeros(0,dtype=id_dtype)
+        if self.store is not None:
+            self.store.write_chunk(output_dir,n,times,phases,spike_times,spike_ids)
+            return
+        save_rows(output_dir+'/phases'+str(n)+'.npy',times,phases)
+        spike_events.save_chunk(output_dir,n,spike_times,spike_ids)
+
+        self.manifest.add_chunk(n,'phases'+str(n)+'.npy',times,phases.shape[1]+1,spike_events.SPIKE_TIMES+str(n)+'.npy',spike_events.SPIKE_IDS+str(n)+'.npy',spike_times,spike_ids)
+        self.manifest.write(output_dir)
+
+
     """
     def get_hist(self,i,n_bins=10):
         return self.outputs[i][0],np.histogram(self.outputs[i][1],n_bins)
     """
 
 
+def save_rows(filename,times,phases,block_rows=4096):
+    """
+    Writes the rows [times[i],phases[i]] to the .npy file filename as a float64 array, converting block_rows rows at a time (so the rows are never held in memory as a whole).
+    """
+    with open(filename,'wb') as f:
+        np.lib.format.write_array_header_1_0(f,{'descr':np.lib.format.dtype_to_descr(np.dtype(float)),'fortran_order':False,'shape':(len(times),phases.shape[1]+1)})
+        for start in range(0,len(times),block_rows):
+            f.write(np.column_stack([times[start:start+block_rows],phases[start:start+block_rows]]).astype(float,copy=False).tobytes())
+
+
 def check_dir(d):
     import os
     try:
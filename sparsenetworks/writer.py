@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+
+"""
+@package writer
+
+The class ChunkWriter writes output chunks of system.WithOutput in a background thread, so the simulation does not wait for the storage.
+
+At most one chunk is being written at any time: submitting the next chunk first waits until the previous one is written. With two output buffers used alternately (double buffering), the simulation fills one buffer while the other one is written, and memory stays bounded by the two buffers.
+An exception raised while writing is re-raised in the simulating thread by the next call of submit or close.
+"""
+
+import threading
+
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
+
+
+class ChunkWriter(object):
+    """
+    Executes write jobs (functions with their arguments) one after the other, in a background thread or, if background is False, right away.
+    """
+
+    def __init__(self,background=True):
+        """
+        @param background If True, jobs are executed in a background thread; otherwise submit executes them directly.
+        """
+        self.background=background
+        ## exception raised by the last failed job, re-raised by submit and close
+        self.error=None
+        if background:
+            self.jobs=queue.Queue(maxsize=1)
+            self.thread=threading.Thread(target=self._work)
+            self.thread.daemon=True
+            self.thread.start()
+
+
+    def _work(self):
+        while True:
+            job=self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            if self.error is None: # (after an error, the remaining jobs are dropped)
+                function,args=job
+                try:
+                    function(*args)
+                except Exception as error:
+                    self.error=error
+            self.jobs.task_done()
+
+
+    def wait(self):
+        """
+        Waits until all submitted jobs are done; re-raises the exception of a failed job.
+        """
+        if self.background:
+            self.jobs.join()
+        if self.error is not None:
+            error,self.error=self.error,None
+            raise error
+
+
+    def submit(self,function,*args):
+        """
+        Waits until the previous job is done and submits function(*args).
+        The arguments must not be changed until the next call of submit or close returns.
+        """
+        self.wait()
+        if self.background:
+            self.jobs.put((function,args))
+        else:
+            function(*args)
+
+
+    def close(self,raise_errors=True):
+        """
+        Waits until all submitted jobs are done and stops the background thread.
+        @param raise_errors If True, the exception of a failed job is re-raised.
+        """
+        if self.background and self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join()
+        if raise_errors:
+            self.wait()